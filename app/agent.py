@@ -1,21 +1,29 @@
 # app/agent.py
 import os
+import time
+import functools
 import operator
 from typing import Annotated, Sequence, TypedDict
 
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langchain_core.messages import AIMessageChunk, BaseMessage, SystemMessage, message_chunk_to_message
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
 
+from app.endpoints import DEEPSEEK_BASE_URL, NVIDIA_BASE_URL, SILICONFLOW_BASE_URL, VOLC_BASE_URL, ZHIPU_BASE_URL
+from app.metrics import GRAPH_NODE_SECONDS
+from app.profiling import span
+from app.protocol import AGENT_TOKEN_EVENT
+from app.router import astream_with_failover
+from app.state import get_checkpointer
 from app.tools import tools
 
-
 # --- 🏭 Model Factory (核心工厂) ---
+@functools.lru_cache(maxsize=None)
 def get_llm(model_label: str):
-    """根据前端传来的标签，返回对应的 LLM 实例"""
+    """根据前端传来的标签，返回对应的 LLM 实例（按标签缓存，复用底层 HTTP 连接池）"""
 
     print(f"🏭 初始化模型: {model_label}")
 
@@ -24,7 +32,7 @@ def get_llm(model_label: str):
         return ChatOpenAI(
             model="deepseek-chat",
             api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com",
+            base_url=DEEPSEEK_BASE_URL,
             temperature=0.7,
             streaming=True,
         )
@@ -34,7 +42,7 @@ def get_llm(model_label: str):
         return ChatOpenAI(
             model="meta/llama-3.1-70b-instruct",
             api_key=os.getenv("NVIDIA_API_KEY"),
-            base_url="https://integrate.api.nvidia.com/v1",
+            base_url=NVIDIA_BASE_URL,
             temperature=0.6,
             streaming=True,
         )
@@ -49,7 +57,7 @@ def get_llm(model_label: str):
         return ChatOpenAI(
             model=endpoint_id,
             api_key=os.getenv("VOLC_API_KEY"),
-            base_url="https://ark.cn-beijing.volces.com/api/v3",
+            base_url=VOLC_BASE_URL,
             temperature=0.7,
             streaming=True,
         )
@@ -59,7 +67,7 @@ def get_llm(model_label: str):
         return ChatOpenAI(
             model="glm-4-plus",
             api_key=os.getenv("ZHIPU_API_KEY"),
-            base_url="https://open.bigmodel.cn/api/paas/v4/",
+            base_url=ZHIPU_BASE_URL,
             temperature=0.7,
             streaming=True,
         )
@@ -69,7 +77,7 @@ def get_llm(model_label: str):
         return ChatOpenAI(
             model="Qwen/Qwen2-VL-72B-Instruct",
             api_key=os.getenv("SILICONFLOW_API_KEY"),
-            base_url="https://api.siliconflow.cn/v1",
+            base_url=SILICONFLOW_BASE_URL,
             temperature=0.7,
             streaming=True,
         )
@@ -78,7 +86,7 @@ def get_llm(model_label: str):
         return ChatOpenAI(
             model="glm-4v-plus",
             api_key=os.getenv("ZHIPU_API_KEY"),
-            base_url="https://open.bigmodel.cn/api/paas/v4/",
+            base_url=ZHIPU_BASE_URL,
             temperature=0.7,
             streaming=True,
         )
@@ -87,7 +95,7 @@ def get_llm(model_label: str):
         return ChatOpenAI(
             model="Qwen/Qwen2.5-72B-Instruct",
             api_key=os.getenv("SILICONFLOW_API_KEY"),
-            base_url="https://api.siliconflow.cn/v1",
+            base_url=SILICONFLOW_BASE_URL,
             temperature=0.7,
             streaming=True,
         )
@@ -103,7 +111,7 @@ class AgentState(TypedDict):
 
 
 # --- Nodes (节点逻辑) ---
-def call_model(state: AgentState, config: RunnableConfig):
+async def call_model(state: AgentState, config: RunnableConfig):
     messages = state["messages"]
 
     configurable = config.get("configurable", {})
@@ -115,11 +123,16 @@ def call_model(state: AgentState, config: RunnableConfig):
     sys_msg = SystemMessage(content=system_prompt_text + identity_prompt)
 
     prompt_messages = [sys_msg] + messages
-    llm = get_llm(selected_chat_model)
-    llm_with_tools = llm.bind_tools(tools)
-    response = llm_with_tools.invoke(prompt_messages)
+    # 路由层负责限流、熔断、故障转移与对冲，这里只消费胜出一路的输出
+    # 大脑输出的 token 以自定义事件推送：对冲请求中落败一路的 token 不会被发出，
+    # 工具内部的视觉模型调用也不会混入
+    response = AIMessageChunk(content="")
+    async for chunk in astream_with_failover(prompt_messages, selected_chat_model, tools, config, get_llm):
+        if chunk.content:
+            await adispatch_custom_event(AGENT_TOKEN_EVENT, {"text": chunk.content}, config=config)
+        response += chunk
 
-    return {"messages": [response]}
+    return {"messages": [message_chunk_to_message(response)]}
 
 
 def should_continue(state: AgentState):
@@ -130,11 +143,26 @@ def should_continue(state: AgentState):
     return END
 
 
+def timed_node(name: str, node):
+    """包装图节点，记录每次执行耗时；node 可以是异步函数或 Runnable"""
+    run = node.ainvoke if hasattr(node, "ainvoke") else node
+
+    async def wrapper(state: AgentState, config: RunnableConfig):
+        start = time.perf_counter()
+        try:
+            with span(f"node:{name}"):
+                return await run(state, config)
+        finally:
+            GRAPH_NODE_SECONDS.observe(name, value=time.perf_counter() - start)
+
+    return wrapper
+
+
 # --- Graph 构建 ---
 workflow = StateGraph(AgentState)
 
-workflow.add_node("agent", call_model)
-workflow.add_node("tools", ToolNode(tools))
+workflow.add_node("agent", timed_node("agent", call_model))
+workflow.add_node("tools", timed_node("tools", ToolNode(tools)))
 
 workflow.set_entry_point("agent")
 workflow.add_conditional_edges(
@@ -144,6 +172,6 @@ workflow.add_conditional_edges(
 )
 workflow.add_edge("tools", "agent")
 
-# 🧠 植入海马体 (MemorySaver)
-memory = MemorySaver()
+# 🧠 植入海马体：检查点后端由 STATE_BACKEND 决定（多 worker 时共享 SQLite）
+memory = get_checkpointer()
 app_graph = workflow.compile(checkpointer=memory)
@@ -0,0 +1,219 @@
+# app/batch.py
+"""
+批量离线生成：一次提交几十上百个画图 / 视频任务（提示词列表，或带变量的提示词模板），
+在后台按供应商的并发与速率额度并发执行，不再由视觉工坊逐个调用、逐个等待。
+
+- 展开：模板中的 {变量} 按 variables 的取值做笛卡尔积；展开后完全相同的提示词（忽略首尾与连续空白）只生成一次，
+  需要同一提示词的多个版本时用 variants
+- 调度：所有批量任务共享一个线程池；每次提交都从 limits 中火山引擎的准入器领取速率令牌，
+  画图还要占用它的并发名额（VOLCENGINE_MAX_CONCURRENCY），与对话等交互流量合计不超出供应商额度
+- 重试：生成工具标记为可重试的失败（429、5xx 与网络异常）按指数退避重试，至多 BATCH_MAX_RETRIES 次；内容审核等其他失败不重试
+- 结果：生成的媒体登记本地镜像（MIRROR_DIR），清单（每条的状态、尝试次数、耗时与本地地址）保存在 progress_store，
+  键为 batch:{id}，STATE_BACKEND=sqlite 时各 worker 都能查询与订阅进度
+"""
+import contextlib
+import contextvars
+import itertools
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app import mirror
+from app.cancellation import Cancelled, CancelToken
+from app.context import current_cancel_token
+from app.limits import limiters
+from app.metrics import BATCH_ITEMS
+from app.profiling import span
+from app.state import progress_store
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_MAX_VARIANTS = 8
+# 线程数只是批量任务能占用的名额上限，实际并发还受共享的供应商并发名额约束
+BATCH_IMAGE_CONCURRENCY = int(os.getenv("BATCH_IMAGE_CONCURRENCY", str(limiters["volcengine"].concurrency)))
+# 视频任务提交后要轮询数分钟，生成在供应商侧排队，不占用准入名额；默认与分镜的视频并发一致
+BATCH_VIDEO_CONCURRENCY = int(os.getenv("BATCH_VIDEO_CONCURRENCY", "3"))
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "4"))
+BACKOFF_CAP = 30.0
+BATCH_POLL_INTERVAL = 0.5  # 进度订阅读取清单的间隔 (秒)
+
+_pools = {
+    "image": ThreadPoolExecutor(max_workers=BATCH_IMAGE_CONCURRENCY, thread_name_prefix="batch-image"),
+    "video": ThreadPoolExecutor(max_workers=BATCH_VIDEO_CONCURRENCY, thread_name_prefix="batch-video"),
+}
+_limiter = limiters["volcengine"]
+_jobs: dict[str, "BatchJob"] = {}
+_jobs_lock = threading.Lock()
+
+
+class BatchError(Exception):
+    """批量请求参数不合法"""
+
+
+def manifest_key(job_id: str) -> str:
+    return f"batch:{job_id}"
+
+
+def _cancel_key(job_id: str) -> str:
+    return f"batch-cancel:{job_id}"
+
+
+def _normalize(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def expand(prompts: list[str], template: str, variables: dict[str, list[str]]) -> tuple[list[str], int]:
+    """展开模板并去重，返回 (按首次出现顺序的提示词, 去掉的重复数)"""
+    expanded = list(prompts)
+    if template:
+        names = list(variables)
+        for values in itertools.product(*(variables[name] for name in names)):
+            try:
+                expanded.append(template.format(**dict(zip(names, values))))
+            except (KeyError, IndexError) as e:
+                raise BatchError(f"模板变量 {e} 没有提供取值") from None
+    normalized = [p for p in (_normalize(p) for p in expanded) if p]
+    unique = list(dict.fromkeys(normalized))
+    return unique, len(normalized) - len(unique)
+
+
+class BatchJob:
+    """一个批量任务；清单中的条目按下标与 items 一一对应"""
+
+    def __init__(self, kind: str, prompts: list[str], variants: int, duplicates: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.token = CancelToken()
+        self.items = [
+            {"index": i, "prompt": prompt, "variant": variant, "status": "pending",
+             "attempts": 0, "media": None, "error": None, "seconds": None}
+            for i, (prompt, variant) in enumerate(itertools.product(prompts, range(variants)))
+        ]
+        self.manifest = {
+            "id": self.id, "kind": kind, "status": "running", "created": time.time(), "finished": None,
+            "total": len(self.items), "succeeded": 0, "failed": 0, "cancelled": 0, "duplicates": duplicates,
+            "items": self.items,
+        }
+        self._lock = threading.Lock()
+        self._remaining = len(self.items)
+
+    def _save(self):
+        # 调用方持有 self._lock；整份清单一起写入（条目复制一份，内存后端不共享可变对象），读取方看到的计数与条目状态总是一致的
+        progress_store.set(manifest_key(self.id), {**self.manifest, "items": [dict(item) for item in self.items]})
+
+    def _update(self, item: dict, **fields):
+        with self._lock:
+            item.update(fields)
+            if fields.get("status") in ("succeeded", "failed", "cancelled"):
+                self.manifest[fields["status"]] += 1
+                self._remaining -= 1
+                if not self._remaining:
+                    self.manifest["status"] = "cancelled" if self.token.cancelled else "completed"
+                    self.manifest["finished"] = time.time()
+            self._save()
+        if not self._remaining:
+            with _jobs_lock:
+                _jobs.pop(self.id, None)
+
+    def _stopped(self) -> bool:
+        # 取消请求可能来自其他 worker：只写了取消标记，本进程在开始下一条前看到
+        if not self.token.cancelled and progress_store.get(_cancel_key(self.id)):
+            self.token.cancel()
+        return self.token.cancelled
+
+    def start(self):
+        with self._lock:
+            self._save()
+        with _jobs_lock:
+            _jobs[self.id] = self
+        for item in self.items:
+            # 每条复制一份上下文，剖析 span 归属到提交请求；取消令牌在 _run 中换成任务自己的
+            _pools[self.kind].submit(contextvars.copy_context().run, self._run, item)
+
+    def cancel(self):
+        self.token.cancel()
+
+    def _admit(self):
+        # 画图请求即时返回，按供应商并发名额准入；视频只领取速率令牌
+        if self.kind == "image":
+            return _limiter.hold(self.token.check)
+        return contextlib.nullcontext()
+
+    def _run(self, item: dict):
+        from app.tools import generate_image, generate_video, invoke_media_tool
+
+        media_tool = generate_image if self.kind == "image" else generate_video
+        reset = current_cancel_token.set(self.token)
+        started = time.perf_counter()
+        try:
+            if self._stopped():
+                self._update(item, status="cancelled")
+                BATCH_ITEMS.inc(self.kind, "cancelled")
+                return
+            self._update(item, status="running")
+            result, media = "", []
+            for attempt in range(BATCH_MAX_RETRIES + 1):
+                with self._admit():
+                    _limiter.bucket.acquire_sync()
+                    with span(f"batch:{self.kind}"):
+                        result, media, retryable = invoke_media_tool(media_tool, item["prompt"], detached=True)
+                item["attempts"] = attempt + 1
+                if media or self.token.cancelled or not retryable or attempt == BATCH_MAX_RETRIES:
+                    break
+                wait_time = min(BACKOFF_CAP, 2**attempt + random.random())
+                print(f"⚠️ 批量任务 {self.id} 第 {item['index']} 条触发限流或上游错误，等待 {wait_time:.1f}s 后重试...")
+                self.token.sleep(wait_time)
+        except Cancelled as e:
+            # 退避等待中被取消
+            result, media = f"❌ 已取消 ({e.reason})", []
+        except Exception as e:
+            result, media = str(e), []
+        finally:
+            current_cancel_token.reset(reset)
+        seconds = round(time.perf_counter() - started, 3)
+        if media:
+            self._update(item, status="succeeded", media=mirror.localize(media[0]), seconds=seconds)
+            BATCH_ITEMS.inc(self.kind, "succeeded")
+        elif self.token.cancelled:
+            self._update(item, status="cancelled", error=result, seconds=seconds)
+            BATCH_ITEMS.inc(self.kind, "cancelled")
+        else:
+            self._update(item, status="failed", error=result, seconds=seconds)
+            BATCH_ITEMS.inc(self.kind, "failed")
+
+
+def submit(kind: str, prompts: list[str], template: str = "", variables: dict | None = None, variants: int = 1) -> dict:
+    """校验并登记批量任务，立即返回清单；条目在后台线程池中执行"""
+    if kind not in _pools:
+        raise BatchError(f"未知的生成类型: {kind}，可选 image / video")
+    if not 1 <= variants <= BATCH_MAX_VARIANTS:
+        raise BatchError(f"variants 需在 1 到 {BATCH_MAX_VARIANTS} 之间")
+    unique, duplicates = expand(prompts, template, variables or {})
+    if not unique:
+        raise BatchError("没有可生成的提示词")
+    if len(unique) * variants > BATCH_MAX_ITEMS:
+        raise BatchError(f"展开后共 {len(unique) * variants} 条，超过单次上限 {BATCH_MAX_ITEMS}")
+    job = BatchJob(kind, unique, variants, duplicates)
+    job.start()
+    print(f"📦 批量{'画图' if kind == 'image' else '视频'}任务 {job.id} 已提交：{job.manifest['total']} 条（去重 {duplicates} 条）")
+    return get_manifest(job.id)
+
+
+def get_manifest(job_id: str) -> dict | None:
+    return progress_store.get(manifest_key(job_id))
+
+
+def cancel(job_id: str) -> bool:
+    """撤销尚未开始的条目并中止进行中的条目；任务不存在或已结束时返回 False"""
+    manifest = get_manifest(job_id)
+    if manifest is None or manifest["status"] != "running":
+        return False
+    progress_store.set(_cancel_key(job_id), {"requested": time.time()})
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        job.cancel()
+    return True
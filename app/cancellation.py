@@ -0,0 +1,144 @@
+# app/cancellation.py
+"""
+请求级取消与截止时间：
+- chat_stream 为每个请求创建 CancelToken，经 ContextVar 传入对话图、工具线程与视觉预判线程
+- 客户端断开（关闭页面 / 清空对话）时取消 token；轮询、抽帧等循环在检查点上立即退出，
+  阻塞的 HTTP / 模型调用按剩余时间裁剪超时
+- 每个工具在 instrumented 中套一层 tool_scope，获得自己的超时；取消与超时计入 mediacraft_cancelled_work_total
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from app.context import current_cancel_token
+
+# 单个对话请求的总截止时间 (秒)，覆盖视频生成的最长等待
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "600"))
+
+# 各工具的执行超时 (秒)
+TOOL_TIMEOUTS = {
+    "web_search": 30,
+    "search_knowledge_base": 30,
+    "search_trending": 15,  # 只查本地索引
+    "read_reference": 10,
+    "generate_image": 120,
+    "generate_video": 420,
+    "create_storyboard": 540,  # 规划 + 并发画图 + 可选的逐镜头视频
+    "analyze_uploaded_image": 90,
+    "analyze_uploaded_video": 300,  # 长视频分段解析 + 合并
+}
+DEFAULT_TOOL_TIMEOUT = 60
+# 等待其他线程的结果时检查取消的间隔 (秒)
+WAIT_POLL_INTERVAL = 1.0
+
+
+class Cancelled(BaseException):
+    """
+    请求已取消或超出截止时间。
+    与 asyncio.CancelledError 一样继承 BaseException，工具内部的 except Exception 不会把它吞掉。
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """可跨线程共享的取消令牌；子令牌继承父令牌的取消状态，并可以有更早的截止时间"""
+
+    def __init__(self, deadline: float | None = None, parent: "CancelToken | None" = None):
+        self.deadline = deadline  # time.monotonic() 时间点，None 表示不限
+        self._parent = parent
+        self._event = parent._event if parent else threading.Event()
+        self._reason = None
+
+    @classmethod
+    def with_timeout(cls, seconds: float) -> "CancelToken":
+        return cls(time.monotonic() + seconds)
+
+    def child(self, timeout: float) -> "CancelToken":
+        deadline = time.monotonic() + timeout
+        if self.deadline is not None:
+            deadline = min(deadline, self.deadline)
+        return CancelToken(deadline, parent=self)
+
+    def cancel(self, reason: str = "cancelled"):
+        if self._parent:
+            raise RuntimeError("只能取消根令牌")
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    @property
+    def reason(self) -> str | None:
+        """未取消时为 None；否则为 disconnected 等取消原因，或 deadline（请求超时）/ timeout（工具超时）"""
+        if self._parent:
+            reason = self._parent.reason
+            if reason:
+                return reason
+        elif self._event.is_set():
+            return self._reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "timeout" if self._parent else "deadline"
+        return None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def check(self):
+        reason = self.reason
+        if reason:
+            raise Cancelled(reason)
+
+    def remaining(self) -> float | None:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout(self, limit: float) -> float:
+        """阻塞调用的超时：不超过 limit，也不超过剩余时间；已取消时直接抛出 Cancelled"""
+        self.check()
+        remaining = self.remaining()
+        return limit if remaining is None else min(limit, remaining)
+
+    def sleep(self, seconds: float):
+        """可被取消打断的 sleep"""
+        remaining = self.remaining()
+        self._event.wait(seconds if remaining is None else min(seconds, remaining))
+        self.check()
+
+    def result(self, future: Future):
+        """
+        等待其他线程的结果，期间每 WAIT_POLL_INTERVAL 秒检查一次取消与截止时间：
+        客户端断开时不会一直阻塞到截止时间，到期时抛出 Cancelled 而不是 TimeoutError。
+        """
+        while True:
+            self.check()
+            remaining = self.remaining()
+            try:
+                return future.result(timeout=WAIT_POLL_INTERVAL if remaining is None else min(WAIT_POLL_INTERVAL, remaining))
+            except TimeoutError:
+                continue
+
+
+# 请求之外（入库后台任务、视觉工坊直连接口等）使用的永不取消令牌
+NEVER = CancelToken()
+
+
+def current() -> CancelToken:
+    return current_cancel_token.get() or NEVER
+
+
+@contextmanager
+def tool_scope(name: str):
+    """在当前请求令牌下为工具派生带独立超时的子令牌"""
+    limit = TOOL_TIMEOUTS.get(name, DEFAULT_TOOL_TIMEOUT)
+    token = current().child(limit)
+    reset = current_cancel_token.set(token)
+    try:
+        yield token
+    finally:
+        current_cancel_token.reset(reset)
@@ -4,8 +4,12 @@ from contextvars import ContextVar
 # 定义全局上下文变量
 # default={} 防止在非请求环境下导入报错
 current_model_config = ContextVar("model_config", default={})
-# 👈 新增：用于在不同层级间传递前端上传的图片与视觉模型选择
-current_image_data = ContextVar("image_data", default=None)
-# 👈 新增：用于在后台隐式传递视频 Base64 数据
-current_video_data = ContextVar("video_data", default=None)
+# 用于在不同层级间传递前端上传的图片与视觉模型选择
+# 图片 / 视频本体存放在 app.state.media_store，这里只传递内容引用 (sha256)
+current_image_ref = ContextVar("image_ref", default=None)
+current_video_ref = ContextVar("video_ref", default=None)
 current_vision_model = ContextVar("vision_model", default="Qwen2-VL")
+# 请求级取消令牌 (app.cancellation.CancelToken)，工具与视觉预判线程据此提前退出
+current_cancel_token = ContextVar("cancel_token", default=None)
+# 本轮附带媒体时登记的预判解析 (set)，本轮第一次对应的视觉工具调用领取后移除；集合在请求内各任务 / 线程间共享
+current_speculation = ContextVar("speculation", default=None)
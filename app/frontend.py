@@ -1,19 +1,78 @@
 # app/frontend.py
 import html
 import os
-import re
+import sys
 import uuid
 import urllib.parse
 import requests
 import streamlit as st
 import urllib3
 
+# streamlit run app/frontend.py 只会把 app/ 加入 sys.path，这里补上项目根目录以复用 app 包内的协议解析
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.imageprep import shrink_for_upload
+from app.sse_client import iter_events
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # --- 环境配置 ---
 BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
 API_URL = f"{BACKEND_URL}/chat/stream"
 UPLOAD_URL = f"{BACKEND_URL}/upload"
+HISTORY_URL = f"{BACKEND_URL}/history"
+# 对话页只渲染最近的若干条记录，更早的按需向后端分页加载，会话再长每次重绘的耗时也不变
+HISTORY_WINDOW = 10
+# 浏览器访问后端镜像媒体的地址，后端经反向代理对外暴露时单独配置
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", BACKEND_URL)
+
+
+def media_src(media: dict | str, variant: str = "local_url") -> str:
+    """优先使用后端镜像的本地地址（不会过期、可被浏览器缓存、视频支持拖动），没有镜像时回退到供应商原始链接"""
+    if isinstance(media, str):
+        return media
+    local = media.get(variant) or media.get("local_url")
+    return f"{MEDIA_BASE_URL}{local}" if local else media["url"]
+
+
+def media_caption(media: dict | str) -> str:
+    if isinstance(media, dict) and "shot" in media:
+        return f"🎞️ 镜头 {media['shot'] + 1} · {media['title']}"
+    return "🎨 视觉工坊生成"
+
+
+def fetch_history(thread_id: str, before: int | None = None, limit: int = HISTORY_WINDOW) -> dict | None:
+    """从后端检查点分页读取会话历史，失败时返回 None"""
+    params = {"limit": limit} if before is None else {"limit": limit, "before": before}
+    try:
+        response = requests.get(f"{HISTORY_URL}/{thread_id}", params=params, timeout=10)
+        return response.json() if response.status_code == 200 else None
+    except requests.RequestException:
+        return None
+
+
+def sync_history() -> bool:
+    """用后端最近一页替换当前窗口；后端不可用时保留本地记录"""
+    page = fetch_history(st.session_state.session_id)
+    if page is None:
+        return False
+    st.session_state.messages = page["messages"]
+    st.session_state.history_before = page["before"]
+    return True
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def shrink_image(data: bytes) -> bytes:
+    """超大图片在上传前先缩小并转为 JPEG；按内容缓存，避免每次重跑脚本都重新处理"""
+    return shrink_for_upload(data)[1]
+
+# tool_start 事件对应的状态提示
+TOOL_STATUS = {
+    "generate_image": "⏳ **画笔引擎唤醒中**... 正在调用视觉工坊渲染画面。",
+    "analyze_uploaded_image": "👁️ **神之眼启动**... 正在呼叫视觉中枢解析上传的画面。",
+    "analyze_uploaded_video": "🎥 **视频解析引擎启动**... 正在后台进行智能抽帧与视觉理解。",
+    "generate_video": "🎬 **造梦机唤醒中**... 正在调用 Seedance 生成动态视频 (通常需 1-3 分钟)，请耐心等待。",
+    "create_storyboard": "🎞️ **分镜工作流启动**... 正在规划镜头，随后并发生成各镜头画面。",
+}
 
 # --- 页面基础设置 ---
 st.set_page_config(
@@ -118,7 +177,11 @@ st.markdown("""
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
 if "messages" not in st.session_state:
+    # 只保存当前渲染的窗口，完整历史在后端检查点中
     st.session_state.messages = []
+    st.session_state.history_before = None
+    st.session_state.history_synced = False
+    st.session_state.turn_error = None
 if "selected_model" not in st.session_state:
     st.session_state.selected_model = "DeepSeek-V3 (官方直连)"
 if "selected_vision_model" not in st.session_state:
@@ -191,6 +254,8 @@ def render_chat_page():
         st.divider()
         if st.button("🗑️ 清空当前对话", type="primary"):
             st.session_state.messages = []
+            st.session_state.history_before = None
+            st.session_state.turn_error = None
             st.session_state.session_id = str(uuid.uuid4())
             st.rerun()
 
@@ -201,37 +266,55 @@ def render_chat_page():
         if uploaded_media:
             import base64
             bytes_data = uploaded_media.getvalue()
-            b64_str = base64.b64encode(bytes_data).decode("utf-8")
             file_ext = uploaded_media.name.split(".")[-1].lower()
             if file_ext in ["mp4", "mov"]:
-                st.session_state.vision_video_base64 = b64_str
+                st.session_state.vision_video_base64 = base64.b64encode(bytes_data).decode("utf-8")
                 st.session_state.vision_image_base64 = None
                 st.success("✅ 视频已就绪！请向大模型提问。")
             else:
-                st.session_state.vision_image_base64 = b64_str
+                st.session_state.vision_image_base64 = base64.b64encode(shrink_image(bytes_data)).decode("utf-8")
                 st.session_state.vision_video_base64 = None
                 st.success("✅ 图片已就绪！请向大模型提问。")
         else:
             st.session_state.vision_image_base64 = None
             st.session_state.vision_video_base64 = None
 
-    # --- 结构化历史渲染 ---
+    # --- 结构化历史渲染：只渲染窗口内的记录 ---
+    if not st.session_state.history_synced:
+        sync_history()
+        st.session_state.history_synced = True
+    if st.session_state.history_before is not None:
+        if st.button("⬆️ 加载更早的消息"):
+            page = fetch_history(st.session_state.session_id, before=st.session_state.history_before)
+            if page is not None:
+                st.session_state.messages = page["messages"] + st.session_state.messages
+                st.session_state.history_before = page["before"]
+            st.rerun()
+
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
+            if message.get("attachment"):
+                st.caption("📎 附带了图片" if message["attachment"] == "image" else "📎 附带了视频")
             if message.get("content"):
                 st.markdown(message["content"])
 
             if message.get("images"):
                 cols = st.columns(len(message["images"])) if len(message["images"]) < 4 else [st] * len(message["images"])
-                for idx, url in enumerate(message["images"]):
+                # 多图并排时列宽有限，历史记录中用缩略图即可
+                variant = "thumbnail_url" if len(message["images"]) > 1 else "local_url"
+                for idx, image in enumerate(message["images"]):
                     container = cols[idx] if idx < len(cols) else st
-                    container.image(url, caption="🎨 视觉工坊生成", width="stretch")
+                    container.image(media_src(image, variant), caption=media_caption(image), width="stretch")
             if message.get("videos"):
-                for vid_url in message["videos"]:
-                    st.video(vid_url)
+                for video in message["videos"]:
+                    st.video(media_src(video))
+
+    if st.session_state.turn_error:
+        st.error(st.session_state.turn_error)
 
     # --- 输入与流式解析 (信令驱动) ---
     if prompt := st.chat_input("输入选题、脚本文案，或直接输入『画一张...』"):
+        st.session_state.turn_error = None
         st.session_state.messages.append({"role": "user", "content": prompt, "images": [], "videos": []})
         with st.chat_message("user"):
             st.markdown(prompt)
@@ -241,10 +324,13 @@ def render_chat_page():
             status_placeholder = st.empty()
             image_placeholder = st.empty()
             video_placeholder = st.empty()
+            segment_placeholder = st.empty()
 
             full_response = ""
+            errors = []
             current_images = []
             current_videos = []
+            segment_reports = []
 
             payload = {
                 "content": prompt,
@@ -261,71 +347,83 @@ def render_chat_page():
             try:
                 with requests.post(API_URL, json=payload, stream=True, timeout=360) as response:
                     if response.status_code == 200:
-                        for line in response.iter_lines():
-                            if line:
-                                decoded_line = line.decode("utf-8")
-                                if decoded_line.startswith("data: "):
-                                    data_str = decoded_line[6:]
-                                    if data_str == "[DONE]":
-                                        break
-
-                                    if data_str.startswith("[SIGNAL_TOOL_START:generate_image]"):
-                                        status_placeholder.info("⏳ **画笔引擎唤醒中**... 正在调用视觉工坊渲染画面。")
-                                        continue
-                                    elif data_str.startswith("[SIGNAL_TOOL_START:analyze_image]"):
-                                        status_placeholder.info("👁️ **神之眼启动**... 正在呼叫视觉中枢解析上传的画面。")
-                                        continue
-                                    elif data_str.startswith("[SIGNAL_TOOL_START:analyze_video]"):
-                                        status_placeholder.info("🎥 **视频解析引擎启动**... 正在后台进行智能抽帧与视觉理解。")
-                                        continue
-                                    elif data_str.startswith("[SIGNAL_TOOL_START:generate_video]"):
-                                        status_placeholder.info("🎬 **造梦机唤醒中**... 正在调用 Seedance 生成动态视频 (通常需 1-3 分钟)，请耐心等待。")
-                                        continue
-
-                                    elif data_str.startswith("[SIGNAL_IMAGE_URL"):
-                                        url_match = re.search(r"\[SIGNAL_IMAGE_URL:(.*?)\]", data_str)
-                                        if url_match:
-                                            img_url = url_match.group(1)
-                                            current_images.append(img_url)
-                                            status_placeholder.empty()
-                                            with image_placeholder.container():
-                                                for u in current_images:
-                                                    st.image(u, caption="🎨 视觉工坊生成", width="stretch")
-                                        continue
-
-                                    elif data_str.startswith("[SIGNAL_VIDEO_URL"):
-                                        url_match = re.search(r"\[SIGNAL_VIDEO_URL:(.*?)\]", data_str)
-                                        if url_match:
-                                            vid_url = url_match.group(1)
-                                            current_videos.append(vid_url)
-                                            status_placeholder.empty()
-                                            with video_placeholder.container():
-                                                for v in current_videos:
-                                                    st.video(v)
-                                        continue
-
-                                    full_response += data_str
-                                    text_placeholder.markdown(full_response + "▌")
+                        for event_type, data in iter_events(response):
+                            if event_type == "done":
+                                break
+
+                            if event_type == "token":
+                                if not full_response:
+                                    status_placeholder.empty()
+                                full_response += data["text"]
+                                text_placeholder.markdown(full_response + "▌")
+
+                            elif event_type == "queued":
+                                status_placeholder.info(f"🚦 模型供应商繁忙，正在排队... 前方还有 {data['position'] - 1} 位。")
+
+                            elif event_type == "tool_start":
+                                status = TOOL_STATUS.get(data["tool"])
+                                if status:
+                                    status_placeholder.info(status)
+
+                            elif event_type == "segment":
+                                status_placeholder.info(
+                                    f"🎞️ **分段解析中**... 已完成片段 {data['start']}-{data['end']} ({data['index'] + 1}/{data['total']})"
+                                )
+                                segment_reports.append(data)
+                                with segment_placeholder.container():
+                                    with st.expander(f"🎞️ 分段解析 ({len(segment_reports)}/{data['total']})"):
+                                        for seg in sorted(segment_reports, key=lambda x: x["index"]):
+                                            st.markdown(f"**[{seg['start']}-{seg['end']}]** {seg['text']}")
+
+                            elif event_type == "storyboard":
+                                if data["status"] == "planned":
+                                    status_placeholder.info(f"🎞️ **分镜已规划 {len(data['shots'])} 个镜头**... 正在并发生成画面。")
+                                else:
+                                    full_response += f"\n\n⚠️ 镜头 {data['index'] + 1} 生成失败: {data['message']}"
+                                    text_placeholder.markdown(full_response)
+
+                            elif event_type == "media":
+                                status_placeholder.empty()
+                                if data["kind"] == "image":
+                                    current_images.append(data)
+                                    with image_placeholder.container():
+                                        for image in current_images:
+                                            st.image(media_src(image), caption=media_caption(image), width="stretch")
+                                elif data["kind"] == "video":
+                                    current_videos.append(data)
+                                    with video_placeholder.container():
+                                        for video in current_videos:
+                                            st.video(media_src(video))
+
+                            elif event_type == "error":
+                                full_response += f"\n\n❌ {data['message']}"
+                                errors.append(f"❌ {data['message']}")
 
                         text_placeholder.markdown(full_response)
                     else:
-                        st.error(f"❌ Error: {response.status_code} - {response.text}")
+                        errors.append(f"❌ Error: {response.status_code} - {response.text}")
+                        st.error(errors[-1])
             except Exception as e:
-                st.error(f"❌ Connection Failed: {e}")
-
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": full_response,
-            "images": current_images,
-            "videos": current_videos,
-        })
+                errors.append(f"❌ Connection Failed: {e}")
+                st.error(errors[-1])
+
+        # 本轮已写入后端检查点，重新拉取最近一页；错误信息不进入检查点，单独保留到下一轮
+        st.session_state.turn_error = "\n\n".join(errors) or None
+        if not sync_history():
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": full_response,
+                "images": current_images,
+                "videos": current_videos,
+            })
+            st.session_state.messages = st.session_state.messages[-HISTORY_WINDOW:]
         st.rerun()
 
 # --- 页面 3: 视觉工坊 (Visual Studio) ---
 def render_visual_studio():
     st.title("🎨 视觉工坊 (多模态实验室)")
     st.info("在此模块，你可以生成封面、制作动态视频或进行视频内容分析。")
-    tab1, tab2, tab3 = st.tabs(["🖼️ 封面生成", "🎬 视频制作", "👁️ 视觉诊断"])
+    tab1, tab2, tab4, tab3 = st.tabs(["🖼️ 封面生成", "🎬 视频制作", "🎞️ 分镜脚本", "👁️ 视觉诊断"])
 
     with tab1:
         st.markdown("### 爆款封面生成 (豆包)")
@@ -336,13 +434,59 @@ def render_visual_studio():
                     res = requests.post(f"{BACKEND_URL}/api/generate_image", json={"prompt": desc}, timeout=90)
                     data = res.json()
                     if data.get("status") == "success":
-                        st.image(data["url"], caption="生成成功", width="stretch")
+                        st.image(media_src(data), caption="生成成功", width="stretch")
                         st.balloons()
                     else:
                         st.error(data.get("message"))
                 except Exception as e:
                     st.error(f"生成失败: {e}")
 
+        with st.expander("📦 批量生成 (多个提示词或模板 × 变量，后台并发出图)"):
+            st.caption("每行一个提示词；或填写模板，用 {变量名} 占位，变量每行一个，格式为 变量名=取值1,取值2。相同的提示词只生成一次。")
+            batch_prompts = st.text_area("提示词列表", "", key="batch_prompts")
+            template = st.text_input("提示词模板", "{topic}主题的小红书封面，{style}风格，大字标题")
+            variables_text = st.text_area("模板变量", "topic=秋季穿搭,城市骑行,围炉煮茶\nstyle=极简,复古胶片")
+            variants = st.slider("每个提示词的版本数", 1, 8, 1)
+            if st.button("📦 开始批量生成"):
+                variables = {}
+                for line in filter(None, (line.strip() for line in variables_text.splitlines())):
+                    name, _, values = line.partition("=")
+                    variables[name.strip()] = [v.strip() for v in values.split(",") if v.strip()]
+                payload = {
+                    "kind": "image",
+                    "prompts": [line for line in batch_prompts.splitlines() if line.strip()],
+                    "template": template if variables else "",
+                    "variables": variables,
+                    "variants": variants,
+                }
+                try:
+                    data = requests.post(f"{BACKEND_URL}/api/batch", json=payload, timeout=30).json()
+                    if data.get("status") != "success":
+                        st.error(data.get("message"))
+                    else:
+                        status = st.empty()
+                        progress = st.progress(0.0)
+                        columns = st.columns(4)
+                        with requests.get(f"{BACKEND_URL}/api/batch/{data['id']}/events", stream=True, timeout=1800) as response:
+                            for event_type, event in iter_events(response):
+                                if event_type == "done":
+                                    break
+                                if event_type == "media":
+                                    columns[event["index"] % 4].image(media_src(event, "thumbnail_url"), caption=event["prompt"], width="stretch")
+                                elif event_type == "batch" and event["status"] == "planned":
+                                    status.info(f"📦 任务 {event['id']}：共 {event['total']} 张（去重 {event['duplicates']} 条），生成中...")
+                                elif event_type == "batch" and event["status"] == "item_failed":
+                                    st.warning(f"第 {event['index'] + 1} 条生成失败: {event['message']}")
+                                elif event_type == "batch":
+                                    finished = event["succeeded"] + event["failed"] + event["cancelled"]
+                                    progress.progress(finished / event["total"])
+                                    if event["status"] != "progress":
+                                        status.success(f"✅ 批量生成结束：成功 {event['succeeded']} 张，失败 {event['failed']} 张。清单：{BACKEND_URL}/api/batch/{data['id']}")
+                                elif event_type == "error":
+                                    st.error(event["message"])
+                except Exception as e:
+                    st.error(f"批量生成失败: {e}")
+
     with tab2:
         st.markdown("### 动态视频生成 (Seedance)")
         st.caption("提示：造梦机需要极度详细的描述，包括主体、环境、光影和镜头运动。")
@@ -359,13 +503,54 @@ def render_visual_studio():
                     res = requests.post(f"{BACKEND_URL}/api/generate_video", json={"prompt": prompt_with_params}, timeout=400)
                     data = res.json()
                     if data.get("status") == "success":
-                        st.video(data["url"])
+                        st.video(media_src(data))
                         st.success("✅ 视频渲染完成！")
                     else:
                         st.error(data.get("message"))
                 except Exception as e:
                     st.error(f"生成失败: {e}")
 
+    with tab4:
+        st.markdown("### 分镜脚本 (一次规划，并发出图)")
+        st.caption("大模型一次性把脚本拆成镜头，所有镜头的画面同时生成；勾选后再以每个镜头的画面为首帧生成视频。")
+        script = st.text_area("输入脚本", "清晨的古镇，少女推开木窗，河面起雾；她撑伞走过石桥，在茶馆与老人对弈，日落时乘船离开。")
+        col1, col2 = st.columns(2)
+        with col1:
+            shots = st.slider("镜头数", 2, 12, 6)
+        with col2:
+            with_video = st.checkbox("逐镜头生成视频 (需数分钟)")
+        if st.button("🎞️ 生成分镜"):
+            status = st.empty()
+            grid = st.container()
+            payload = {"script": script, "shots": shots, "with_video": with_video, "chat_model": st.session_state.selected_model}
+            try:
+                with requests.post(f"{BACKEND_URL}/api/storyboard", json=payload, stream=True, timeout=900) as response:
+                    slots, done = [], 0
+                    for event_type, data in iter_events(response):
+                        if event_type == "done":
+                            break
+                        if event_type == "storyboard" and data["status"] == "planned":
+                            status.info(f"🎞️ 已规划 {len(data['shots'])} 个镜头，画面生成中...")
+                            columns = grid.columns(3)
+                            # 每个镜头一个画面位与一个视频位，按完成顺序填入
+                            slots = [{"image": columns[i % 3].empty(), "video": columns[i % 3].empty()} for i in range(len(data["shots"]))]
+                            for shot, slot in zip(data["shots"], slots):
+                                slot["image"].caption(f"⏳ 镜头 {shot['index'] + 1} · {shot['title']}")
+                        elif event_type == "storyboard":
+                            slots[data["index"]][data["kind"]].error(f"镜头 {data['index'] + 1} 生成失败: {data['message']}")
+                        elif event_type == "media":
+                            done += 1
+                            slot = slots[data["shot"]][data["kind"]]
+                            if data["kind"] == "image":
+                                slot.image(media_src(data), caption=media_caption(data), width="stretch")
+                            else:
+                                slot.video(media_src(data))
+                        elif event_type == "error":
+                            st.error(data["message"])
+                    status.success(f"✅ 分镜完成，共 {done} 项产出。")
+            except Exception as e:
+                st.error(f"生成失败: {e}")
+
     with tab3:
         st.markdown("### 视觉内容分析 (NVIDIA VILA/Qwen-VL)")
         st.info("👈 请直接在左侧边栏使用【👁️ 视觉解析工具】上传媒体并向 AI 提问。此页面仅作工坊导航展示。")
@@ -457,8 +642,11 @@ def main():
                                             progress_bar.progress(1.0)
                                             status_text.success(f"✅ 《{filename}》学习完成！")
                                             break
-                                        elif state.get("status") == "not_found":
-                                            status_text.caption("⏳ 等待任务启动...")
+                                        elif state.get("status") == "failed":
+                                            status_text.error(f"❌ 《{filename}》入库失败: {state.get('error')}")
+                                            break
+                                        elif state.get("status") in ("queued", "not_found"):
+                                            status_text.caption("⏳ 排队等待入库...")
                                     _time.sleep(2)
                                 except Exception:
                                     break
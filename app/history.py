@@ -0,0 +1,103 @@
+# app/history.py
+"""
+对话历史的紧凑视图：把检查点中的消息（用户输入、大脑回复、工具结果）折叠成前端渲染用的记录，
+每轮一条用户记录与一条助手记录，助手记录汇总该轮的文本与工具产出的媒体引用。
+前端只保留最近一页，向前翻页时再按游标拉取，会话越长也不会让每次重绘变慢。
+
+记录格式：{"id", "role": "user"|"assistant", "content", "images": [媒体], "videos": [媒体]}，
+用户记录另有 attachment ("image"|"video"|None) 标明该轮是否附带了上传媒体。
+id 为记录在整段会话中的序号，用作翻页游标。
+"""
+import threading
+from collections import OrderedDict
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+_CACHE_SIZE = 64
+
+# 附带媒体时注入给大脑的提示；写入与解析都在这里，历史中只显示用户原本的输入
+ATTACHMENT_HINTS = {
+    "image": "【系统提示：用户在本次对话中附带上传了一张图片。请立刻调用 'analyze_uploaded_image' 工具进行解析。】",
+    "video": "【系统提示：用户在本次对话中附带上传了一段视频。请立刻调用 'analyze_uploaded_video' 工具进行抽帧与解析。】",
+}
+_USER_INPUT = "\n\n用户输入："
+
+# 同一检查点的折叠结果只算一次：前端每轮结束后都会拉取最新一页
+_compacted: OrderedDict[tuple[str, str], list[dict]] = OrderedDict()
+_lock = threading.Lock()
+
+
+def wrap_user_text(content: str, attachment: str | None) -> str:
+    if attachment is None:
+        return content
+    return f"{ATTACHMENT_HINTS[attachment]}{_USER_INPUT}{content}"
+
+
+def unwrap_user_text(text: str) -> tuple[str, str | None]:
+    for attachment, hint in ATTACHMENT_HINTS.items():
+        if text.startswith(hint + _USER_INPUT):
+            return text[len(hint) + len(_USER_INPUT):], attachment
+    return text, None
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    # 多段内容只取文本段
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text")
+
+
+def _artifact_media(artifact) -> list[dict]:
+    if not isinstance(artifact, dict):
+        return []
+    media = list(artifact.get("media") or [])
+    for shot in artifact.get("storyboard") or []:
+        for kind in ("image", "video"):
+            if shot.get(kind):
+                media.append({**shot[kind], "shot": shot["index"], "title": shot["title"]})
+    return media
+
+
+def compact(messages) -> list[dict]:
+    records = []
+    for message in messages:
+        if message.type == "human":
+            content, attachment = unwrap_user_text(_text(message.content))
+            records.append({"role": "user", "content": content, "attachment": attachment, "images": [], "videos": []})
+            continue
+        if not records or records[-1]["role"] != "assistant":
+            records.append({"role": "assistant", "content": "", "images": [], "videos": []})
+        record = records[-1]
+        if message.type == "ai":
+            # 与流式推送一致：工具调用前后的文本直接拼接
+            record["content"] += _text(message.content)
+        elif message.type == "tool":
+            for media in _artifact_media(getattr(message, "artifact", None)):
+                record["images" if media["kind"] == "image" else "videos"].append(media)
+    for i, record in enumerate(records):
+        record["id"] = i
+    return records
+
+
+def compacted(thread_id: str, checkpoint_id: str | None, messages) -> list[dict]:
+    if checkpoint_id is None:
+        return compact(messages)
+    key = (thread_id, checkpoint_id)
+    with _lock:
+        records = _compacted.get(key)
+        if records is not None:
+            _compacted.move_to_end(key)
+            return records
+    records = compact(messages)
+    with _lock:
+        _compacted[key] = records
+        while len(_compacted) > _CACHE_SIZE:
+            _compacted.popitem(last=False)
+    return records
+
+
+def page(records: list[dict], before: int | None, limit: int) -> tuple[list[dict], int | None]:
+    """返回 id 小于 before 的最近 limit 条记录，以及继续向前翻页的游标（已到开头时为 None）"""
+    end = len(records) if before is None else max(0, min(before, len(records)))
+    start = max(0, end - limit)
+    return records[start:end], (start if start > 0 else None)
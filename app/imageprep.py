@@ -0,0 +1,128 @@
+# app/imageprep.py
+"""
+上传图片的预处理：解码一次、按 EXIF 摆正方向、透明背景铺白、缩放到视觉模型的最佳分辨率，
+再编码为 JPEG 并给出正确的 MIME 类型。原图可能是 20MB 的 PNG，直接转发既拖慢上传也拖慢供应商，
+而超过模型分辨率上限的像素供应商反正会缩掉。
+结果按 (内容引用, 目标尺寸) 缓存（媒体库按内容哈希寻址）；处理在独立线程池中执行，收到上传时即开始，
+视觉工具调用时通常已经完成。本模块不依赖共享状态后端，前端也用它在上传前缩小超大图片。
+"""
+import base64
+import contextvars
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from app.metrics import CACHE_REQUESTS
+from app.profiling import span
+
+JPEG_QUALITY = 85
+# 前端上传前的预缩放上限：保留足够余量，后端仍按各模型的上限再处理
+UPLOAD_MAX_SIDE = 2048
+PREP_CACHE_SIZE = 128
+
+_MAGIC = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+def sniff_mime(data: bytes) -> str | None:
+    """按文件头识别图片格式"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    return None
+
+
+def decode(data: bytes):
+    """解码为 8 位 BGR 图像：JPEG 按 EXIF 方向摆正（OpenCV 默认行为），带透明通道的 PNG 铺白底"""
+    import cv2
+    import numpy as np
+
+    buffer = np.frombuffer(data, np.uint8)
+    if sniff_mime(data) == "image/png":
+        image = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+        if image is not None and image.ndim == 3 and image.shape[2] == 4:
+            if image.dtype != np.uint8:
+                image = (image / 257).astype(np.uint8)
+            alpha = image[:, :, 3:4].astype(np.float32) / 255
+            return (image[:, :, :3] * alpha + 255 * (1 - alpha)).astype(np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("无法解码的图片格式")
+    return image
+
+
+def fit(image, max_side: int, max_pixels: int):
+    """等比缩小到边长与总像素上限以内，不放大"""
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width), (max_pixels / (height * width)) ** 0.5)
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+
+
+def encode_jpeg(image) -> bytes | None:
+    import cv2
+
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+    return buffer.tobytes() if ok else None
+
+
+def preprocess(data: bytes, max_side: int, max_pixels: int) -> tuple[str, bytes]:
+    """返回 (MIME 类型, 编码后的图片)；无法解码的格式原样返回，交给供应商处理"""
+    try:
+        image = decode(data)
+    except ValueError:
+        return sniff_mime(data) or "application/octet-stream", data
+    encoded = encode_jpeg(fit(image, max_side, max_pixels))
+    if encoded is None:
+        return sniff_mime(data) or "application/octet-stream", data
+    return "image/jpeg", encoded
+
+
+def shrink_for_upload(data: bytes) -> tuple[str, bytes]:
+    """前端上传前调用：超大图片先缩到 UPLOAD_MAX_SIDE 并转为 JPEG，减少上传耗时；小图原样返回"""
+    mime = sniff_mime(data)
+    if mime == "image/jpeg" and len(data) <= 1024 * 1024:
+        return mime, data
+    return preprocess(data, UPLOAD_MAX_SIDE, UPLOAD_MAX_SIDE * UPLOAD_MAX_SIDE)
+
+
+# --- 按内容缓存的后台预处理 ---
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="imageprep")
+_prepared: OrderedDict[tuple, Future] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _prepare(load: Callable[[], bytes], max_side: int, max_pixels: int) -> tuple[str, str]:
+    data = load()
+    with span("imageprep:preprocess"):
+        mime, encoded = preprocess(data, max_side, max_pixels)
+    return mime, base64.b64encode(encoded).decode("utf-8")
+
+
+def prepare(ref: str, load: Callable[[], bytes], max_side: int, max_pixels: int) -> Future:
+    """提交预处理，返回结果为 (MIME 类型, Base64) 的 Future；同一图片与目标尺寸只处理一次，load 只在未命中时调用"""
+    key = (ref, max_side, max_pixels)
+    with _lock:
+        future = _prepared.get(key)
+        if future is not None and not (future.done() and future.exception() is not None):
+            CACHE_REQUESTS.inc("imageprep", "hit")
+            _prepared.move_to_end(key)
+            return future
+        CACHE_REQUESTS.inc("imageprep", "miss")
+        # 复制上下文，预处理的 span 归属到发起请求
+        future = _pool.submit(contextvars.copy_context().run, _prepare, load, max_side, max_pixels)
+        _prepared[key] = future
+        while len(_prepared) > PREP_CACHE_SIZE:
+            _prepared.popitem(last=False)
+        return future
@@ -0,0 +1,284 @@
+# app/ingest.py
+"""
+知识库入库调度：上传的文档不再各自占一个请求线程、各自按固定间隔调用 Embedding 接口，
+而是切块后交给本模块，在专用线程池中按批次调度，所有上传共享一个全局的 Embedding 速率预算。
+
+- 公平：批次按租户加权轮转（步进调度），租户由上传时的 tenant 字段指定，未指定时每个上传各算一份；
+  权重由 INGEST_TENANT_WEIGHTS 配置，如 "team_a=2,team_b=1"，未列出的租户权重为 1
+- 小任务优先：不超过 INGEST_SMALL_JOB 个块的任务走优先通道，不受并发任务数限制，
+  在大批量入库进行时也能很快可检索
+- 有界：同时进行的大任务不超过 INGEST_MAX_JOBS 个，其余按块数从小到大排队；
+  同时在途的 Embedding 批次不超过 INGEST_WORKERS 个
+- 速率：每个批次发出前领取一个令牌（INGEST_EMBED_RATE / INGEST_EMBED_BURST），
+  多个大文件并发上传时总请求速率不变，只是在各租户之间分配
+
+进度仍写入 progress_store（键为文件名），status 依次为 queued / processing / completed 或 failed。
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app.limits import TokenBucket
+from app.metrics import INGEST_BATCH_SECONDS, INGEST_CHUNKS, timer
+from app.profiling import span
+from app.recorder import TRACE_PATH, Trace, current_trace, sanitize
+from app.state import progress_store
+
+INGEST_BATCH_SIZE = 50
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "2"))
+INGEST_SMALL_JOB = int(os.getenv("INGEST_SMALL_JOB", "100"))
+INGEST_EMBED_RATE = float(os.getenv("INGEST_EMBED_RATE", "4"))
+INGEST_EMBED_BURST = int(os.getenv("INGEST_EMBED_BURST", "4"))
+INGEST_TENANT_WEIGHTS = os.getenv("INGEST_TENANT_WEIGHTS", "")
+MAX_RETRIES = 5
+
+
+def _parse_weights(spec: str) -> dict[str, float]:
+    weights = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        tenant, _, weight = entry.partition("=")
+        weights[tenant.strip()] = max(float(weight or 1), 0.01)
+    return weights
+
+
+class IngestJob:
+    """一个上传文档的入库任务；next 为下一个待发批次的起始下标"""
+
+    def __init__(self, source: str, tenant: str, chunks: list[str], trace: Trace | None, future: Future):
+        self.source = source
+        self.tenant = tenant
+        self.chunks = chunks
+        self.trace = trace
+        self.future = future
+        self.next = 0
+        self.inflight = 0
+        self.written = 0
+        self.error: str | None = None
+        self._report_lock = threading.Lock()
+        self._reported_final = False
+
+    @property
+    def total(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def small(self) -> bool:
+        return self.total <= INGEST_SMALL_JOB
+
+    @property
+    def pending(self) -> bool:
+        return self.error is None and self.next < self.total
+
+    @property
+    def finished(self) -> bool:
+        return self.inflight == 0 and not self.pending
+
+    def report(self, **fields):
+        """
+        写入进度。在调度锁之外调用，同一任务的写入串行进行；
+        写入 completed / failed 之后不再改 status（晚到的 processing 不会覆盖结果），current 只取最新的已写入块数。
+        """
+        with self._report_lock:
+            if self._reported_final:
+                fields.pop("status", None)
+            elif fields.get("status") in ("completed", "failed"):
+                self._reported_final = True
+            if "current" in fields:
+                fields["current"] = self.written
+            progress_store.update(self.source, **fields)
+
+
+class IngestScheduler:
+    def __init__(self):
+        self.weights = _parse_weights(INGEST_TENANT_WEIGHTS)
+        self.bucket = TokenBucket(INGEST_EMBED_RATE, INGEST_EMBED_BURST)
+        self.queued: list[IngestJob] = []  # 等待名额的大任务
+        self.active: list[IngestJob] = []
+        self.passes: dict[str, float] = {}  # 各租户的虚拟时间，每发一个批次前进 1 / 权重
+        self.inflight = 0
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+        # 切块是纯 CPU 工作，单独一个线程，不占 Embedding 批次的名额
+        self._splitter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-split")
+        self._dispatcher: threading.Thread | None = None
+
+    # --- 提交 ---
+    def submit(self, text: str, source: str, tenant: str = "", payload: dict | None = None) -> Future:
+        """
+        登记一个入库任务并立即返回；切块在后台完成后进入调度。
+        返回的 Future 在任务结束时给出写入的块数，失败时抛出最后一次的错误。
+        """
+        progress_store.set(source, {"current": 0, "total": 0, "status": "queued"})
+        trace = Trace("upload_knowledge", sanitize(payload or {})) if TRACE_PATH else None
+        future = Future()
+        self._splitter.submit(self._prepare, text, source, tenant or source, trace, future)
+        with self._cond:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="ingest-dispatch", daemon=True)
+                self._dispatcher.start()
+        return future
+
+    def _prepare(self, text: str, source: str, tenant: str, trace: Trace | None, future: Future):
+        from app.rag import split_text
+
+        try:
+            chunks = split_text(text)
+        except Exception as e:
+            print(f"❌ 文档切分失败: {e}")
+            progress_store.update(source, status="failed", error=str(e))
+            future.set_exception(e)
+            return
+        job = IngestJob(source, tenant, chunks, trace, future)
+        if not job.total:
+            # 没有可入库的块：不占用调度名额，直接完成（否则任务永远没有批次可派发，也就永远不会结束）
+            print(f"⚠️ 《{source}》没有有效知识块，跳过入库")
+            progress_store.update(source, current=0, total=0, status="completed")
+            future.set_result(0)
+            if trace is not None:
+                trace.outcome = "completed"
+                trace.write()
+            return
+        print(f"📦 《{source}》共计 {job.total} 个有效知识块，租户 {tenant}，进入入库调度")
+        with self._cond:
+            activated = job.small or self._large_active() < INGEST_MAX_JOBS
+            if activated:
+                self._activate(job)
+            else:
+                self.queued.append(job)
+                self.queued.sort(key=lambda j: j.total)
+            self._cond.notify_all()
+        job.report(total=job.total, **({"status": "processing"} if activated else {}))
+
+    # --- 调度（以下以 _ 开头且不带锁的方法都要求调用方持有 self._cond，且不做存储与文件 IO） ---
+    def _large_active(self) -> int:
+        return sum(1 for job in self.active if not job.small)
+
+    def _activate(self, job: IngestJob):
+        # 新加入（或空闲后重新加入）的租户从当前最小虚拟时间起步，不能凭空闲期间攒下的额度插队
+        busy = [self.passes[j.tenant] for j in self.active if j.tenant in self.passes]
+        floor = min(busy) if busy else 0.0
+        self.passes[job.tenant] = max(self.passes.get(job.tenant, floor), floor)
+        self.active.append(job)
+
+    def _next_batch(self) -> tuple[IngestJob, int, int] | None:
+        if self.inflight >= INGEST_WORKERS:
+            return None
+        ready = [job for job in self.active if job.pending]
+        if not ready:
+            return None
+        small = [job for job in ready if job.small]
+        if small:
+            job = small[0]  # 优先通道内先到先得
+        else:
+            # 虚拟时间最小的租户；同一租户内剩余块数最少的任务优先
+            tenant = min({job.tenant for job in ready}, key=lambda t: self.passes[t])
+            job = min((j for j in ready if j.tenant == tenant), key=lambda j: j.total - j.next)
+            self.passes[tenant] += 1 / self.weights.get(tenant, 1.0)
+        start, end = job.next, min(job.next + INGEST_BATCH_SIZE, job.total)
+        job.next = end
+        job.inflight += 1
+        self.inflight += 1
+        return job, start, end
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while (picked := self._next_batch()) is None:
+                    self._cond.wait()
+            # 全局速率预算：令牌桶只在本线程中使用，同步等待即可
+            self.bucket.acquire_sync()
+            self._pool.submit(self._run_batch, *picked)
+
+    def _run_batch(self, job: IngestJob, start: int, end: int):
+        from app.rag import get_vector_store
+
+        token = current_trace.set(job.trace)
+        error = None
+        try:
+            for attempt in range(MAX_RETRIES):
+                try:
+                    with timer(INGEST_BATCH_SECONDS), span("ingest:embed"):
+                        get_vector_store().add_texts(
+                            job.chunks[start:end], metadatas=[{"source": job.source}] * (end - start)
+                        )
+                    INGEST_CHUNKS.inc(amount=end - start)
+                    break
+                except Exception as e:
+                    if "429" in str(e) and attempt < MAX_RETRIES - 1:
+                        wait_time = (2**attempt) + random.random()
+                        print(f"⚠️ 触发限流，等待 {wait_time:.1f}s 后重试...")
+                        time.sleep(wait_time)
+                    else:
+                        print(f"❌ 批量入库失败: {e}")
+                        error = str(e)
+                        break
+        finally:
+            current_trace.reset(token)
+        activated: list[IngestJob] = []
+        with self._cond:
+            job.inflight -= 1
+            self.inflight -= 1
+            if error is None:
+                job.written += end - start
+            elif job.error is None:
+                job.error = error
+            finished = job.finished
+            if finished:
+                activated = self._finish(job)
+            self._cond.notify_all()
+        # 进度、知识库版本与录制都在释放调度锁之后写入，派发线程与其他批次不必等待这些 IO
+        if error is None:
+            job.report(current=job.written)
+        for queued in activated:
+            queued.report(status="processing")
+        if finished:
+            self._complete(job)
+
+    def _finish(self, job: IngestJob) -> list[IngestJob]:
+        """把结束的任务移出调度，返回因此获得名额的排队任务"""
+        self.active.remove(job)
+        activated = []
+        while self.queued and self._large_active() < INGEST_MAX_JOBS:
+            activated.append(self.queued.pop(0))
+            self._activate(activated[-1])
+        # 没有其他任务的租户不再保留虚拟时间，再次上传时按 _activate 的规则重新起步
+        if not any(j.tenant == job.tenant for j in self.active + self.queued):
+            self.passes.pop(job.tenant, None)
+        return activated
+
+    def _complete(self, job: IngestJob):
+        """任务结束后的收尾：更新知识库版本、写入最终状态与录制，并完成 Future（不持有调度锁）"""
+        from app.rag import _bump_knowledge_version
+
+        # 中途失败时已写入的批次同样改变了知识库
+        if job.written:
+            _bump_knowledge_version()
+        if job.error is None:
+            job.report(status="completed")
+            print(f"✅ 成功将 {job.total} 个文本块存入 ChromaDB 向量库！(《{job.source}》)")
+        else:
+            job.report(status="failed", error=job.error)
+        if job.trace is not None:
+            job.trace.outcome = "completed" if job.error is None else "error"
+            job.trace.write()
+        if job.error is None:
+            job.future.set_result(job.total)
+        else:
+            job.future.set_exception(RuntimeError(job.error))
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "active": [
+                    {"source": j.source, "tenant": j.tenant, "current": j.written, "total": j.total, "small": j.small}
+                    for j in self.active
+                ],
+                "queued": [{"source": j.source, "tenant": j.tenant, "total": j.total} for j in self.queued],
+                "inflight_batches": self.inflight,
+            }
+
+
+scheduler = IngestScheduler()
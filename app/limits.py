@@ -0,0 +1,206 @@
+# app/limits.py
+"""
+按模型供应商的准入控制：
+- 并发闸门：限制同一供应商同时进行的对话轮次，超出的请求进入 FIFO 队列并可查询排队位置
+- 令牌桶：限制对供应商发起的每秒请求数，每次调用大模型前领取一个令牌
+对话轮次在事件循环中申请，批量生成等后台线程通过 hold() / acquire_sync() 申请同一份额度。
+"""
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+
+# 默认额度，可用环境变量覆盖：<PROVIDER>_MAX_CONCURRENCY / <PROVIDER>_RATE_LIMIT / <PROVIDER>_BURST
+PROVIDER_LIMITS = {
+    "deepseek": {"concurrency": 16, "rate": 5.0, "burst": 10},
+    "nvidia": {"concurrency": 4, "rate": 0.6, "burst": 2},
+    "volcengine": {"concurrency": 10, "rate": 5.0, "burst": 10},
+    "zhipu": {"concurrency": 8, "rate": 3.0, "burst": 6},
+    "siliconflow": {"concurrency": 8, "rate": 3.0, "burst": 6},
+}
+
+# 排队最长等待时间 (秒) 与队列长度上限
+MAX_QUEUE_WAIT = float(os.getenv("MAX_QUEUE_WAIT", "30"))
+MAX_QUEUE_LENGTH = int(os.getenv("MAX_QUEUE_LENGTH", "100"))
+
+
+def provider_of(model_label: str) -> str:
+    """将前端模型标签映射到供应商，规则与 agent.get_llm 的分支顺序保持一致"""
+    if "DeepSeek" in model_label:
+        return "deepseek"
+    if "Llama" in model_label:
+        return "nvidia"
+    if "Doubao" in model_label:
+        return "volcengine" if os.getenv("DOUBAO_LLM_ENDPOINT") else "deepseek"
+    if "GLM" in model_label:
+        return "zhipu"
+    if "Qwen" in model_label:
+        return "siliconflow"
+    return "deepseek"
+
+
+class QueueFullError(Exception):
+    """排队人数已达上限"""
+
+
+class TokenBucket:
+    """
+    预约式令牌桶：令牌可以透支为负数，透支量决定调用方需要等待的时间，
+    等待在锁外进行，等待顺序天然是先来先得；预约在锁内完成，事件循环与线程可以共用一个桶。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        # 等待时间按透支量除以 rate 计算，rate 为 0 时会除零；burst 小于 1 时每次领取都要等待
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"令牌桶参数不合法: rate={rate} 须大于 0，burst={burst} 须不小于 1")
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        with self._lock:
+            wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        """线程中使用的阻塞版本"""
+        with self._lock:
+            wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Ticket:
+    """一次准入申请；granted 为 True 时占用一个并发名额。在事件循环外创建时用 wait_sync 等待"""
+
+    def __init__(self):
+        self.granted = False
+        self.released = False
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        self._event = asyncio.Event() if self._loop else threading.Event()
+
+    def _grant(self):
+        # 名额可能由其他线程归还，事件循环中的等待方经 call_soon_threadsafe 唤醒
+        self.granted = True
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self, timeout: float) -> bool:
+        """等待放行，超时返回 False"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.granted
+
+    def wait_sync(self, timeout: float) -> bool:
+        self._event.wait(timeout)
+        return self.granted
+
+
+class ProviderLimiter:
+    def __init__(self, name: str, concurrency: int, rate: float, burst: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.active = 0
+        self.waiting: deque[Ticket] = deque()
+        self._lock = threading.Lock()
+
+    def enqueue(self, bounded: bool = True) -> Ticket:
+        """申请名额：有空闲立即放行，否则排队；bounded 时队列已满抛出 QueueFullError"""
+        ticket = Ticket()
+        with self._lock:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                ticket._grant()
+            elif bounded and len(self.waiting) >= MAX_QUEUE_LENGTH:
+                raise QueueFullError(f"{self.name} 排队人数已满 ({MAX_QUEUE_LENGTH})")
+            else:
+                self.waiting.append(ticket)
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """排队位置，从 1 开始；已放行返回 0"""
+        with self._lock:
+            if ticket.granted:
+                return 0
+            return self.waiting.index(ticket) + 1
+
+    def release(self, ticket: Ticket):
+        """归还名额或退出队列，可重复调用"""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if not ticket.granted:
+                self.waiting.remove(ticket)
+                return
+            self.active -= 1
+            while self.waiting and self.active < self.concurrency:
+                self.active += 1
+                self.waiting.popleft()._grant()
+
+    @contextlib.contextmanager
+    def hold(self, check=None, poll: float = 1.0):
+        """
+        线程中占用一个并发名额直到退出，与对话轮次共用名额与队列（后台线程数有限，不受排队长度上限约束）。
+        等待期间每 poll 秒调用一次 check（如取消令牌的 check），抛出异常时退出队列。
+        """
+        ticket = self.enqueue(bounded=False)
+        try:
+            while not ticket.wait_sync(poll):
+                if check:
+                    check()
+            yield
+        finally:
+            self.release(ticket)
+
+
+def _env_limit(var: str, default, cast, minimum, exclusive: bool = False):
+    """读取额度类环境变量；无法解析或超出范围时在启动阶段报错，并指出是哪个变量"""
+    raw = os.getenv(var)
+    try:
+        value = cast(raw) if raw is not None else cast(default)
+    except ValueError:
+        raise ValueError(f"环境变量 {var}={raw!r} 不是合法的数值") from None
+    if value < minimum or (exclusive and value == minimum):
+        raise ValueError(f"环境变量 {var}={value} 不合法：须{'大于' if exclusive else '不小于'} {minimum}")
+    return value
+
+
+def _build_limiters() -> dict[str, ProviderLimiter]:
+    limiters = {}
+    for name, defaults in PROVIDER_LIMITS.items():
+        prefix = name.upper()
+        limiters[name] = ProviderLimiter(
+            name,
+            concurrency=_env_limit(f"{prefix}_MAX_CONCURRENCY", defaults["concurrency"], int, 1),
+            rate=_env_limit(f"{prefix}_RATE_LIMIT", defaults["rate"], float, 0, exclusive=True),
+            burst=_env_limit(f"{prefix}_BURST", defaults["burst"], int, 1),
+        )
+    return limiters
+
+
+limiters = _build_limiters()
+
+
+def get_limiter(model_label: str) -> ProviderLimiter:
+    return limiters[provider_of(model_label)]
@@ -1,23 +1,52 @@
 # app/main.py
 import os
-import re
+import asyncio
+import base64
+import binascii
+import hmac
+import shutil
+import tempfile
+import time
 import uvicorn
 from dotenv import load_dotenv  # 👈 引入 dotenv
 
 # ⚠️ 极其关键：在所有代码运行前加载环境变量！
 load_dotenv() 
 
-from fastapi import BackgroundTasks, FastAPI, UploadFile, File
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, Depends, FastAPI, Header, HTTPException, Path, Query, Request, UploadFile, File, Form
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
 
 from langchain_core.messages import HumanMessage
 from sse_starlette.sse import EventSourceResponse
+from starlette.background import BackgroundTask
 
-from app.agent import app_graph
-from app.context import current_model_config, current_image_data, current_video_data, current_vision_model
+# 对话图及其依赖 (LangGraph / langchain_openai / chromadb / OpenCV) 由 app.warmup 在后台加载
+from app import batch, history, ingest, metrics, mirror, protocol, response_cache, snapshot, trending, vision, warmup
+from app.cancellation import REQUEST_DEADLINE, Cancelled, CancelToken
+from app.limits import MAX_QUEUE_WAIT, QueueFullError, get_limiter
+from app.profiling import ProfilingMiddleware
+from app.recorder import recording
+from app.context import (
+    current_cancel_token, current_model_config, current_image_ref, current_speculation, current_video_ref,
+    current_vision_model,
+)
+from app.state import media_store, progress_store
 
-app = FastAPI(title="ByteCreator Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [warmup.start(), trending.start()]
+    yield
+    for task in tasks:
+        if task and not task.done():
+            task.cancel()
+
+
+app = FastAPI(title="ByteCreator Backend", lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
 
 # --- 视觉工坊专用直连 API ---
 class ImageRequest(BaseModel):
@@ -30,26 +59,200 @@ class VideoRequest(BaseModel):
 
 @app.post("/api/generate_image")
 async def api_generate_image(req: ImageRequest):
-    from app.tools import generate_image
-
-    result = generate_image.invoke({"prompt": req.prompt})
-    url_match = re.search(r"\[System Hidden URL:\s*(https?://[^\s\]]+)\]", str(result))
-    if url_match:
-        return {"status": "success", "url": url_match.group(1)}
+    from app.tools import generate_image, invoke_media_tool
+
+    with recording("generate_image", req.model_dump()) as trace:
+        result, media, _ = await asyncio.to_thread(invoke_media_tool, generate_image, req.prompt)
+        if trace and not media:
+            trace.outcome = "error"
+    if media:
+        return {"status": "success", **await asyncio.to_thread(mirror.localize, media[0])}
     return {"status": "error", "message": result}
 
 
 @app.post("/api/generate_video")
 async def api_generate_video(req: VideoRequest):
-    from app.tools import generate_video
-
-    result = generate_video.invoke({"prompt": req.prompt})
-    url_match = re.search(r"\[System Hidden Video URL:\s*(https?://[^\s\]]+)\]", str(result))
-    if url_match:
-        return {"status": "success", "url": url_match.group(1)}
+    from app.tools import generate_video, invoke_media_tool
+
+    with recording("generate_video", req.model_dump()) as trace:
+        result, media, _ = await asyncio.to_thread(invoke_media_tool, generate_video, req.prompt)
+        if trace and not media:
+            trace.outcome = "error"
+    if media:
+        return {"status": "success", **await asyncio.to_thread(mirror.localize, media[0])}
     return {"status": "error", "message": result}
 
 
+# --- 分镜工作流 API ---
+class StoryboardRequest(BaseModel):
+    script: str
+    shots: int = 6
+    with_video: bool = False
+    chat_model: str = "DeepSeek-V3 (SiliconFlow)"
+
+
+async def storyboard_events(req: StoryboardRequest):
+    """在工作线程中执行分镜工作流，把进度回调转为 (协议事件类型, 负载)"""
+    from app import storyboard
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event_type: str, payload: dict):
+        loop.call_soon_threadsafe(queue.put_nowait, (event_type, payload))
+
+    def work():
+        try:
+            storyboard.run(req.script, req.shots, req.chat_model, req.with_video, emit)
+        except storyboard.StoryboardError as e:
+            emit(protocol.ERROR, {"message": f"❌ 分镜规划失败: {e}"})
+        except Cancelled as e:
+            emit(protocol.ERROR, {"message": f"❌ 分镜工作流已取消 ({e.reason})"})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    # to_thread 复制当前上下文，取消令牌随之进入工作线程
+    worker = asyncio.ensure_future(asyncio.to_thread(work))
+    try:
+        while (item := await queue.get()) is not None:
+            yield await translate_storyboard_event(*item)
+        await worker
+    except Exception as e:
+        yield protocol.ERROR, {"message": str(e)}
+
+
+@app.post("/api/storyboard")
+async def api_storyboard(req: StoryboardRequest):
+    """
+    分镜工作流：一次规划全部镜头，并发生成画面（可选逐镜头视频），以 SSE 流式返回：
+    storyboard (规划结果) -> 每完成一项一个 media -> done；单个镜头失败发 storyboard/shot_failed
+    """
+    async def event_generator():
+        cancel_token = CancelToken.with_timeout(REQUEST_DEADLINE)
+        token_cancel = current_cancel_token.set(cancel_token)
+        outcome = "disconnected"
+        with recording("storyboard", req.model_dump()) as trace:
+            try:
+                async for frame in protocol.coalesce_events(storyboard_events(req)):
+                    if frame["event"] == protocol.ERROR:
+                        outcome = "error"
+                    yield frame
+                if outcome != "error":
+                    outcome = "completed"
+            finally:
+                if trace:
+                    trace.outcome = outcome
+                if outcome == "disconnected":
+                    cancel_token.cancel("disconnected")
+                current_cancel_token.reset(token_cancel)
+        yield protocol.make_event(protocol.DONE)
+
+    return EventSourceResponse(event_generator(), headers={protocol.PROTOCOL_HEADER: protocol.PROTOCOL_VERSION})
+
+
+# --- 批量生成 API (封面 / 视频批量投放) ---
+class BatchRequest(BaseModel):
+    kind: Literal["image", "video"] = "image"
+    prompts: list[str] = []
+    template: str = ""  # 如 "{topic}主题的封面，{style}风格"
+    variables: dict[str, list[str]] = {}
+    variants: int = 1  # 每个提示词生成的版本数
+
+
+@app.post("/api/batch")
+async def api_batch(req: BatchRequest):
+    """
+    提交批量生成任务并立即返回任务 id；条目在后台按供应商额度并发执行，客户端断开不影响任务。
+    进度经 GET /api/batch/{id}/events 订阅，清单经 GET /api/batch/{id} 查询。
+    """
+    try:
+        manifest = await asyncio.to_thread(batch.submit, req.kind, req.prompts, req.template, req.variables, req.variants)
+    except batch.BatchError as e:
+        return {"status": "error", "message": f"❌ {e}"}
+    return {"status": "success", "id": manifest["id"], "total": manifest["total"], "duplicates": manifest["duplicates"]}
+
+
+@app.get("/api/batch/{job_id}")
+async def get_batch_manifest(job_id: str):
+    manifest = await asyncio.to_thread(batch.get_manifest, job_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="批量任务不存在")
+    return manifest
+
+
+@app.delete("/api/batch/{job_id}")
+async def cancel_batch(job_id: str):
+    if await asyncio.to_thread(batch.cancel, job_id):
+        return {"status": "success"}
+    return {"status": "error", "message": "❌ 批量任务不存在或已结束"}
+
+
+async def batch_events(job_id: str):
+    """轮询清单，把新完成的条目与计数变化转为 (协议事件类型, 负载)；中途连接也会补发此前已完成的条目"""
+    manifest = await asyncio.to_thread(batch.get_manifest, job_id)
+    if manifest is None:
+        yield protocol.ERROR, {"message": "❌ 批量任务不存在"}
+        return
+    yield protocol.BATCH, {
+        "status": "planned",
+        **{key: manifest[key] for key in ("id", "kind", "total", "duplicates")},
+        "items": [{key: item[key] for key in ("index", "prompt", "variant")} for item in manifest["items"]],
+    }
+    reported, counts = set(), None
+    while True:
+        for item in manifest["items"]:
+            if item["index"] in reported or item["status"] not in ("succeeded", "failed"):
+                continue
+            reported.add(item["index"])
+            if item["status"] == "succeeded":
+                yield protocol.MEDIA, {**item["media"], "index": item["index"], "prompt": item["prompt"]}
+            else:
+                yield protocol.BATCH, {"status": "item_failed", "index": item["index"], "message": item["error"]}
+        progress = {key: manifest[key] for key in ("succeeded", "failed", "cancelled", "total")}
+        finished = manifest["status"] != "running"
+        if progress != counts or finished:
+            counts = progress
+            yield protocol.BATCH, {"status": manifest["status"] if finished else "progress", **progress}
+        if finished:
+            return
+        await asyncio.sleep(batch.BATCH_POLL_INTERVAL)
+        manifest = await asyncio.to_thread(batch.get_manifest, job_id)
+
+
+@app.get("/api/batch/{job_id}/events")
+async def stream_batch(job_id: str):
+    """以 SSE 订阅批量任务进度：batch (清单) -> 每条成功一个 media、失败一个 batch/item_failed -> batch (最终计数) -> done"""
+    async def event_generator():
+        async for frame in protocol.coalesce_events(batch_events(job_id)):
+            yield frame
+        yield protocol.make_event(protocol.DONE)
+
+    return EventSourceResponse(event_generator(), headers={protocol.PROTOCOL_HEADER: protocol.PROTOCOL_VERSION})
+
+
+# --- 知识库批量检索 API (离线评测 / 批量任务) ---
+MAX_BATCH_QUERIES = 256
+
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+    k: int = 3
+
+
+@app.post("/api/knowledge/batch_query")
+async def api_batch_query(req: BatchQueryRequest):
+    from app.rag import query_knowledge_base_batch
+
+    if len(req.queries) > MAX_BATCH_QUERIES:
+        return {"status": "error", "message": f"❌ 单次最多支持 {MAX_BATCH_QUERIES} 条查询"}
+
+    contexts = await asyncio.to_thread(query_knowledge_base_batch, req.queries, req.k)
+    return {
+        "status": "success",
+        "results": [{"query": q, "context": c} for q, c in zip(req.queries, contexts)],
+    }
+
+
 # --- 数据模型定义 ---
 class ModelConfig(BaseModel):
     chat: str = "DeepSeek-V3 (SiliconFlow)"
@@ -65,6 +268,76 @@ class ChatRequest(BaseModel):
     video_data: Optional[str] = None  # 👈 新增视频 Base64 接收字段
 
 
+# 需要向前端推送 tool_start 状态的工具
+STREAMED_TOOLS = ["generate_image", "generate_video", "create_storyboard", "analyze_uploaded_image", "analyze_uploaded_video"]
+# 让 LangGraph 在源头过滤事件：只保留大脑的 token 事件、视频分段与分镜进度以及上述工具的起止事件
+STREAM_EVENT_FILTER = {
+    "include_names": [protocol.AGENT_TOKEN_EVENT, protocol.VIDEO_SEGMENT_EVENT, protocol.STORYBOARD_EVENT, *STREAMED_TOOLS]
+}
+
+
+async def translate_storyboard_event(event_type: str, payload: dict) -> tuple[str, dict]:
+    """分镜进度按原事件类型转发，媒体先登记本地镜像"""
+    if event_type == protocol.MEDIA:
+        payload = await asyncio.to_thread(mirror.localize, payload)
+    return event_type, payload
+
+
+async def stream_graph_events(inputs: dict, config: dict):
+    """将图执行事件翻译为 (协议事件类型, 负载)，供 coalesce_events 合并发送"""
+    try:
+        app_graph = await warmup.get_graph()
+        async for event in app_graph.astream_events(inputs, config=config, version="v2", **STREAM_EVENT_FILTER):
+            kind = event["event"]
+
+            # 💬 常规模型文本流
+            if kind == "on_custom_event":
+                if event["name"] == protocol.VIDEO_SEGMENT_EVENT:
+                    yield protocol.SEGMENT, event["data"]
+                elif event["name"] == protocol.STORYBOARD_EVENT:
+                    yield await translate_storyboard_event(event["data"]["event"], event["data"]["payload"])
+                else:
+                    yield protocol.TOKEN, event["data"]
+
+            elif kind == "on_tool_start":
+                yield protocol.TOOL_START, {"tool": event["name"]}
+
+            elif kind == "on_tool_end":
+                # 生成类工具以 artifact 形式返回结构化媒体信息
+                artifact = getattr(event["data"].get("output"), "artifact", None)
+                if artifact:
+                    for media in artifact.get("media", []):
+                        # 登记本地镜像：供应商链接会过期，前端优先使用本地地址
+                        yield protocol.MEDIA, await asyncio.to_thread(mirror.localize, media)
+
+    except Exception as e:
+        print(f"❌ Error in stream: {e}")
+        yield protocol.ERROR, {"message": str(e)}
+
+
+async def admit(limiter, ticket):
+    """排队等待供应商名额，期间推送排队位置；超过 MAX_QUEUE_WAIT 仍未放行则抛出 TimeoutError"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_QUEUE_WAIT
+    last_position = None
+    while not ticket.granted:
+        position = limiter.position(ticket)
+        if position != last_position:
+            yield protocol.make_event(protocol.QUEUED, position=position)
+            last_position = position
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise TimeoutError(f"{limiter.name} 当前繁忙，排队超过 {MAX_QUEUE_WAIT:.0f} 秒，请稍后重试")
+        await ticket.wait(min(remaining, 1.0))
+
+
+async def store_upload(data: str | None) -> str | None:
+    """将前端上传的 Base64 媒体写入共享媒体库，返回内容引用；工具按引用读取，任意 worker 都能访问"""
+    if not data:
+        return None
+    return await asyncio.to_thread(lambda: media_store.put(base64.b64decode(data, validate=True)))
+
+
 # --- 接口定义 ---
 @app.post("/chat/stream")
 async def chat_stream(request: ChatRequest):
@@ -73,73 +346,198 @@ async def chat_stream(request: ChatRequest):
     """
     llm_config = request.llm_config or ModelConfig()
 
-    async def event_generator():
-        token_config = current_model_config.set({"chat": llm_config.chat, "vision": llm_config.vision})
-        token_img = current_image_data.set(request.image_data)
-        token_vid = current_video_data.set(request.video_data)
-        token_vision = current_vision_model.set(llm_config.vision)
+    attachment = "image" if request.image_data else "video" if request.video_data else None
+    user_text = history.wrap_user_text(request.content, attachment)
+
+    inputs = {"messages": [HumanMessage(content=user_text)]}
+
+    config = {
+        "configurable": {
+            "thread_id": request.thread_id,
+            "selected_chat_model": llm_config.chat,
+            "system_prompt": request.system_prompt,
+        }
+    }
 
+    async def event_generator():
+        try:
+            image_ref = await store_upload(request.image_data)
+            video_ref = await store_upload(request.video_data)
+        except binascii.Error as e:
+            yield protocol.make_event(protocol.ERROR, message=f"❌ 媒体数据解码失败: {e}")
+            yield protocol.make_event(protocol.DONE)
+            return
+
+        # 前端可以显式传 vision=null，此时使用预热过的默认视觉模型
+        vision_label = llm_config.vision or warmup.DEFAULT_VISION_MODEL
+        # ContextVar 必须在 coalesce_events 创建生产者任务之前设置，任务会复制当前上下文
+        token_config = current_model_config.set({"chat": llm_config.chat, "vision": vision_label})
+        token_img = current_image_ref.set(image_ref)
+        token_vid = current_video_ref.set(video_ref)
+        token_vision = current_vision_model.set(vision_label)
+        token_speculation = current_speculation.set(set())
+        # 请求级取消令牌：客户端断开时取消，工具线程与视觉预判据此提前退出
+        cancel_token = CancelToken.with_timeout(REQUEST_DEADLINE)
+        token_cancel = current_cancel_token.set(cancel_token)
+
+        limiter = get_limiter(llm_config.chat)
+        ticket = None
+        outcome = "disconnected"
+        metrics.SSE_STREAMS_ACTIVE.inc()
+        # 从这里起的任何异常（包括图片预处理与预判的提交）都要归还名额、复位 ContextVar 与活跃流计数
         try:
-            user_text = request.content
-            if request.image_data:
-                user_text = f"【系统提示：用户在本次对话中附带上传了一张图片。请立刻调用 'analyze_uploaded_image' 工具进行解析。】\n\n用户输入：{request.content}"
-            elif request.video_data:
-                user_text = f"【系统提示：用户在本次对话中附带上传了一段视频。请立刻调用 'analyze_uploaded_video' 工具进行抽帧与解析。】\n\n用户输入：{request.content}"
-
-            inputs = {"messages": [HumanMessage(content=user_text)]}
-
-            config = {
-                "configurable": {
-                    "thread_id": request.thread_id,
-                    "selected_chat_model": llm_config.chat,
-                    "system_prompt": request.system_prompt,
-                }
-            }
-
-            async for event in app_graph.astream_events(inputs, config=config, version="v1"):
-                kind = event["event"]
-
-                if kind == "on_tool_start":
-                    if event.get("name") == "generate_image":
-                        yield {"data": "[SIGNAL_TOOL_START:generate_image]"}
-                    elif event.get("name") == "analyze_uploaded_image":
-                        yield {"data": "[SIGNAL_TOOL_START:analyze_image]"}
-                    elif event.get("name") == "analyze_uploaded_video":
-                        yield {"data": "[SIGNAL_TOOL_START:analyze_video]"}
-                    elif event.get("name") == "generate_video":
-                        yield {"data": "[SIGNAL_TOOL_START:generate_video]"}
-
-                elif kind == "on_tool_end":
-                    tool_name = event.get("name")
-                    output = event["data"].get("output")
-                    if not output:
-                        pass
-                    elif tool_name == "generate_image":
-                        url_match = re.search(r'\[System Hidden URL:\s*(https?://[^\s\]]+)\]', str(output))
-                        if url_match:
-                            yield {"data": f"[SIGNAL_IMAGE_URL:{url_match.group(1)}]"}
-                    elif tool_name == "generate_video":
-                        url_match = re.search(r'\[System Hidden Video URL:\s*(https?://[^\s\]]+)\]', str(output))
-                        if url_match:
-                            yield {"data": f"[SIGNAL_VIDEO_URL:{url_match.group(1)}]"}
-
-                # 💬 常规模型文本流
-                elif kind == "on_chat_model_stream":
-                    chunk = event["data"]["chunk"]
-                    if chunk.content:
-                        yield {"data": chunk.content}
-
-        except Exception as e:
-            print(f"❌ Error in stream: {e}")
-            yield {"data": f"[ERROR] {str(e)}"}
+            with recording("chat", request.model_dump()) as trace:
+                try:
+                    # 图片预处理（解码、缩放、重新编码）不涉及模型调用，总是提前在后台进行
+                    if image_ref:
+                        vision.prepare_image(image_ref, vision_label)
+                    # 预判执行：大脑几乎必然先调用视觉工具，媒体解析与排队、大脑第一跳并行进行
+                    if vision.SPECULATIVE_VISION:
+                        if image_ref:
+                            vision.prefetch("image", image_ref, vision_label)
+                        if video_ref:
+                            vision.prefetch("video", video_ref, vision_label)
+                    # 纯文本轮次先查回答缓存，命中时不排队、不调用模型
+                    probe = None
+                    if response_cache.RESPONSE_CACHE and not image_ref and not video_ref:
+                        app_graph = await warmup.get_graph()
+                        try:
+                            probe = await response_cache.lookup(app_graph, config, request.content)
+                        except Exception as e:
+                            print(f"⚠️ 回答缓存查询失败，按未命中处理: {e}")
+                    if probe and probe.answer is not None:
+                        for frame in response_cache.replay(probe.answer):
+                            if trace:
+                                trace.mark_first_token()
+                            yield frame
+                        await response_cache.commit(app_graph, config, request.content, probe.answer)
+                        outcome = "cached"
+                    else:
+                        ticket = limiter.enqueue()
+                        async for frame in admit(limiter, ticket):
+                            yield frame
+                        events = stream_graph_events(inputs, config)
+                        if probe:
+                            events = response_cache.capture(events, probe)
+                        async for frame in protocol.coalesce_events(events):
+                            if frame["event"] == protocol.ERROR:
+                                outcome = "error"
+                            elif trace and frame["event"] == protocol.TOKEN:
+                                trace.mark_first_token()
+                            yield frame
+                        if outcome != "error":
+                            outcome = "completed"
+                except (QueueFullError, TimeoutError) as e:
+                    print(f"⚠️ 准入拒绝: {e}")
+                    outcome = "rejected"
+                    yield protocol.make_event(protocol.ERROR, message=str(e))
+                finally:
+                    if trace:
+                        trace.outcome = outcome
         finally:
-            yield {"data": "[DONE]"}
+            metrics.SSE_STREAMS_ACTIVE.dec()
+            metrics.SSE_STREAMS.inc(outcome)
+            if ticket:
+                limiter.release(ticket)
+            if outcome == "disconnected":
+                cancel_token.cancel("disconnected")
+            current_cancel_token.reset(token_cancel)
             current_model_config.reset(token_config)
-            current_image_data.reset(token_img)
-            current_video_data.reset(token_vid)
+            current_image_ref.reset(token_img)
+            current_video_ref.reset(token_vid)
             current_vision_model.reset(token_vision)
+            current_speculation.reset(token_speculation)
+        yield protocol.make_event(protocol.DONE)
 
-    return EventSourceResponse(event_generator())
+    return EventSourceResponse(
+        event_generator(),
+        headers={protocol.PROTOCOL_HEADER: protocol.PROTOCOL_VERSION},
+    )
+
+
+@app.get("/history/{thread_id}")
+async def get_history(
+    thread_id: str,
+    before: Optional[int] = Query(None, ge=0, description="只返回 id 小于该值的记录，用于向前翻页"),
+    limit: int = Query(history.HISTORY_PAGE_SIZE, ge=1, le=history.HISTORY_MAX_PAGE_SIZE),
+):
+    """
+    分页读取会话历史（来自对话检查点），默认返回最近一页。
+    响应中 before 为继续向前翻页的游标，已到会话开头时为 null。
+    """
+    app_graph = await warmup.get_graph()
+    state = await app_graph.aget_state({"configurable": {"thread_id": thread_id}})
+    messages = state.values.get("messages", []) if state and state.values else []
+    checkpoint_id = (state.config or {}).get("configurable", {}).get("checkpoint_id") if state else None
+    records = history.compacted(thread_id, checkpoint_id, messages)
+    window, cursor = history.page(records, before, limit)
+
+    def localize(record: dict) -> dict:
+        # 媒体引用补上本地镜像地址；缓存中的记录保持不变
+        return {
+            **record,
+            "images": [mirror.localize(media) for media in record["images"]],
+            "videos": [mirror.localize(media) for media in record["videos"]],
+        }
+
+    return {
+        "thread_id": thread_id,
+        "messages": await asyncio.to_thread(lambda: [localize(record) for record in window]),
+        "before": cursor,
+        "total": len(records),
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """预热完成返回 200，预热中或失败返回 503"""
+    code = 200 if warmup.status["state"] == "ready" else 503
+    return JSONResponse(warmup.status, status_code=code)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/media/{asset_id}")
+async def get_media(
+    request: Request,
+    asset_id: str = Path(pattern="^[0-9a-f]{32}$"),
+    variant: Literal["original", "thumbnail", "poster"] = "original",
+):
+    """
+    提供镜像到本地的生成媒体：内容寻址，ETag 命中返回 304，视频支持 Range 请求。
+    镜像仍在下载时最多等待 MIRROR_WAIT 秒，仍未就绪（或下载失败）则重定向到供应商原始链接。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + mirror.MIRROR_WAIT
+    record = await asyncio.to_thread(mirror.lookup, asset_id)
+    while record and record["status"] == "downloading" and loop.time() < deadline:
+        await asyncio.sleep(0.2)
+        record = await asyncio.to_thread(mirror.lookup, asset_id)
+    if record is None:
+        return JSONResponse({"status": "not_found"}, status_code=404)
+    if record["status"] != "ready":
+        if variant == "poster":
+            return JSONResponse({"status": record["status"]}, status_code=404)
+        return RedirectResponse(record["source_url"], status_code=307)
+
+    path = mirror.variant_path(record, variant)
+    if path is None:
+        # 缩略图生成失败时回退为原件；封面没有可替代的内容
+        if variant == "poster":
+            return JSONResponse({"status": "not_found"}, status_code=404)
+        variant, path = "original", mirror.variant_path(record, "original")
+    if not await asyncio.to_thread(mirror.touch, asset_id, record):
+        # 已被容量清理删除
+        return RedirectResponse(record["source_url"], status_code=307)
+    media_type = record["content_type"] if variant == "original" else "image/jpeg"
+    # 内容寻址的文件永不改变，可长期缓存
+    headers = {"ETag": f'"{record["sha256"][:32]}-{variant}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 
 @app.post("/upload")
@@ -147,20 +545,106 @@ async def upload_file(file: UploadFile = File(...)):
     return {"filename": file.filename, "status": "success"}
 
 
+@app.get("/api/trending/status")
+async def get_trending_status():
+    """热榜入库状态：上次刷新时间、各来源新增 / 更新条数与过期条数"""
+    return {
+        "sources": [source.name for source in trending.build_sources()],
+        "interval": trending.TRENDING_INTERVAL,
+        "last": progress_store.get(trending.STATUS_KEY),
+    }
+
+
+# --- 管理接口 ---
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    """管理接口要求请求头 X-Admin-Token 与 ADMIN_TOKEN 一致；未设置 ADMIN_TOKEN 时管理接口一律拒绝"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="admin endpoints are disabled: ADMIN_TOKEN is not set")
+    if not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="invalid admin token")
+
+
+@app.post("/admin/trending/refresh", dependencies=[Depends(require_admin)])
+async def refresh_trending():
+    """立即刷新一次热榜，不等下一个调度周期；会拉取所有来源并为新条目向量化，因此只对管理员开放"""
+    if not trending.TRENDING_SOURCES:
+        return {"status": "error", "message": "❌ 未配置 TRENDING_SOURCES"}
+    return {"status": "success", **await trending.refresh_async()}
+
+
+@app.get("/admin/snapshot/export", dependencies=[Depends(require_admin)])
+async def export_knowledge_snapshot(collection: Literal["knowledge", "trending"] = "knowledge"):
+    """导出向量集合为快照文件并直接下载，下载完成后删除服务端的临时文件"""
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        report = await asyncio.to_thread(snapshot.export_snapshot, path, collection)
+    except Exception as e:
+        os.remove(path)
+        return {"status": "error", "message": f"❌ 导出失败: {e}"}
+    filename = f"{collection}-{time.strftime('%Y%m%d-%H%M%S')}.parquet"
+    return FileResponse(
+        path,
+        media_type="application/vnd.apache.parquet",
+        filename=filename,
+        headers={"X-Snapshot-Rows": str(report["exported"])},
+        background=BackgroundTask(os.remove, path),
+    )
+
+
+def restore_snapshot(path: str, collection: str, replace: bool):
+    try:
+        snapshot.import_snapshot(path, collection, replace=replace)
+    except Exception as e:
+        print(f"❌ 快照导入失败: {e}")
+    finally:
+        os.remove(path)
+
+
+@app.post("/admin/snapshot/import", dependencies=[Depends(require_admin)])
+async def import_knowledge_snapshot(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    collection: Literal["knowledge", "trending"] = "knowledge",
+    replace: bool = False,
+):
+    """
+    上传快照文件，校验文件元数据后在后台导入（不调用 Embedding 接口）；
+    进度与结果通过 /knowledge_status?filename=snapshot:<collection> 查询
+    """
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    with os.fdopen(fd, "wb") as f:
+        await asyncio.to_thread(shutil.copyfileobj, file.file, f, 1 << 20)
+    try:
+        info = snapshot.read_info(path)
+        snapshot.check_collection(info, collection)
+    except Exception as e:
+        os.remove(path)
+        return {"status": "error", "message": f"❌ 快照文件无效: {e}"}
+    background_tasks.add_task(restore_snapshot, path, collection, replace)
+    return {"status": "success", "task": snapshot.progress_key(collection), "rows": info["rows"], "dimension": info["dimension"]}
+
+
 @app.get("/knowledge_status")
 async def get_knowledge_status(filename: str):
-    from app.rag import knowledge_progress
+    return progress_store.get(filename) or {"status": "not_found"}
 
-    return knowledge_progress.get(filename, {"status": "not_found"})
+
+@app.get("/api/knowledge/ingest_status")
+async def get_ingest_status():
+    """入库调度器当前的任务：进行中（含进度与是否走小任务通道）、排队中与在途批次数"""
+    return ingest.scheduler.status()
 
 
 @app.post("/upload_knowledge")
-async def upload_knowledge(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_knowledge(file: UploadFile = File(...), tenant: str = Form(default="")):
     """
-    接收前端上传的文档，解析出纯文本后送入 RAG 知识库（后台异步入库，立即返回）
+    接收前端上传的文档，解析出纯文本后交给入库调度器（在专用线程池中与其他上传公平共享 Embedding 额度，立即返回）。
+    tenant 为空时每个上传各自算一个租户。
     """
-    from app.rag import add_to_knowledge_base
-
     content = ""
     try:
         if file.filename.lower().endswith(".txt"):
@@ -188,7 +672,9 @@ async def upload_knowledge(background_tasks: BackgroundTasks, file: UploadFile =
         if not content.strip():
             return {"status": "error", "message": "❌ 文件内容为空或无法解析"}
 
-        background_tasks.add_task(add_to_knowledge_base, content, file.filename)
+        payload = {"format": os.path.splitext(file.filename)[1].lower(), "chars": len(content)}
+        # 开启流量录制时记录文档规模与入库耗时（不记录文件名与正文）
+        await asyncio.to_thread(ingest.scheduler.submit, content, file.filename, tenant, payload)
         approx_chunks = max(1, len(content) // 500)
         return {
             "status": "success",
@@ -0,0 +1,168 @@
+# app/metrics.py
+"""
+轻量级 Prometheus 指标（文本暴露格式 0.0.4），通过 /metrics 导出。
+`+=` 这类读-改-写在 GIL 下并不是原子的，线程切换可能落在读与写之间而丢失更新；
+因此每个子指标（一组标签值）持有一把锁，更新与导出时的读取都在锁内完成，直方图的分桶、总和与计数彼此一致。
+锁的粒度是单个子指标，不同标签之间互不阻塞，可以常驻生产环境。不要在逐 token 的路径上打点。
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 默认延迟分桶 (秒)，覆盖 5ms ~ 5min
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _child(self, labels: tuple):
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children.setdefault(labels, self._new_child())
+        return child
+
+    def _label_str(self, labels: tuple, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, child in list(self._children.items()):
+            lines.extend(self._render_child(labels, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, *labels, amount: float = 1.0):
+        child = self._child(labels)
+        with child.lock:
+            child.value += amount
+
+    def _render_child(self, labels, child):
+        with child.lock:
+            value = child.value
+        return [f"{self.name}{self._label_str(labels)} {value}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0):
+        child = self._child(labels)
+        with child.lock:
+            child.value -= amount
+
+    def set(self, *labels, value: float):
+        child = self._child(labels)
+        with child.lock:
+            child.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("counts", "sum", "count", "lock")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        # 最后一格为 +Inf
+        return _HistogramValue(len(self.buckets) + 1)
+
+    def observe(self, *labels, value: float):
+        child = self._child(labels)
+        index = bisect_left(self.buckets, value)
+        with child.lock:
+            child.counts[index] += 1
+            child.sum += value
+            child.count += 1
+
+    def _render_child(self, labels, child):
+        # 先在锁内取快照，保证导出的 +Inf 分桶与 _count 相等
+        with child.lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines, cumulative = [], 0
+        for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            bucket_labels = self._label_str(labels, 'le="' + le + '"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(labels)} {total}")
+        lines.append(f"{self.name}_count{self._label_str(labels)} {count}")
+        return lines
+
+
+@contextmanager
+def timer(histogram: Histogram, *labels):
+    """统计代码块耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(*labels, value=time.perf_counter() - start)
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- 指标定义 ---
+GRAPH_NODE_SECONDS = Histogram("mediacraft_graph_node_seconds", "LangGraph 节点执行耗时", ["node"])
+LLM_TTFT_SECONDS = Histogram("mediacraft_llm_ttft_seconds", "对话模型首个 token 延迟", ["model"])
+LLM_FAILOVERS = Counter("mediacraft_llm_failovers_total", "对话模型调用失败并切换供应商的次数", ["model"])
+LLM_HEDGES = Counter("mediacraft_llm_hedges_total", "因首字超时发起的对冲请求次数", ["model"])
+TOOL_SECONDS = Histogram("mediacraft_tool_seconds", "工具执行耗时", ["tool"])
+TOOL_ERRORS = Counter("mediacraft_tool_errors_total", "工具执行失败次数", ["tool"])
+TOOL_OUTPUT_BYTES = Counter("mediacraft_tool_output_bytes_total", "检索类工具结果的字节数，按预算摘录前后区分", ["tool", "stage"])
+RAG_STAGE_SECONDS = Histogram("mediacraft_rag_stage_seconds", "RAG 各阶段耗时", ["stage"])
+INGEST_CHUNKS = Counter("mediacraft_ingest_chunks_total", "成功写入向量库的知识块数")
+INGEST_BATCH_SECONDS = Histogram("mediacraft_ingest_batch_seconds", "单批知识块向量化入库耗时")
+SSE_STREAMS_ACTIVE = Gauge("mediacraft_sse_streams_active", "当前进行中的流式对话数")
+SSE_STREAMS = Counter("mediacraft_sse_streams_total", "流式对话数，按结束方式区分", ["outcome"])
+CACHE_REQUESTS = Counter("mediacraft_cache_requests_total", "缓存查询次数", ["cache", "result"])
+CANCELLED_WORK = Counter("mediacraft_cancelled_work_total", "因客户端断开或超时而提前中止的工作", ["stage", "reason"])
+BATCH_ITEMS = Counter("mediacraft_batch_items_total", "批量生成的条目数，按结果区分", ["kind", "result"])
+MIRROR_DOWNLOADS = Counter("mediacraft_mirror_downloads_total", "生成媒体镜像到本地的下载次数，按结果区分", ["kind", "result"])
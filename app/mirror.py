@@ -0,0 +1,292 @@
+# app/mirror.py
+"""
+生成媒体的本地镜像：火山引擎返回的图片 / 视频链接会过期，且前端每次重跑都会重新拉取原图。
+生成结果推送给前端时即登记镜像并在后台流式下载一次，按内容哈希存到磁盘，同时生成缩略图（视频另生成封面），
+之后通过 GET /media/{asset_id} 从本地提供：带 ETag 与长期缓存头，支持 HTTP Range，视频拖动进度条无需完整下载。
+
+镜像记录保存在 progress_store（键为 mirror:{asset_id}），文件位于 MIRROR_DIR；
+STATE_BACKEND=sqlite 时同一节点的各 worker 共享，下载由登记镜像的 worker 完成，其他 worker 只读。
+下载失败（如供应商链接已过期）的媒体按指数退避重试，退避期内再次登记不会重新下载。
+
+容量：原件的修改时间记录最后访问时间（提供时刷新）。下载完成后最多每 MIRROR_SWEEP_INTERVAL 秒清理一次：
+超过 MIRROR_TTL 未访问的媒体删除，之后总量仍超出 MIRROR_TOTAL_BYTES 时按最后访问时间从旧到新删除，
+连同缩略图、封面与指向它的镜像记录；被删除的媒体再次推送时重新镜像，在此之前 /media 重定向到原始链接。
+"""
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import imageprep
+from app.metrics import MIRROR_DOWNLOADS
+from app.profiling import span
+from app.state import STATE_DIR, progress_store
+
+MEDIA_MIRROR = os.getenv("MEDIA_MIRROR", "1") == "1"
+MIRROR_DIR = os.getenv("MIRROR_DIR") or os.path.join(STATE_DIR, "mirror")
+MIRROR_MAX_BYTES = int(os.getenv("MIRROR_MAX_BYTES", str(1024 * 1024 * 1024)))  # 单个媒体的大小上限
+MIRROR_WAIT = 10.0  # 请求到达时镜像仍在下载，最多等待的秒数，超时后重定向到原始链接
+MIRROR_STALE = 600.0  # 下载中的记录超过该秒数未完成（如 worker 重启）视为失效，再次登记时重新下载
+MIRROR_RETRY_BACKOFF = 600.0  # 下载失败后再次登记时重试的最短间隔 (秒)，每失败一次翻倍
+MIRROR_RETRY_MAX = 24 * 3600.0
+MIRROR_TOTAL_BYTES = int(os.getenv("MIRROR_TOTAL_BYTES", str(20 * 1024 * 1024 * 1024)))  # 镜像目录总容量
+MIRROR_TTL = float(os.getenv("MIRROR_TTL", str(30 * 24 * 3600)))  # 未被访问的媒体保留时长 (秒)
+MIRROR_SWEEP_INTERVAL = 600.0
+MIRROR_TOUCH_INTERVAL = 3600.0  # 刷新最后访问时间的最小间隔，避免每个 Range 请求都写一次元数据
+THUMBNAIL_SIDE = 512
+POSTER_SIDE = 1280
+CHUNK_SIZE = 1024 * 1024
+
+_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "video/mp4": ".mp4"}
+
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mirror")
+_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+class MirrorError(Exception):
+    """镜像下载或处理失败"""
+
+
+def asset_id_of(url: str) -> str:
+    # 每个生成结果的链接唯一，同一链接重复推送（如重放历史）只下载一次
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+
+def _key(asset_id: str) -> str:
+    return f"mirror:{asset_id}"
+
+
+def lookup(asset_id: str) -> dict | None:
+    return progress_store.get(_key(asset_id))
+
+
+def _content_path(sha256: str, suffix: str) -> str:
+    return os.path.join(MIRROR_DIR, sha256[:2], f"{sha256}{suffix}")
+
+
+def variant_path(record: dict, variant: str) -> str | None:
+    """镜像就绪后某个变体的文件路径；该媒体没有此变体时返回 None"""
+    if variant == "original":
+        return _content_path(record["sha256"], record["extension"])
+    if variant in record.get("variants", []):
+        return _content_path(record["sha256"], f".{variant}.jpg")
+    return None
+
+
+def touch(asset_id: str, record: dict) -> bool:
+    """
+    提供镜像前刷新原件的最后访问时间；原件已被清理时删除记录并返回 False，
+    调用方回退到原始链接，下次推送时重新镜像。
+    """
+    path = variant_path(record, "original")
+    try:
+        if time.time() - os.stat(path).st_mtime > MIRROR_TOUCH_INTERVAL:
+            os.utime(path)
+        return True
+    except FileNotFoundError:
+        progress_store.delete(_key(asset_id))
+        return False
+
+
+def _retry_due(record: dict, now: float) -> bool:
+    """失败的镜像是否已过退避期；供应商链接过期后每次重放历史都会登记，不能每次都重新下载"""
+    backoff = min(MIRROR_RETRY_MAX, MIRROR_RETRY_BACKOFF * 2 ** (record.get("attempts", 1) - 1))
+    return now - record.get("failed_at", record["created"]) > backoff
+
+
+def localize(media: dict) -> dict:
+    """
+    为 {"kind", "url"} 形式的媒体登记镜像并开始后台下载，返回补充了本地地址的副本：
+    local_url / thumbnail_url，视频另有 poster_url（均为相对后端根路径的地址）。
+    下载失败且仍在退避期内的媒体原样返回，前端直接使用原始链接。
+    """
+    if not MEDIA_MIRROR or not media.get("url"):
+        return media
+    asset_id = asset_id_of(media["url"])
+    now = time.time()
+    with _lock:
+        record = lookup(asset_id)
+        if record is not None and record["status"] == "failed" and not _retry_due(record, now):
+            return media
+        stale = record is not None and record["status"] == "downloading" and now - record["created"] > MIRROR_STALE
+        if record is None or record["status"] == "failed" or stale:
+            progress_store.set(_key(asset_id), {
+                "status": "downloading", "kind": media["kind"], "source_url": media["url"], "created": now,
+                "attempts": record.get("attempts", 0) if record else 0,
+            })
+            _pool.submit(_download, asset_id, media["url"], media["kind"])
+    localized = {
+        **media,
+        "local_url": f"/media/{asset_id}",
+        "thumbnail_url": f"/media/{asset_id}?variant=thumbnail",
+    }
+    if media["kind"] == "video":
+        localized["poster_url"] = f"/media/{asset_id}?variant=poster"
+    return localized
+
+
+def _fetch(url: str) -> tuple[str, str, int, str]:
+    """流式下载到 MIRROR_DIR 下的临时文件，边下载边计算哈希，返回 (临时路径, sha256, 字节数, Content-Type)"""
+    import requests
+
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    tmp_path = os.path.join(MIRROR_DIR, f".download.{os.getpid()}.{threading.get_ident()}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with requests.get(url, stream=True, timeout=(10, 60)) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > MIRROR_MAX_BYTES:
+                        raise MirrorError(f"媒体超过 {MIRROR_MAX_BYTES} 字节上限")
+                    digest.update(chunk)
+                    f.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size, content_type
+
+
+def _write_variant(path: str, data: bytes | None):
+    if data is None or os.path.exists(path):
+        return
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _video_poster(path: str):
+    """取第 1 秒（不足 1 秒取首帧）的画面作为封面"""
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        if fps > 0 and frames > fps:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(fps))
+        ok, frame = cap.read()
+    finally:
+        cap.release()
+    if not ok:
+        raise MirrorError("无法读取视频画面")
+    return frame
+
+
+def _derive(kind: str, path: str, sha256: str) -> list[str]:
+    """生成缩略图与封面，返回已有的变体名"""
+    if kind == "video":
+        poster = _video_poster(path)
+        _write_variant(_content_path(sha256, ".poster.jpg"), imageprep.encode_jpeg(imageprep.fit(poster, POSTER_SIDE, POSTER_SIDE ** 2)))
+        thumbnail = imageprep.fit(poster, THUMBNAIL_SIDE, THUMBNAIL_SIDE ** 2)
+        _write_variant(_content_path(sha256, ".thumbnail.jpg"), imageprep.encode_jpeg(thumbnail))
+        return ["thumbnail", "poster"]
+    with open(path, "rb") as f:
+        data = f.read()
+    mime, thumbnail = imageprep.preprocess(data, THUMBNAIL_SIDE, THUMBNAIL_SIDE ** 2)
+    if mime != "image/jpeg":
+        return []
+    _write_variant(_content_path(sha256, ".thumbnail.jpg"), thumbnail)
+    return ["thumbnail"]
+
+
+def _download(asset_id: str, url: str, kind: str):
+    try:
+        with span("mirror:download"):
+            tmp_path, sha256, size, content_type = _fetch(url)
+        if not content_type.startswith(("image/", "video/")):
+            content_type = "video/mp4" if kind == "video" else "image/jpeg"
+        extension = _EXTENSIONS.get(content_type, "")
+        path = _content_path(sha256, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 相同内容只存一份；先写临时文件再原子改名，读取方不会看到半个文件
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        with span("mirror:derive"):
+            try:
+                variants = _derive(kind, path, sha256)
+            except Exception as e:
+                # 缩略图失败不影响原件，前端回退为原件
+                print(f"⚠️ 镜像缩略图生成失败 {asset_id}: {e}")
+                variants = []
+    except Exception as e:
+        MIRROR_DOWNLOADS.inc(kind, "error")
+        print(f"❌ 媒体镜像下载失败 {asset_id}: {e}")
+        attempts = (lookup(asset_id) or {}).get("attempts", 0) + 1
+        progress_store.update(_key(asset_id), status="failed", error=str(e), failed_at=time.time(), attempts=attempts)
+        return
+    MIRROR_DOWNLOADS.inc(kind, "success")
+    progress_store.update(
+        _key(asset_id), status="ready", sha256=sha256, size=size, content_type=content_type,
+        extension=extension, variants=variants,
+    )
+    _maybe_sweep()
+
+
+def _maybe_sweep():
+    global _last_sweep
+    now = time.monotonic()
+    with _lock:
+        if now - _last_sweep < MIRROR_SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    try:
+        sweep()
+    except Exception as e:
+        print(f"⚠️ 媒体镜像清理失败: {e}")
+
+
+def sweep() -> dict:
+    """按保留时长与总容量清理镜像目录，返回删除的媒体数与释放的字节数"""
+    # 同一内容的原件与各变体按哈希归为一组；只有原件会被刷新修改时间，组内最大值即最后访问时间
+    groups: dict[str, dict] = {}
+    for directory, _, names in os.walk(MIRROR_DIR):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.startswith(".download."):
+                # 中断的下载留下的临时文件
+                if time.time() - stat.st_mtime > MIRROR_STALE:
+                    _remove(path)
+                continue
+            group = groups.setdefault(name.partition(".")[0], {"paths": [], "size": 0, "accessed": 0.0})
+            group["paths"].append(path)
+            group["size"] += stat.st_size
+            group["accessed"] = max(group["accessed"], stat.st_mtime)
+    total = sum(group["size"] for group in groups.values())
+    cutoff = time.time() - MIRROR_TTL
+    evicted, freed = set(), 0
+    for sha256, group in sorted(groups.items(), key=lambda item: item[1]["accessed"]):
+        if group["accessed"] >= cutoff and total <= MIRROR_TOTAL_BYTES:
+            break
+        for path in group["paths"]:
+            _remove(path)
+        total -= group["size"]
+        freed += group["size"]
+        evicted.add(sha256)
+    # 指向已删除内容的记录，以及过期的失败记录
+    for key, record in progress_store.scan("mirror:"):
+        if record.get("sha256") in evicted or (record["status"] == "failed" and record.get("failed_at", record["created"]) < cutoff):
+            progress_store.delete(key)
+    if evicted:
+        print(f"🧹 媒体镜像清理：删除 {len(evicted)} 个媒体，释放 {freed / 1024 / 1024:.1f} MB")
+    return {"evicted": len(evicted), "freed": freed}
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,84 @@
+# app/mosaic.py
+"""
+关键帧拼图：把多帧缩小后拼成带序号与时间戳的网格图，一次请求只发送一两张图片。
+视觉模型的延迟与计费随图片数量和图像 token 增长，而超过单图分辨率上限的部分供应商会自行缩放，
+所以拼图按各模型的上限排布：优先少出图，其次让每格尽量大，格子过小时再拆成多张。
+"""
+import math
+
+import cv2
+import numpy as np
+
+MIN_TILE_SIDE = 224  # 格子短边下限，再小画面里的文字与细节就难以辨认
+BORDER = 2  # 格子之间的白色分隔线宽度 (像素)，每格四周各一半
+
+
+def plan_grid(
+    count: int, aspect: float, max_side: int, max_pixels: int, max_tile_side: int, min_tile_side: int = MIN_TILE_SIDE
+) -> tuple[int, int, int, int, int]:
+    """
+    为 count 张宽高比为 aspect 的帧排布拼图，返回 (拼图张数, 列数, 行数, 格宽, 格高)。
+    每格长边不超过 max_tile_side，拼图不超过模型的边长与总像素上限。
+    """
+    # max_tile_side 本身就小于下限时以它为准，只有被模型上限挤小的格子才需要拆成多张
+    floor = min(min_tile_side, max_tile_side / max(aspect, 1 / aspect))
+    for sheets in range(1, count + 1):
+        per_sheet = math.ceil(count / sheets)
+        best = None
+        for cols in range(1, per_sheet + 1):
+            rows = math.ceil(per_sheet / cols)
+            tile_w = min(
+                max_tile_side if aspect >= 1 else max_tile_side * aspect,
+                max_side / cols,
+                max_side / rows * aspect,
+                math.sqrt(max_pixels / (cols * rows) * aspect),
+            )
+            if best is None or tile_w > best[2]:
+                best = (cols, rows, tile_w)
+        cols, rows, tile_w = best
+        tile_h = tile_w / aspect
+        if min(tile_w, tile_h) >= floor - 1 or sheets == count:
+            # 取偶数尺寸，JPEG 色度采样更友好
+            return sheets, cols, rows, int(tile_w) // 2 * 2, int(tile_h) // 2 * 2
+    raise ValueError("count 必须大于 0")
+
+
+def _draw_label(tile: np.ndarray, text: str):
+    """左上角压暗一块区域后写白字，标注在任何画面上都清晰可读"""
+    scale = max(0.4, tile.shape[0] / 480)
+    thickness = max(1, round(scale * 1.5))
+    (text_w, text_h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    pad = max(2, text_h // 3)
+    box_h, box_w = text_h + baseline + 2 * pad, text_w + 2 * pad
+    tile[:box_h, :box_w] //= 4
+    cv2.putText(tile, text, (pad, pad + text_h), cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), thickness, cv2.LINE_AA)
+
+
+def build_mosaics(
+    frames: list[np.ndarray], labels: list[str], max_side: int, max_pixels: int, max_tile_side: int
+) -> tuple[list[np.ndarray], tuple[int, int]]:
+    """
+    将同尺寸的 BGR 帧按时间顺序拼成网格图（从左到右、从上到下），返回 (拼图列表, (行数, 列数))。
+    labels 为每格左上角的标注，只支持 ASCII。
+    """
+    height, width = frames[0].shape[:2]
+    max_tile_side = min(max_tile_side, max(height, width))
+    sheets, cols, rows, tile_w, tile_h = plan_grid(len(frames), width / height, max_side, max_pixels, max_tile_side)
+    inner_w, inner_h = tile_w - BORDER, tile_h - BORDER
+
+    tiles = np.stack([cv2.resize(frame, (inner_w, inner_h), interpolation=cv2.INTER_AREA) for frame in frames])
+    for tile, label in zip(tiles, labels):
+        _draw_label(tile, label)
+    half = BORDER // 2
+    tiles = np.pad(tiles, ((0, 0), (half, BORDER - half), (half, BORDER - half), (0, 0)), constant_values=255)
+
+    per_sheet = math.ceil(len(frames) / sheets)
+    mosaics = []
+    for start in range(0, len(tiles), per_sheet):
+        chunk = tiles[start:start + per_sheet]
+        if len(chunk) < cols * rows:
+            blank = np.full((cols * rows - len(chunk), tile_h, tile_w, 3), 255, dtype=tiles.dtype)
+            chunk = np.concatenate([chunk, blank])
+        # (rows*cols, h, w, 3) -> (rows, h, cols, w, 3) -> 一整张 (rows*h, cols*w, 3)
+        mosaics.append(chunk.reshape(rows, cols, tile_h, tile_w, 3).swapaxes(1, 2).reshape(rows * tile_h, cols * tile_w, 3))
+    return mosaics, (rows, cols)
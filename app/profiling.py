@@ -0,0 +1,195 @@
+# app/profiling.py
+"""
+按请求开启的性能剖析：
+- 在服务端设置 ALLOW_PROFILING=1 后，请求携带 `X-Profile: 1` 请求头或 `?profile=1` 参数即为该请求开启剖析
+- 采样线程以 PROFILE_INTERVAL 间隔抓取进程内所有线程的调用栈，生成 speedscope 文件
+- span() 记录节点 / 工具 / 上游调用组成的结构化 span 树
+span 同时写入流量录制 (app/recorder.py)。两者都未开启时 span() 只有两次 ContextVar 读取，不会启动任何线程。
+注意：采样覆盖整个进程，并发较高时其他请求的栈也会出现在火焰图中。
+"""
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+from app.recorder import current_trace
+
+PROFILING_ALLOWED = os.getenv("ALLOW_PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "profiles"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_HEADER = "x-profile"
+PROFILED_PREFIXES = ("/chat/stream", "/api/")
+
+current_profile: ContextVar["Profile | None"] = ContextVar("profile", default=None)
+_current_span: ContextVar[int | None] = ContextVar("profile_span", default=None)
+_span_ids = itertools.count(1)
+_NOOP = nullcontext()
+
+
+class Profile:
+    def __init__(self, name: str):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.name = name
+        self.t0 = time.perf_counter()
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+        # 帧去重表与每个线程的采样序列
+        self._frames: dict[tuple, int] = {}
+        self._samples: dict[str, list[tuple[float, list[int]]]] = {}
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id}", daemon=True)
+
+    def start(self):
+        self._sampler.start()
+
+    def now(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def add_span(self, record: dict):
+        with self._lock:
+            self.spans.append(record)
+
+    def _frame_index(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frames.get(key)
+        if index is None:
+            index = self._frames[key] = len(self._frames)
+        return index
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        names = {}
+        while not self._stop.wait(PROFILE_INTERVAL):
+            at = self.now()
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_index(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                if ident not in names:
+                    thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                    names[ident] = f"{thread.name if thread else 'thread'}-{ident}"
+                self._samples.setdefault(names[ident], []).append((at, stack))
+
+    def _span_tree(self) -> list[dict]:
+        nodes = {s["id"]: {**s, "children": []} for s in self.spans}
+        roots = []
+        for node in sorted(nodes.values(), key=lambda n: n["start"]):
+            parent = nodes.get(node["parent"])
+            (parent["children"] if parent else roots).append(node)
+        return roots
+
+    def _speedscope(self, end: float) -> dict:
+        frames = [None] * len(self._frames)
+        for (name, filename, line), index in self._frames.items():
+            frames[index] = {"name": name, "file": filename, "line": line}
+        profiles = []
+        for thread_name, samples in self._samples.items():
+            if not samples:
+                continue
+            weights = [b[0] - a[0] for a, b in zip(samples, samples[1:])] + [PROFILE_INTERVAL]
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "seconds",
+                "startValue": samples[0][0],
+                "endValue": end,
+                "samples": [stack for _, stack in samples],
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "mediacraft",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def stop_and_write(self) -> str:
+        """停止采样并写出 <id>.speedscope.json 与 <id>.spans.json，返回 speedscope 文件路径"""
+        self._stop.set()
+        self._sampler.join()
+        end = self.now()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, self.id)
+        with open(f"{base}.speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(self._speedscope(end), f, ensure_ascii=False)
+        with open(f"{base}.spans.json", "w", encoding="utf-8") as f:
+            json.dump({"name": self.name, "duration": end, "spans": self._span_tree()}, f, ensure_ascii=False, indent=2)
+        print(f"🔬 [Profile] {self.name} 耗时 {end:.2f}s，已写入 {base}.speedscope.json")
+        return f"{base}.speedscope.json"
+
+
+@contextmanager
+def _record_span(sinks: tuple, name: str):
+    span_id = next(_span_ids)
+    parent = _current_span.get()
+    thread = threading.current_thread().name
+    starts = [sink.now() for sink in sinks]
+    token = _current_span.set(span_id)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+        for sink, start in zip(sinks, starts):
+            sink.add_span(
+                {"id": span_id, "parent": parent, "name": name, "thread": thread, "start": start, "end": sink.now()}
+            )
+
+
+def span(name: str):
+    """记录一个 span（写入当前剖析与流量录制）；两者都未开启时返回空上下文"""
+    profile = current_profile.get()
+    trace = current_trace.get()
+    if profile is None and trace is None:
+        return _NOOP
+    return _record_span(tuple(sink for sink in (profile, trace) if sink is not None), name)
+
+
+def _wants_profile(scope) -> bool:
+    if not scope["path"].startswith(PROFILED_PREFIXES):
+        return False
+    for key, value in scope.get("headers", []):
+        if key == PROFILE_HEADER.encode() and value in (b"1", b"true"):
+            return True
+    query = parse_qs(scope.get("query_string", b"").decode())
+    return query.get("profile", ["0"])[0] in ("1", "true")
+
+
+class ProfilingMiddleware:
+    """纯 ASGI 中间件，流式响应结束后才停止采样；剖析 id 通过 X-Profile-Id 响应头返回"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ALLOWED or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{scope['method']} {scope['path']}"
+        profile = Profile(name)
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        token = current_profile.set(profile)
+        profile.start()
+        try:
+            with span(name):
+                await self.app(scope, receive, send_with_header)
+        finally:
+            current_profile.reset(token)
+            await asyncio.to_thread(profile.stop_and_write)
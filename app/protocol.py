@@ -0,0 +1,137 @@
+# app/protocol.py
+"""
+流式对话事件协议 (v1)
+
+每个 SSE 帧的 event 字段为事件类型，data 字段为紧凑 JSON：
+    token       {"text": "..."}                     合并后的文本片段
+    queued      {"position": 3}                     排队等待模型供应商空闲名额
+    tool_start  {"tool": "generate_image"}          工具开始执行
+    media       {"kind": "image"|"video", "url": "...", "local_url": "/media/...", "thumbnail_url": "...", "poster_url": "..."}
+                                                    url 为供应商原始链接（会过期）；开启媒体镜像时附带本地地址，
+                                                    poster_url 仅视频有；分镜产出的媒体另带 shot (镜头序号) 与 title
+    storyboard  {"status": "planned", "shots": [{"index": 0, "title": "...", "image_prompt": "...", "video_prompt": "..."}]}
+                {"status": "shot_failed", "index": 2, "kind": "image"|"video", "message": "..."}
+                                                    分镜规划完成 / 单个镜头生成失败
+    segment     {"index": 0, "total": 6, "start": "00:00", "end": "01:00", "text": "..."}
+                                                    长视频分段解析时，每完成一段推送一次（按完成顺序）
+    batch       {"status": "planned", "id": "...", "kind": "image", "total": 40, "duplicates": 2, "items": [{"index": 0, "prompt": "...", "variant": 0}]}
+                {"status": "item_failed", "index": 3, "message": "..."}
+                {"status": "progress"|"completed"|"cancelled", "succeeded": 12, "failed": 1, "cancelled": 0, "total": 40}
+                                                    批量生成的进度订阅：清单 / 单条失败 / 计数变化（最后一次为任务的最终状态）；
+                                                    每条成功的结果以 media 推送，另带 index 与 prompt
+    error       {"message": "..."}
+    done        {}                                  本轮结束
+协议版本通过响应头 PROTOCOL_HEADER 告知客户端。
+"""
+import asyncio
+import json
+from typing import AsyncIterator
+
+PROTOCOL_VERSION = "1"
+PROTOCOL_HEADER = "X-MediaCraft-Stream"
+
+TOKEN = "token"
+QUEUED = "queued"
+TOOL_START = "tool_start"
+MEDIA = "media"
+SEGMENT = "segment"
+STORYBOARD = "storyboard"
+BATCH = "batch"
+ERROR = "error"
+DONE = "done"
+
+# 图内部的自定义事件名：大脑的 token 以此事件派发，不直接出现在线上协议中
+AGENT_TOKEN_EVENT = "agent_token"
+# 视频工具分段解析进度的自定义事件名，翻译为 segment 事件
+VIDEO_SEGMENT_EVENT = "video_segment"
+# 分镜工具进度的自定义事件名，负载为 {"event": 协议事件类型, "payload": {...}}，按原事件类型转发
+STORYBOARD_EVENT = "storyboard_progress"
+
+# 文本合并窗口：攒够 COALESCE_MAX_CHARS 个字符或距首个未发送 token 超过 COALESCE_MAX_DELAY 秒即发送一帧
+COALESCE_MAX_CHARS = 256
+COALESCE_MAX_DELAY = 0.05
+# 生产者与发送端之间的缓冲上限，客户端消费变慢时反压到图执行
+STREAM_QUEUE_SIZE = 64
+
+_END = object()
+
+
+def make_event(event_type: str, **payload) -> dict:
+    """构造一个可直接交给 EventSourceResponse 的 SSE 帧"""
+    return {"event": event_type, "data": json.dumps(payload, ensure_ascii=False, separators=(",", ":"))}
+
+
+async def coalesce_events(
+    source: AsyncIterator[tuple[str, dict]],
+    max_chars: int = COALESCE_MAX_CHARS,
+    max_delay: float = COALESCE_MAX_DELAY,
+    queue_size: int = STREAM_QUEUE_SIZE,
+) -> AsyncIterator[dict]:
+    """
+    将 (事件类型, 负载) 流转换为 SSE 帧，连续的 token 在时间/大小窗口内合并为一帧。
+    source 在独立任务中运行并写入有界队列：发送端阻塞时队列写满，source 随之暂停。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    failure: list[BaseException] = []
+
+    async def pump():
+        try:
+            async for item in source:
+                await queue.put(item)
+        except Exception as e:
+            failure.append(e)
+        # 被取消时不再写入结束标记，此时发送端已经退出
+        await queue.put(_END)
+
+    producer = asyncio.create_task(pump())
+    buffer: list[str] = []
+    buffered_chars = 0
+    deadline = None
+
+    try:
+        while True:
+            if queue.empty() and deadline is not None:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    item = None
+                else:
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        item = None
+            else:
+                item = await queue.get()
+
+            if item is None:
+                yield make_event(TOKEN, text="".join(buffer))
+                buffer, buffered_chars, deadline = [], 0, None
+                continue
+            if item is _END:
+                break
+
+            event_type, payload = item
+            if event_type == TOKEN:
+                if not buffer:
+                    deadline = loop.time() + max_delay
+                buffer.append(payload["text"])
+                buffered_chars += len(payload["text"])
+                if buffered_chars >= max_chars:
+                    yield make_event(TOKEN, text="".join(buffer))
+                    buffer, buffered_chars, deadline = [], 0, None
+                continue
+
+            # 非文本事件之前先把已缓冲的文本发出，保证顺序
+            if buffer:
+                yield make_event(TOKEN, text="".join(buffer))
+                buffer, buffered_chars, deadline = [], 0, None
+            yield make_event(event_type, **payload)
+
+        if buffer:
+            yield make_event(TOKEN, text="".join(buffer))
+        if failure:
+            raise failure[0]
+    finally:
+        if not producer.done():
+            producer.cancel()
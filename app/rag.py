@@ -1,78 +1,143 @@
 # app/rag.py
+import contextvars
 import os
 import time
-import random
+import threading
+import uuid
 import requests
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-knowledge_progress = {}
+from app import cancellation
+from app.endpoints import SILICONFLOW_BASE_URL
+from app.metrics import RAG_STAGE_SECONDS, timer
+from app.profiling import span
+from app.state import progress_store
 
+# chromadb / langchain_openai 导入较慢，推迟到首次使用（或启动预热）时加载
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+EMBEDDING_MODEL = "BAAI/bge-m3"
 RERANK_MODEL = "BAAI/bge-reranker-v2-m3"
-RERANK_URL = "https://api.siliconflow.cn/v1/rerank"
+RERANK_URL = f"{SILICONFLOW_BASE_URL}/rerank"
+RERANK_CONCURRENCY = 8  # 批量检索时并发重排序的最大请求数
+# 知识库内容版本，保存在 progress_store 中供各 worker 共享；每次入库写入后更换，依赖知识库的缓存据此失效
+KNOWLEDGE_VERSION_KEY = "knowledge:version"
+
+# 复用 TCP/TLS 连接，避免批量重排序时每个请求重新握手
+_http = requests.Session()
 
 
 def get_embeddings():
     """初始化 Embedding 模型，使用硅基流动 BAAI/bge-m3"""
+    from langchain_openai import OpenAIEmbeddings
+
     return OpenAIEmbeddings(
-        model="BAAI/bge-m3",
+        model=EMBEDDING_MODEL,
         api_key=os.getenv("SILICONFLOW_API_KEY"),
-        base_url="https://api.siliconflow.cn/v1",
+        base_url=SILICONFLOW_BASE_URL,
         chunk_size=50,
+        # bge-m3 不是 OpenAI 模型，直接发送原文，不用 tiktoken 预切分（否则首次调用会联网下载词表）
+        check_embedding_ctx_length=False,
     )
 
 
-def get_vector_store():
-    """初始化并获取本地 ChromaDB 向量库实例"""
-    persist_directory = os.path.join(os.path.dirname(os.path.dirname(__file__)), "chroma_db")
-    return Chroma(
-        collection_name="bytecreator_knowledge",
-        embedding_function=get_embeddings(),
-        persist_directory=persist_directory,
-    )
+KNOWLEDGE_COLLECTION = "bytecreator_knowledge"
+TRENDING_COLLECTION = "bytecreator_trending"
 
+_stores: dict[str, "Chroma"] = {}
+_stores_lock = threading.Lock()
+
+
+def _open_store(collection_name: str) -> "Chroma":
+    """按集合名打开 Chroma 向量库，进程内每个集合只打开一次"""
+    store = _stores.get(collection_name)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(collection_name)
+            if store is None:
+                from langchain_chroma import Chroma
+
+                # 本地持久化目录只能被一个进程安全写入；多 worker / 多节点部署时设置 CHROMA_HOST 连接 Chroma 服务
+                if os.getenv("CHROMA_HOST"):
+                    import chromadb
+
+                    location = {
+                        "client": chromadb.HttpClient(
+                            host=os.getenv("CHROMA_HOST"), port=int(os.getenv("CHROMA_PORT", "8000"))
+                        )
+                    }
+                else:
+                    location = {
+                        "persist_directory": os.getenv("CHROMA_PERSIST_DIR")
+                        or os.path.join(os.path.dirname(os.path.dirname(__file__)), "chroma_db")
+                    }
+                with span("rag:chroma_load"):
+                    store = Chroma(
+                        collection_name=collection_name,
+                        embedding_function=get_embeddings(),
+                        **location,
+                    )
+                _stores[collection_name] = store
+    return store
+
+
+def raw_collection(store: "Chroma"):
+    """
+    取 Chroma 包装下的原生 chromadb 集合，用于 langchain 接口没有提供的批量查询、按 id 读写元数据与导入导出。
+    依赖 langchain_chroma 1.1.0 的私有属性 Chroma._collection（集合未初始化时抛出 ValueError）；
+    升级 langchain_chroma 时只需核对这一处与 max_batch_size。
+    """
+    return store._collection
+
+
+def max_batch_size(store: "Chroma") -> int:
+    """
+    chromadb 单次 add / upsert 允许的最大条数。
+    依赖 langchain_chroma 1.1.0 的私有属性 Chroma._client（原生 chromadb 客户端），与 raw_collection 一起核对。
+    """
+    return store._client.get_max_batch_size()
+
+
+def get_vector_store() -> "Chroma":
+    """获取本地 ChromaDB 向量库实例，进程内只打开一次"""
+    return _open_store(KNOWLEDGE_COLLECTION)
+
+
+def get_trending_store() -> "Chroma":
+    """热点榜单专用集合，与用户上传的知识分开存放与过期"""
+    return _open_store(TRENDING_COLLECTION)
+
+
+def knowledge_version() -> str:
+    record = progress_store.get(KNOWLEDGE_VERSION_KEY)
+    return record["version"] if record else "initial"
+
+
+def _bump_knowledge_version():
+    progress_store.set(KNOWLEDGE_VERSION_KEY, {"version": uuid.uuid4().hex, "updated": time.time()})
+
+
+def split_text(text: str) -> list[str]:
+    """按中文标点优先切分为约 500 字的知识块，丢弃空白块"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-def add_to_knowledge_base(text: str, source: str = "manual_input"):
-    """带自动重试机制的入库引擎"""
-    print(f"📚 正在处理并切分文本，来源: {source}...")
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=500,
         chunk_overlap=50,
         separators=["\n\n", "\n", "。", "！", "？", "；", "，", " ", ""],
     )
-    valid_chunks = [chunk for chunk in text_splitter.split_text(text) if chunk.strip()]
-    documents = [Document(page_content=chunk, metadata={"source": source}) for chunk in valid_chunks]
-
-    vector_store = get_vector_store()
-    batch_size = 50
-    total_docs = len(documents)
-    knowledge_progress[source] = {"current": 0, "total": total_docs, "status": "processing"}
-    print(f"📦 共计 {total_docs} 个有效知识块，开始分批安全入库...")
-
-    for i in range(0, total_docs, batch_size):
-        batch = documents[i : i + batch_size]
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                vector_store.add_documents(batch)
-                knowledge_progress[source]["current"] = min(i + batch_size, total_docs)
-                print(f"✅ 入库进度: {min(i + batch_size, total_docs)} / {total_docs}")
-                time.sleep(0.5)
-                break
-            except Exception as e:
-                if "429" in str(e) and attempt < max_retries - 1:
-                    wait_time = (2**attempt) + random.random()
-                    print(f"⚠️ 触发限流，等待 {wait_time:.1f}s 后重试...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"❌ 批量入库失败: {e}")
-                    raise
+    return [chunk for chunk in text_splitter.split_text(text) if chunk.strip()]
 
-    knowledge_progress[source]["status"] = "completed"
-    print(f"✅ 成功将 {total_docs} 个文本块存入 ChromaDB 向量库！(保存在 chroma_db 目录)")
-    return total_docs
+
+def add_to_knowledge_base(text: str, source: str = "manual_input", tenant: str = ""):
+    """同步入库：交给入库调度器（与其他上传共享 Embedding 速率预算），等待完成后返回块数"""
+    from app.ingest import scheduler
+
+    print(f"📚 正在处理并切分文本，来源: {source}...")
+    return scheduler.submit(text, source, tenant).result()
 
 
 def _rerank_documents(query: str, docs: list[Document], top_k: int) -> list[Document]:
@@ -92,7 +157,8 @@ def _rerank_documents(query: str, docs: list[Document], top_k: int) -> list[Docu
         "Content-Type": "application/json",
     }
     try:
-        resp = requests.post(RERANK_URL, json=payload, headers=headers, timeout=15)
+        with timer(RAG_STAGE_SECONDS, "rerank"), span("rag:rerank"):
+            resp = _http.post(RERANK_URL, json=payload, headers=headers, timeout=cancellation.current().timeout(15))
         if resp.status_code != 200:
             return docs[:top_k]
         data = resp.json()
@@ -107,14 +173,28 @@ def _rerank_documents(query: str, docs: list[Document], top_k: int) -> list[Docu
         return docs[:top_k]
 
 
+def _format_context(docs: list[Document]) -> str:
+    """将文档片段拼接为带来源标注的上下文文本"""
+    context_pieces = [f"【来源: {d.metadata.get('source', '未知')}】\n{d.page_content}" for d in docs]
+    return "\n\n---\n\n".join(context_pieces)
+
+
 def query_knowledge_base(query: str, k: int = 3) -> str:
+    """检索并拼接为带来源标注的上下文文本，未命中时返回空字符串"""
+    return _format_context(search_documents(query, k))
+
+
+def search_documents(query: str, k: int = 3) -> list[Document]:
     """海选 + 精选 (Rerank) 检索架构，重排序失败时回退为前 k 条"""
     try:
         vector_store = get_vector_store()
-        initial_results = vector_store.similarity_search(query, k=10)
+        with timer(RAG_STAGE_SECONDS, "embed"), span("rag:embed"):
+            query_vector = vector_store.embeddings.embed_query(query)
+        with timer(RAG_STAGE_SECONDS, "search"), span("rag:search"):
+            initial_results = vector_store.similarity_search_by_vector(query_vector, k=10)
         if not initial_results:
             print("⚠️ 知识库中未找到高度相关的片段。")
-            return ""
+            return []
 
         print(f"🔍 [Rerank] 正在对 {len(initial_results)} 条候选知识进行精选...")
         try:
@@ -123,12 +203,68 @@ def query_knowledge_base(query: str, k: int = 3) -> str:
             print(f"⚠️ 重排序失败，回退为原始前 {k} 条: {rerank_err}")
             final_docs = initial_results[:k]
 
-        context_pieces = [
-            f"【来源: {d.metadata.get('source', '未知')}】\n{d.page_content}" for d in final_docs
-        ]
         print(f"✅ 检索完成，返回 {len(final_docs)} 个相关片段。")
-        return "\n\n---\n\n".join(context_pieces)
+        return final_docs
 
     except Exception as e:
         print(f"❌ 检索异常: {e}")
-        return ""
+        return []
+
+
+def _batch_similarity_search(vector_store: "Chroma", vectors: list[list[float]], k: int) -> list[list[Document]]:
+    """一次 Chroma 批量查询完成多条向量的海选，返回与 vectors 一一对应的候选列表"""
+    result = raw_collection(vector_store).query(
+        query_embeddings=vectors,
+        n_results=k,
+        include=["documents", "metadatas"],
+    )
+    candidates = []
+    for docs, metas in zip(result.get("documents") or [], result.get("metadatas") or []):
+        candidates.append(
+            [Document(page_content=text, metadata=meta or {}) for text, meta in zip(docs, metas) if text]
+        )
+    return candidates
+
+
+def query_knowledge_base_batch(queries: list[str], k: int = 3) -> list[str]:
+    """
+    批量检索：一次 Embedding 请求 + 一次向量批查询 + 并发重排序。
+    返回与 queries 一一对应的上下文文本，未命中的查询对应空字符串。
+    """
+    if not queries:
+        return []
+
+    # 相同的查询只检索一次
+    unique_queries = list(dict.fromkeys(queries))
+    try:
+        vector_store = get_vector_store()
+        with timer(RAG_STAGE_SECONDS, "embed"), span("rag:embed"):
+            vectors = vector_store.embeddings.embed_documents(unique_queries)
+        with timer(RAG_STAGE_SECONDS, "search"), span("rag:search"):
+            candidates = _batch_similarity_search(vector_store, vectors, k=10)
+    except Exception as e:
+        print(f"❌ 批量检索异常: {e}")
+        return ["" for _ in queries]
+
+    def rerank(query: str, docs: list[Document]) -> list[Document]:
+        if not docs:
+            return []
+        try:
+            return _rerank_documents(query, docs, k)
+        except Exception as rerank_err:
+            print(f"⚠️ 重排序失败，回退为原始前 {k} 条: {rerank_err}")
+            return docs[:k]
+
+    # 重排序接口每次只接受一个 query，这里用线程池并发打满所有 query/文档 组
+    print(f"🔍 [Rerank] 正在并发精选 {len(unique_queries)} 组候选知识...")
+    # 每组复制一份上下文提交，取消令牌与剖析 span 随之进入工作线程
+    with ThreadPoolExecutor(max_workers=min(RERANK_CONCURRENCY, len(unique_queries))) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, rerank, query, docs)
+            for query, docs in zip(unique_queries, candidates)
+        ]
+        final_docs = [future.result() for future in futures]
+
+    contexts = {q: _format_context(docs) for q, docs in zip(unique_queries, final_docs)}
+    print(f"✅ 批量检索完成，共 {len(queries)} 条查询。")
+    return [contexts[q] for q in queries]
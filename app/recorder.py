@@ -0,0 +1,95 @@
+# app/recorder.py
+"""
+线上流量录制：设置 TRAFFIC_RECORD_PATH 后，每个对话 / 生成 / 知识库上传请求结束时向该 JSONL 文件追加一行，
+包含到达时间、脱敏后的请求体、总耗时、首字延迟以及请求内各 span（上游调用、工具、RAG 阶段）的耗时。
+图片 / 视频 Base64 只保留 sha256 与字节数，文档只保留字符数，对话文本原样保留以便回放时触发相同的工具调用。
+回放见 benchmarks/replay.py。
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRACE_PATH = os.getenv("TRAFFIC_RECORD_PATH")
+MEDIA_FIELDS = ("image_data", "video_data")
+
+current_trace: ContextVar["Trace | None"] = ContextVar("traffic_trace", default=None)
+_write_lock = threading.Lock()
+
+
+def _media_digest(data: str) -> dict:
+    """用摘要替代 Base64 媒体，保留原始字节数供回放时生成同等大小的样本"""
+    payload = data.split(",", 1)[-1]
+    try:
+        size = len(base64.b64decode(payload))
+    except ValueError:
+        size = len(payload)
+    return {"sha256": hashlib.sha256(payload.encode()).hexdigest(), "bytes": size}
+
+
+def sanitize(payload: dict) -> dict:
+    clean = dict(payload)
+    for field in MEDIA_FIELDS:
+        if clean.get(field):
+            clean[field] = _media_digest(clean[field])
+    return clean
+
+
+class Trace:
+    """一次请求的录制记录，实现与 profiling.Profile 相同的 now / add_span 接口"""
+
+    def __init__(self, kind: str, payload: dict):
+        self.kind = kind
+        self.payload = payload
+        self.arrival = time.time()
+        self.t0 = time.perf_counter()
+        self.ttft: float | None = None
+        self.outcome = "completed"
+        self.spans: list[dict] = []
+
+    def now(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def add_span(self, record: dict):
+        self.spans.append({"name": record["name"], "start": round(record["start"], 4), "end": round(record["end"], 4)})
+
+    def mark_first_token(self):
+        if self.ttft is None:
+            self.ttft = self.now()
+
+    def write(self):
+        line = {
+            "kind": self.kind,
+            "arrival": self.arrival,
+            "duration": round(self.now(), 4),
+            "ttft": None if self.ttft is None else round(self.ttft, 4),
+            "outcome": self.outcome,
+            "payload": self.payload,
+            "spans": sorted(self.spans, key=lambda s: s["start"]),
+        }
+        text = json.dumps(line, ensure_ascii=False) + "\n"
+        with _write_lock, open(TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write(text)
+
+
+@contextmanager
+def recording(kind: str, payload: dict):
+    """在代码块内录制一次请求，块结束时写出；未开启录制时产出 None"""
+    if not TRACE_PATH:
+        yield None
+        return
+    trace = Trace(kind, sanitize(payload))
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        if trace.outcome == "completed":
+            trace.outcome = "error"
+        raise
+    finally:
+        current_trace.reset(token)
+        trace.write()
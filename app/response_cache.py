@@ -0,0 +1,181 @@
+# app/response_cache.py
+"""
+对话回答缓存（RESPONSE_CACHE=1 开启）：创作者经常在同一套系统提示词下发送几乎相同的请求
+（“写一个抖音爆款文案关于 xx”），每次都完整跑一遍大脑、知识库检索与联网搜索。
+
+缓存的作用域由系统提示词、对话模型、知识库版本与此前的对话历史共同决定，作用域内：
+- 归一化后的问题完全相同：直接重放缓存的回答
+- 否则与作用域内已缓存问题的向量余弦相似度不低于 RESPONSE_CACHE_SIMILARITY：同样重放
+命中时不排队、不调用模型，回答按 token 帧推送，并写入对话检查点，后续轮次照常接续。
+只缓存纯文本轮次：带图片 / 视频的请求不查缓存，产出媒体、出错或中断的轮次不写入。
+条目按 RESPONSE_CACHE_TTL 过期、按 RESPONSE_CACHE_SIZE 做 LRU 淘汰；知识库入库后版本变化，旧条目不再命中。
+缓存保存在本进程内存中，知识库版本经 progress_store 在各 worker 间共享。
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+
+from app.metrics import CACHE_REQUESTS
+from app.profiling import span
+from app.protocol import COALESCE_MAX_CHARS, TOKEN, make_event
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+EMBED_TIMEOUT = 2.0  # 查询向量化的等待上限，超时按未命中处理，不拖慢正常请求
+
+_entries: OrderedDict[tuple[str, str], dict] = OrderedDict()
+_lock = threading.Lock()
+# 未命中轮次的问题在后台向量化，不占用发送 done 之前的时间
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+
+
+class Probe:
+    """一次缓存查询的结果；answer 为 None 表示未命中，轮次结束后据此写入"""
+
+    def __init__(self, scope: str, query: str):
+        self.scope = scope
+        self.query = query
+        self.vector: list[float] | None = None
+        self.answer: str | None = None
+
+
+def normalize(text: str) -> str:
+    """全半角统一、小写、合并空白并去掉末尾标点"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return re.sub(r"\s+", " ", text).strip().rstrip("。！？!?.~～ ")
+
+
+def _scope(configurable: dict, history: list) -> str:
+    from app.rag import knowledge_version
+
+    digest = hashlib.sha256()
+    for part in (configurable.get("system_prompt", ""), configurable.get("selected_chat_model", ""), knowledge_version()):
+        digest.update(part.encode("utf-8") + b"\0")
+    for message in history:
+        digest.update(json.dumps([message.type, message.content], ensure_ascii=False, default=str).encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def _embed(query: str) -> list[float]:
+    from app.rag import get_vector_store
+
+    with span("response_cache:embed"):
+        vector = get_vector_store().embeddings.embed_query(query)
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _evict(now: float):
+    while _entries:
+        key, entry = next(iter(_entries.items()))
+        if now - entry["created"] <= RESPONSE_CACHE_TTL and len(_entries) <= RESPONSE_CACHE_SIZE:
+            break
+        del _entries[key]
+
+
+def _nearest(scope: str, vector: list[float]) -> tuple[tuple | None, float]:
+    best, best_score = None, -1.0
+    with _lock:
+        candidates = [(key, entry["vector"]) for key, entry in _entries.items() if key[0] == scope and entry["vector"]]
+    for key, other in candidates:
+        score = sum(a * b for a, b in zip(vector, other))
+        if score > best_score:
+            best, best_score = key, score
+    return best, best_score
+
+
+async def lookup(graph, config: dict, content: str) -> Probe:
+    """按本轮的配置与问题查询缓存；对话历史从检查点读取"""
+    state = await graph.aget_state(config)
+    history = state.values.get("messages", []) if state and state.values else []
+    probe = Probe(scope=await asyncio.to_thread(_scope, config["configurable"], history), query=normalize(content))
+
+    now = time.monotonic()
+    with _lock:
+        _evict(now)
+        entry = _entries.get((probe.scope, probe.query))
+        if entry is not None:
+            _entries.move_to_end((probe.scope, probe.query))
+            CACHE_REQUESTS.inc("response", "hit")
+            probe.answer = entry["answer"]
+            return probe
+        has_candidates = any(key[0] == probe.scope for key in _entries)
+
+    # 作用域内没有可比较的条目时不做向量化，未命中的请求不多付一次 Embedding 调用
+    if has_candidates and RESPONSE_CACHE_SIMILARITY < 1:
+        try:
+            probe.vector = await asyncio.wait_for(asyncio.to_thread(_embed, probe.query), EMBED_TIMEOUT)
+        except Exception as e:
+            print(f"⚠️ 回答缓存向量化失败，按未命中处理: {e}")
+        if probe.vector:
+            key, score = await asyncio.to_thread(_nearest, probe.scope, probe.vector)
+            with _lock:
+                entry = _entries.get(key) if key and score >= RESPONSE_CACHE_SIMILARITY else None
+                if entry is not None:
+                    _entries.move_to_end(key)
+                    CACHE_REQUESTS.inc("response", "semantic_hit")
+                    probe.answer = entry["answer"]
+                    return probe
+    CACHE_REQUESTS.inc("response", "miss")
+    return probe
+
+
+def _store(probe: Probe, answer: str):
+    """立即写入供原文命中，向量随后补上"""
+    key, now = (probe.scope, probe.query), time.monotonic()
+    with _lock:
+        _entries[key] = {"answer": answer, "vector": probe.vector, "created": now}
+        _entries.move_to_end(key)
+        _evict(now)
+    if probe.vector is None and RESPONSE_CACHE_SIMILARITY < 1:
+        _pool.submit(_attach_vector, key)
+
+
+def _attach_vector(key: tuple[str, str]):
+    try:
+        vector = _embed(key[1])
+    except Exception as e:
+        print(f"⚠️ 回答缓存向量化失败，仅按原文缓存: {e}")
+        return
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            entry["vector"] = vector
+
+
+async def capture(source: AsyncIterator[tuple[str, dict]], probe: Probe) -> AsyncIterator[tuple[str, dict]]:
+    """透传 stream_graph_events 的事件，本轮只产出文本且正常结束时把回答写入缓存"""
+    parts, text_only = [], True
+    async for event_type, payload in source:
+        if event_type == TOKEN:
+            parts.append(payload["text"])
+        else:
+            text_only = False
+        yield event_type, payload
+    if text_only and parts:
+        _store(probe, "".join(parts))
+
+
+def replay(answer: str) -> list[dict]:
+    """把缓存的回答切成 token 帧，帧大小与合并窗口一致"""
+    return [make_event(TOKEN, text=answer[i:i + COALESCE_MAX_CHARS]) for i in range(0, len(answer), COALESCE_MAX_CHARS)]
+
+
+async def commit(graph, config: dict, content: str, answer: str):
+    """命中时把本轮问答写入检查点，与模型实际回答过一样"""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    await graph.aupdate_state(
+        config, {"messages": [HumanMessage(content=content), AIMessage(content=answer)]}, as_node="agent"
+    )
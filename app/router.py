@@ -0,0 +1,241 @@
+# app/router.py
+"""
+对话模型路由层：在 get_llm 已接入的供应商之间做健康跟踪、熔断与故障转移。
+可选的对冲请求 (LLM_HEDGING=1)：首个 token 超过该供应商 p95 首字延迟仍未到达时，
+向下一个供应商并发发起同样的请求，谁先出字用谁，另一路立即取消。
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Callable
+
+from langchain_core.messages import AIMessageChunk
+
+from app.limits import get_limiter, provider_of
+from app.metrics import LLM_FAILOVERS, LLM_HEDGES, LLM_TTFT_SECONDS
+from app.profiling import span
+
+# 故障转移顺序（get_llm 的标签关键字）
+FAILOVER_LABELS = ["DeepSeek", "Qwen", "GLM", "Doubao", "Llama"]
+PROVIDER_API_KEYS = {
+    "deepseek": "DEEPSEEK_API_KEY",
+    "nvidia": "NVIDIA_API_KEY",
+    "volcengine": "VOLC_API_KEY",
+    "zhipu": "ZHIPU_API_KEY",
+    "siliconflow": "SILICONFLOW_API_KEY",
+}
+
+# 熔断：连续失败 FAILURE_THRESHOLD 次后熔断 COOLDOWN 秒，之后放行一次探测请求
+FAILURE_THRESHOLD = 3
+COOLDOWN = 30.0
+
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "0") == "1"
+HEDGE_MIN_SAMPLES = 20  # 样本不足时使用默认对冲时限
+HEDGE_DEFAULT_DEADLINE = 4.0
+HEDGE_MIN_DEADLINE = 1.0
+
+
+class AllProvidersFailed(Exception):
+    """所有候选供应商都调用失败"""
+
+
+class CircuitOpen(Exception):
+    """供应商仍在熔断中，冷却结束后的探测名额已被其他请求占用"""
+
+
+class ProviderHealth:
+    def __init__(self, name: str):
+        self.name = name
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.ttft_samples: deque[float] = deque(maxlen=200)
+
+    def available(self) -> bool:
+        """熔断关闭，或熔断打开且冷却已结束（可以探测）；只读，不占用探测名额"""
+        return self.opened_at is None or time.monotonic() - self.opened_at >= COOLDOWN
+
+    def claim(self) -> bool:
+        """
+        调用真正开始时占用名额：熔断关闭时总是成功；冷却结束时占用唯一的探测名额并重新计时，
+        其他请求须等探测结果或下一次冷却结束。
+        """
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= COOLDOWN:
+            self.opened_at = now
+            return True
+        return False
+
+    def record_first_token(self, ttft: float):
+        self.ttft_samples.append(ttft)
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= FAILURE_THRESHOLD:
+            if self.opened_at is None:
+                print(f"🔌 [熔断] {self.name} 连续失败 {self.consecutive_failures} 次，暂停调度 {COOLDOWN:.0f}s")
+            self.opened_at = time.monotonic()
+
+    def hedge_deadline(self) -> float:
+        """对冲时限：近期首字延迟的 p95"""
+        if len(self.ttft_samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DEADLINE
+        ordered = sorted(self.ttft_samples)
+        return max(HEDGE_MIN_DEADLINE, ordered[int(0.95 * (len(ordered) - 1))])
+
+
+health = {name: ProviderHealth(name) for name in PROVIDER_API_KEYS}
+_missing_key_warned: set[str] = set()
+
+
+def candidate_labels(primary_label: str) -> list[str]:
+    """
+    首选模型 + 其余已配置密钥、未熔断的供应商，每个供应商只出现一次；全部熔断时返回空列表。
+    只做判断，不改变熔断状态。
+    """
+    primary = provider_of(primary_label)
+    if not os.getenv(PROVIDER_API_KEYS[primary]):
+        # 首选供应商没有配置密钥：请求会改由其他供应商回答，记录下来以免被误以为是所选模型的输出
+        LLM_FAILOVERS.inc(primary_label)
+        if primary not in _missing_key_warned:
+            _missing_key_warned.add(primary)
+            print(f"⚠️ [路由] 未配置 {PROVIDER_API_KEYS[primary]}，{primary_label} 的请求将转由其他供应商处理")
+    labels, seen = [], set()
+    for label in [primary_label] + FAILOVER_LABELS:
+        provider = provider_of(label)
+        if provider in seen or not os.getenv(PROVIDER_API_KEYS[provider]):
+            continue
+        seen.add(provider)
+        if health[provider].available():
+            labels.append(label)
+    return labels
+
+
+_DONE = object()
+
+
+class _Attempt:
+    """对单个供应商的一次流式调用，在独立任务中把分块写入队列"""
+
+    def __init__(
+        self, label: str, llm_factory: Callable, messages: list, tools: list, config: dict, forced: bool = False
+    ):
+        self.label = label
+        self.health = health[provider_of(label)]
+        self.forced = forced  # 全部熔断时的兜底调用，不占用探测名额
+        self.started = time.monotonic()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.first_token: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task = asyncio.create_task(self._run(llm_factory, messages, tools, config))
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    async def _run(self, llm_factory, messages, tools, config):
+        with span(f"upstream:llm:{self.label}"):
+            await self._stream(llm_factory, messages, tools, config)
+
+    async def _stream(self, llm_factory, messages, tools, config):
+        try:
+            if not self.forced and not self.health.claim():
+                raise CircuitOpen(f"{self.health.name} 熔断中，探测请求已由其他会话发起")
+            with span("rate_limit_wait"):
+                await get_limiter(self.label).bucket.acquire()
+            llm = llm_factory(self.label).bind_tools(tools)
+            async for chunk in llm.astream(messages, config):
+                if not self.first_token.done() and (chunk.content or chunk.tool_call_chunks):
+                    ttft = self.elapsed()
+                    self.health.record_first_token(ttft)
+                    LLM_TTFT_SECONDS.observe(self.label, value=ttft)
+                    self.first_token.set_result(self.label)
+                await self.queue.put(chunk)
+            if not self.first_token.done():
+                self.first_token.set_result(self.label)
+            await self.queue.put(_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not isinstance(e, CircuitOpen):
+                self.health.record_failure()
+            if not self.first_token.done():
+                self.first_token.set_exception(e)
+            await self.queue.put(e)
+
+    async def chunks(self) -> AsyncIterator[AIMessageChunk]:
+        while True:
+            item = await self.queue.get()
+            if item is _DONE:
+                self.health.record_success()
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self.task.cancel()
+        if not self.first_token.done():
+            self.first_token.cancel()
+
+
+async def astream_with_failover(
+    messages: list, primary_label: str, tools: list, config: dict, llm_factory: Callable
+) -> AsyncIterator[AIMessageChunk]:
+    """
+    按候选顺序流式调用对话模型。出字之前的失败会自动切换到下一个供应商；
+    已经开始输出后再失败则直接抛出，避免向用户拼接两段不同模型的回答。
+    """
+    labels = candidate_labels(primary_label)
+    # 全部熔断时仍然尝试首选模型，而不是直接报错
+    forced = not labels
+    pending = deque(labels or [primary_label])
+    attempts: list[_Attempt] = []
+    errors: list[str] = []
+    winner = None
+    try:
+        while winner is None:
+            if not attempts:
+                if not pending:
+                    raise AllProvidersFailed("；".join(errors) or "没有可用的对话模型")
+                attempts.append(_Attempt(pending.popleft(), llm_factory, messages, tools, config, forced=forced))
+
+            timeout = None
+            if HEDGING_ENABLED and len(attempts) == 1 and pending:
+                timeout = max(0.0, attempts[0].health.hedge_deadline() - attempts[0].elapsed())
+
+            done, _ = await asyncio.wait(
+                [a.first_token for a in attempts], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                hedge_label = pending.popleft()
+                print(f"🪁 [对冲] {attempts[0].label} 首字超时，并发请求 {hedge_label}")
+                LLM_HEDGES.inc(attempts[0].label)
+                attempts.append(_Attempt(hedge_label, llm_factory, messages, tools, config))
+                continue
+
+            for attempt in list(attempts):
+                if not attempt.first_token.done():
+                    continue
+                error = attempt.first_token.exception()
+                if error is not None:
+                    print(f"⚠️ [故障转移] {attempt.label} 调用失败: {error}")
+                    LLM_FAILOVERS.inc(attempt.label)
+                    errors.append(f"{attempt.label}: {error}")
+                    attempts.remove(attempt)
+                elif winner is None:
+                    winner = attempt
+
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+
+        async for chunk in winner.chunks():
+            yield chunk
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
@@ -0,0 +1,318 @@
+# app/snapshot.py
+"""
+知识库快照：把向量集合（知识块原文、元数据、内容哈希与向量）导出为 zstd 压缩的 Parquet 列式文件。
+新节点上线或 chroma_db 损坏后直接导入，不重新切分，也不调用 Embedding 接口。
+
+    python -m app.snapshot export knowledge.parquet
+    python -m app.snapshot import knowledge.parquet --replace
+    python -m app.snapshot info knowledge.parquet
+
+- 向量列为 float32 定长列表。导入时按行组流式读取，向量列零拷贝转成 (n, dim) 的 NumPy 数组后批量 upsert，内存占用与快照大小无关
+- 文件元数据记录集合、Embedding 模型与维度；集合、模型或维度与目标不一致时拒绝导入
+- 导入保留原有 ID，重复导入同一快照是幂等的；--replace 先完整校验快照，通过后才清空目标集合
+- 本地 chroma_db 只能单进程写入：后端运行时请用管理接口导入，或先停掉后端再用命令行
+- 依赖 pyarrow（可选依赖，只有快照功能需要）
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+from app.profiling import span
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_BATCH = 5000  # 导出时每次从 Chroma 读取的行数（即 Parquet 行组大小），导入时每次写入的行数
+METADATA_KEY = b"mediacraft.snapshot"
+COLLECTIONS = ("knowledge", "trending")
+
+# 同一进程内的导入 / 导出依次执行，避免同时读写同一集合
+_lock = threading.Lock()
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("知识库快照需要安装 pyarrow") from e
+    return pa, pq
+
+
+def _open(collection: str):
+    from app.rag import get_trending_store, get_vector_store
+
+    if collection not in COLLECTIONS:
+        raise ValueError(f"未知的集合: {collection}，可选 {', '.join(COLLECTIONS)}")
+    return get_vector_store() if collection == "knowledge" else get_trending_store()
+
+
+def _schema(pa, dimension: int):
+    return pa.schema([
+        ("id", pa.string()),
+        ("document", pa.string()),
+        ("metadata", pa.string()),  # JSON；各来源的元数据字段不同，不展开成列
+        ("content_hash", pa.string()),
+        ("embedding", pa.list_(pa.float32(), dimension)),
+    ])
+
+
+def _content_hash(document: str | None) -> str:
+    return hashlib.sha256((document or "").encode("utf-8")).hexdigest()
+
+
+def progress_key(collection: str) -> str:
+    return f"snapshot:{collection}"
+
+
+def check_collection(info: dict, collection: str):
+    """快照只能导入到导出它的集合：知识库与热榜的元数据结构与过期规则不同"""
+    if info.get("collection") != collection:
+        raise ValueError(f"快照导出自集合 {info.get('collection')}，不能导入到 {collection}")
+
+
+def _verify_rows(pq, path: str, dimension: int, batch_size: int):
+    """完整扫描一遍快照：向量列为 dimension 维定长列表，且每行内容哈希相符；只读不写"""
+    parquet = pq.ParquetFile(path)
+    embedding = parquet.schema_arrow.field("embedding").type
+    if getattr(embedding, "list_size", None) != dimension:
+        raise ValueError(f"快照向量列与元数据中的维度 {dimension} 不一致")
+    row = 0
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=["document", "content_hash"]):
+        for document, expected in zip(batch.column("document").to_pylist(), batch.column("content_hash").to_pylist()):
+            row += 1
+            if _content_hash(document) != expected:
+                raise ValueError(f"快照第 {row} 行内容哈希不符，文件可能已损坏")
+
+
+def read_info(path: str) -> dict:
+    """快照文件的元数据：集合、Embedding 模型、维度、行数与导出时间"""
+    _, pq = _pyarrow()
+    parquet = pq.ParquetFile(path)
+    raw = (parquet.metadata.metadata or {}).get(METADATA_KEY)
+    if raw is None:
+        raise ValueError(f"{path} 不是知识库快照文件")
+    info = json.loads(raw)
+    if info.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"不支持的快照格式版本: {info.get('format')}")
+    return {**info, "rows": parquet.metadata.num_rows, "bytes": os.path.getsize(path)}
+
+
+class SnapshotWriter:
+    """按批写入快照：先写临时文件，close 时补写文件元数据再替换目标文件，中途失败不会留下半个快照"""
+
+    def __init__(self, path: str, collection: str, dimension: int):
+        self.pa, pq = _pyarrow()
+        self.path = path
+        self.partial = f"{path}.partial"
+        self.collection = collection
+        self.dimension = dimension
+        self.count = 0
+        # 浮点按字节拆分成流后 zstd 更容易压缩；元数据多为重复的来源名，用字典编码
+        self._writer = pq.ParquetWriter(
+            self.partial,
+            _schema(self.pa, dimension),
+            compression="zstd",
+            use_dictionary=["metadata"],
+            use_byte_stream_split=["embedding.list.element"],
+        )
+
+    def write(self, ids: list[str], documents: list, metadatas: list, vectors):
+        """vectors 为 (n, dimension) 的 float32 数组，直接作为向量列的缓冲区"""
+        pa = self.pa
+        table = pa.table(
+            {
+                "id": ids,
+                "document": documents,
+                "metadata": [json.dumps(m, ensure_ascii=False) if m else None for m in metadatas],
+                "content_hash": [_content_hash(d) for d in documents],
+                "embedding": pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1)), self.dimension),
+            },
+            schema=self._writer.schema,
+        )
+        with span("snapshot:write"):
+            self._writer.write_table(table, row_group_size=SNAPSHOT_BATCH)
+        self.count += len(ids)
+
+    def close(self):
+        from app.rag import EMBEDDING_MODEL
+
+        self._writer.add_key_value_metadata({METADATA_KEY: json.dumps({
+            "format": SNAPSHOT_FORMAT,
+            "collection": self.collection,
+            "embedding_model": EMBEDDING_MODEL,
+            "dimension": self.dimension,
+            "count": self.count,
+            "created": time.time(),
+        })})
+        self._writer.close()
+        os.replace(self.partial, self.path)
+
+    def abort(self):
+        self._writer.close()
+        os.remove(self.partial)
+
+
+def export_snapshot(path: str, collection: str = "knowledge") -> dict:
+    """把集合按偏移分页读出并写成快照文件，每批只在内存中保留 SNAPSHOT_BATCH 行"""
+    import numpy as np
+
+    from app import rag
+    from app.state import progress_store
+
+    _pyarrow()
+    with _lock:
+        source = rag.raw_collection(_open(collection))
+        total = source.count()
+        if not total:
+            raise ValueError(f"集合 {collection} 为空，无需导出")
+        key = progress_key(collection)
+        progress_store.set(key, {"current": 0, "total": total, "status": "exporting"})
+        started = time.perf_counter()
+        writer = None
+        try:
+            for offset in range(0, total, SNAPSHOT_BATCH):
+                with span("snapshot:read"):
+                    batch = source.get(
+                        include=["documents", "metadatas", "embeddings"], limit=SNAPSHOT_BATCH, offset=offset
+                    )
+                if not batch["ids"]:
+                    break
+                vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+                if writer is None:
+                    writer = SnapshotWriter(path, collection, vectors.shape[1])
+                writer.write(batch["ids"], batch["documents"], batch["metadatas"], vectors)
+                progress_store.update(key, current=writer.count)
+            # 行数以实际写入为准（导出期间集合可能仍有写入）
+            writer.close()
+        except Exception as e:
+            if writer is not None:
+                writer.abort()
+            progress_store.update(key, status="failed", error=str(e))
+            raise
+        seconds = time.perf_counter() - started
+        progress_store.update(key, status="completed")
+    print(f"📦 已导出 {writer.count} 个知识块到 {path}，耗时 {seconds:.1f}s")
+    return {"collection": collection, "exported": writer.count, "bytes": os.path.getsize(path), "seconds": round(seconds, 3)}
+
+
+def import_snapshot(path: str, collection: str = "knowledge", replace: bool = False, verify: bool = True) -> dict:
+    """
+    把快照直接写入向量集合，不调用 Embedding 接口。
+    verify 时逐行核对内容哈希，文件损坏或被改动时在写入该批之前报错；
+    replace 时在清空目标集合之前先完整校验一遍，损坏的快照不会让集合变空。
+    """
+    import numpy as np
+
+    from app import rag
+    from app.state import progress_store
+
+    _, pq = _pyarrow()
+    info = read_info(path)
+    check_collection(info, collection)
+    if info["embedding_model"] != rag.EMBEDDING_MODEL:
+        raise ValueError(f"快照的 Embedding 模型为 {info['embedding_model']}，与当前的 {rag.EMBEDDING_MODEL} 不一致")
+    dimension = info["dimension"]
+
+    with _lock:
+        store = _open(collection)
+        batch_size = min(SNAPSHOT_BATCH, rag.max_batch_size(store))
+        key = progress_key(collection)
+        if replace:
+            progress_store.set(key, {"current": 0, "total": info["rows"], "status": "verifying"})
+            try:
+                with span("snapshot:verify"):
+                    _verify_rows(pq, path, dimension, batch_size)
+            except Exception as e:
+                progress_store.update(key, status="failed", error=str(e))
+                raise
+            # 已完整校验过，写入时不再逐批核对
+            verify = False
+            store.reset_collection()
+        target = rag.raw_collection(store)
+        sample = target.get(limit=1, include=["embeddings"])
+        if sample["ids"] and len(sample["embeddings"][0]) != dimension:
+            raise ValueError(f"快照向量维度 {dimension} 与集合 {collection} 的 {len(sample['embeddings'][0])} 不一致")
+
+        progress_store.set(key, {"current": 0, "total": info["rows"], "status": "importing"})
+        started = time.perf_counter()
+        processed, imported = 0, 0
+        try:
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+                ids = batch.column("id").to_pylist()
+                documents = batch.column("document").to_pylist()
+                hashes = batch.column("content_hash").to_pylist()
+                if verify:
+                    for row, (document, expected) in enumerate(zip(documents, hashes)):
+                        if _content_hash(document) != expected:
+                            raise ValueError(f"快照第 {processed + row + 1} 行内容哈希不符，文件可能已损坏")
+                metadatas = [json.loads(m) if m else None for m in batch.column("metadata").to_pylist()]
+                # 定长列表展平后即为连续的 float32 缓冲区，直接视作 (n, dim) 数组，不逐行转换
+                vectors = batch.column("embedding").flatten().to_numpy(zero_copy_only=True).reshape(-1, dimension)
+                if not replace:
+                    # 已有且内容与元数据都相同的块跳过：upsert 已有 ID 会重建其索引节点，比新增还慢
+                    existing = target.get(ids=ids, include=["documents", "metadatas"])
+                    current = {
+                        i: (_content_hash(d), m) for i, d, m in zip(existing["ids"], existing["documents"], existing["metadatas"])
+                    }
+                    keep = [current.get(i) != (h, m) for i, h, m in zip(ids, hashes, metadatas)]
+                    if not all(keep):
+                        ids, documents, metadatas = (
+                            [v for v, k in zip(column, keep) if k] for column in (ids, documents, metadatas)
+                        )
+                        vectors = vectors[np.asarray(keep)]
+                if ids:
+                    with span("snapshot:upsert"):
+                        target.upsert(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+                processed += batch.num_rows
+                imported += len(ids)
+                progress_store.update(key, current=processed)
+        except Exception as e:
+            progress_store.update(key, status="failed", error=str(e))
+            raise
+        finally:
+            # 中途失败时已写入的批次同样改变了知识库
+            if (imported or replace) and collection == "knowledge":
+                rag._bump_knowledge_version()
+        seconds = time.perf_counter() - started
+        progress_store.update(key, status="completed")
+    print(f"✅ 已从快照导入 {imported} 个知识块到 {collection}（{processed - imported} 个未变跳过），耗时 {seconds:.1f}s")
+    return {
+        "collection": collection,
+        "imported": imported,
+        "skipped": processed - imported,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(processed / seconds, 1) if seconds else None,
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="导出集合为快照文件")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--collection", choices=COLLECTIONS, default="knowledge")
+    import_parser = commands.add_parser("import", help="从快照文件导入集合")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--collection", choices=COLLECTIONS, default="knowledge")
+    import_parser.add_argument("--replace", action="store_true", help="导入前清空目标集合")
+    import_parser.add_argument("--no-verify", dest="verify", action="store_false", help="跳过内容哈希校验")
+    info_parser = commands.add_parser("info", help="查看快照文件的元数据")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        result = export_snapshot(args.path, args.collection)
+    elif args.command == "import":
+        result = import_snapshot(args.path, args.collection, replace=args.replace, verify=args.verify)
+    else:
+        result = read_info(args.path)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
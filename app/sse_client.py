@@ -0,0 +1,40 @@
+# app/sse_client.py
+"""流式对话协议的客户端解析器，只依赖 requests，可被 Streamlit 前端与压测脚本直接复用"""
+import json
+from typing import Iterator
+
+import requests
+
+from app.protocol import PROTOCOL_HEADER, PROTOCOL_VERSION
+
+
+class ProtocolError(Exception):
+    """后端返回的流协议版本与客户端不匹配"""
+
+
+def iter_events(response: requests.Response) -> Iterator[tuple[str, dict]]:
+    """
+    逐帧解析 SSE 响应，产出 (事件类型, 负载字典)。
+    调用方按需停止迭代即可：连接由 requests 的上下文管理器负责关闭。
+    """
+    version = response.headers.get(PROTOCOL_HEADER)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"不支持的流协议版本: {version!r}，客户端版本为 {PROTOCOL_VERSION}")
+
+    event_type = "message"
+    data_lines: list[str] = []
+    # chunk_size=None：数据到达即处理，不等待凑满固定大小的块
+    for raw_line in response.iter_lines(chunk_size=None):
+        line = raw_line.decode("utf-8")
+        if not line:
+            # 空行表示一帧结束（\r\n 被拆在两个网络块之间时会多出空行，没有数据时忽略）
+            if data_lines:
+                yield event_type, json.loads("\n".join(data_lines))
+                event_type, data_lines = "message", []
+        elif line.startswith(":"):
+            # 心跳注释帧
+            continue
+        elif line.startswith("event:"):
+            event_type = line[6:].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[5:].lstrip(" "))
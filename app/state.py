@@ -0,0 +1,391 @@
+# app/state.py
+"""
+进程间共享状态的可插拔后端，由 STATE_BACKEND 选择：
+- memory（默认）：对话检查点、入库进度、上传媒体都保存在本进程内存，只适用于单 worker
+- sqlite：检查点与进度写入 STATE_DIR 下的 SQLite (WAL)，媒体按内容寻址存为文件，
+  同一节点的多个 uvicorn worker 共享，任意 worker 都能处理任意请求
+跨节点部署时实现 ProgressStore / MediaStore 接口（以及 LangGraph 的 BaseCheckpointSaver）接入网络存储即可。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from app.cancellation import REQUEST_DEADLINE
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DIR = os.getenv("STATE_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "state")
+# 内存媒体库的容量上限 (字节)，超出后按最近最少使用淘汰
+MEMORY_MEDIA_LIMIT = int(os.getenv("MEMORY_MEDIA_LIMIT", str(512 * 1024 * 1024)))
+# 文件媒体库 (sqlite 后端) 的容量上限 (字节) 与保留时长 (秒)：超过保留时长未被访问的文件删除，
+# 仍超出容量时按最后访问时间从旧到新删除；清理最多每 MEDIA_SWEEP_INTERVAL 秒一次，在写入后于后台线程进行
+MEDIA_STORE_LIMIT = int(os.getenv("MEDIA_STORE_LIMIT", str(4 * 1024 * 1024 * 1024)))
+MEDIA_STORE_TTL = float(os.getenv("MEDIA_STORE_TTL", str(7 * 24 * 3600)))
+MEDIA_SWEEP_INTERVAL = 600
+# 最近这段时间内读写过的媒体不按容量淘汰：对话请求开始时写入附件，整个请求期间都能读到
+MEDIA_PIN_WINDOW = REQUEST_DEADLINE
+
+
+def _sqlite_path(name: str) -> str:
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, name)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+# --- 对话检查点 ---
+def get_checkpointer():
+    if STATE_BACKEND == "memory":
+        from langgraph.checkpoint.memory import MemorySaver
+
+        return MemorySaver()
+    if STATE_BACKEND == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=sqlite 需要安装 langgraph-checkpoint-sqlite") from e
+
+        class ThreadedSqliteSaver(SqliteSaver):
+            """SqliteSaver 只实现了同步接口，图以异步方式执行，这里把异步接口转发到线程池"""
+
+            async def aget_tuple(self, config):
+                return await asyncio.to_thread(self.get_tuple, config)
+
+            async def alist(self, config, *, filter=None, before=None, limit=None):
+                items = await asyncio.to_thread(
+                    lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+                )
+                for item in items:
+                    yield item
+
+            async def aput(self, config, checkpoint, metadata, new_versions):
+                return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+            async def aput_writes(self, config, writes, task_id, task_path=""):
+                return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+            async def adelete_thread(self, thread_id):
+                return await asyncio.to_thread(self.delete_thread, thread_id)
+
+        saver = ThreadedSqliteSaver(_connect(_sqlite_path("checkpoints.sqlite")))
+        saver.setup()
+        return saver
+    raise ValueError(f"未知的 STATE_BACKEND: {STATE_BACKEND}")
+
+
+# --- 后台任务进度 ---
+class ProgressStore(ABC):
+    """按键保存任务进度字典，例如知识库入库的 {"current", "total", "status"}"""
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None: ...
+
+    @abstractmethod
+    def set(self, key: str, value: dict): ...
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    @abstractmethod
+    def scan(self, prefix: str) -> list[tuple[str, dict]]:
+        """键以 prefix 开头的全部记录，供定期清理使用"""
+
+    def update(self, key: str, **fields):
+        value = self.get(key) or {}
+        value.update(fields)
+        self.set(key, value)
+
+    @abstractmethod
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """
+        原子地获取租约：键不存在、租约已过期或本来就由 owner 持有时写入 {"owner", "expires"} 并返回 True。
+        用于多个 worker 中只让一个执行定时任务。
+        """
+
+    @abstractmethod
+    def release_lease(self, key: str, owner: str):
+        """仍由 owner 持有时删除租约"""
+
+
+class MemoryProgressStore(ProgressStore):
+    def __init__(self):
+        self._data: dict[str, dict] = {}
+        self._lease_lock = threading.Lock()
+
+    def get(self, key):
+        value = self._data.get(key)
+        return dict(value) if value is not None else None
+
+    def set(self, key, value):
+        self._data[key] = dict(value)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def scan(self, prefix):
+        return [(key, dict(value)) for key, value in list(self._data.items()) if key.startswith(prefix)]
+
+    def acquire_lease(self, key, owner, ttl):
+        now = time.time()
+        with self._lease_lock:
+            lease = self._data.get(key)
+            if lease is not None and lease["owner"] != owner and lease["expires"] > now:
+                return False
+            self._data[key] = {"owner": owner, "expires": now + ttl}
+            return True
+
+    def release_lease(self, key, owner):
+        with self._lease_lock:
+            if (self._data.get(key) or {}).get("owner") == owner:
+                del self._data[key]
+
+
+class SqliteProgressStore(ProgressStore):
+    def __init__(self, path: str):
+        self._conn = _connect(path)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS progress (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM progress WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO progress (key, value, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM progress WHERE key = ?", (key,))
+
+    def scan(self, prefix):
+        # 主键上的范围查询；前缀只含 ASCII，末尾补一个最大码点作为上界
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM progress WHERE key >= ? AND key < ?", (prefix, prefix + "\U0010ffff")
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def acquire_lease(self, key, owner, ttl):
+        # 单条 UPSERT 语句完成“判断 + 写入”，多个进程同时争抢时只有一个能改到行
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO progress (key, value, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated "
+                "WHERE json_extract(progress.value, '$.expires') <= ? OR json_extract(progress.value, '$.owner') = ?",
+                (key, json.dumps({"owner": owner, "expires": now + ttl}), now, now, owner),
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, key, owner):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM progress WHERE key = ? AND json_extract(value, '$.owner') = ?", (key, owner)
+            )
+
+    def update(self, key, **fields):
+        # 读改写放在同一事务内，避免多个 worker 交错覆盖
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM progress WHERE key = ?", (key,)).fetchone()
+            value = json.loads(row[0]) if row else {}
+            value.update(fields)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO progress (key, value, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+
+
+# --- 上传媒体 ---
+class MediaExpired(LookupError):
+    """引用的附件已被清理（超过保留时长或按容量淘汰），需要重新上传"""
+
+    def __init__(self, ref: str):
+        super().__init__(f"附件 {ref[:12]} 已过期，请重新上传")
+
+
+class MediaStore(ABC):
+    """按内容寻址的媒体存储：put 返回 sha256 引用，相同内容只存一份"""
+
+    @abstractmethod
+    def put(self, data: bytes) -> str: ...
+
+    @abstractmethod
+    def get(self, ref: str) -> bytes:
+        """取回媒体内容；已被清理时抛出 MediaExpired"""
+
+    def local_path(self, ref: str) -> str | None:
+        """媒体在本机文件系统上的路径，没有时返回 None（调用方自行写临时文件）；已被清理时抛出 MediaExpired"""
+        return None
+
+    @staticmethod
+    def ref_of(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+
+class MemoryMediaStore(MediaStore):
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._size = 0
+        # 按最后访问时间排序，值为 (内容, 最后访问时间)
+        self._data: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, data):
+        ref = self.ref_of(data)
+        now = time.monotonic()
+        with self._lock:
+            if ref in self._data:
+                self._data[ref] = (data, now)
+                self._data.move_to_end(ref)
+                return ref
+            self._data[ref] = (data, now)
+            self._size += len(data)
+            while self._size > self.limit and len(self._data) > 1:
+                oldest, (_, accessed) = next(iter(self._data.items()))
+                # 其余条目都更晚被访问：进行中的请求可能还要读取，暂时超出容量
+                if now - accessed < MEDIA_PIN_WINDOW:
+                    break
+                evicted, _ = self._data.pop(oldest)
+                self._size -= len(evicted)
+        return ref
+
+    def get(self, ref):
+        with self._lock:
+            if ref not in self._data:
+                raise MediaExpired(ref)
+            data, _ = self._data[ref]
+            self._data[ref] = (data, time.monotonic())
+            self._data.move_to_end(ref)
+            return data
+
+
+class FileMediaStore(MediaStore):
+    """文件的修改时间即最后访问时间：读写时刷新，清理时据此判断过期与淘汰顺序，各 worker 共享"""
+
+    def __init__(self, root: str, limit: int, ttl: float):
+        self.root = root
+        self.limit = limit
+        self.ttl = ttl
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, ref: str) -> str:
+        return os.path.join(self.root, ref[:2], ref)
+
+    def put(self, data):
+        ref = self.ref_of(data)
+        path = self._path(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子改名，并发写入同一内容的 worker 不会读到半个文件
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._maybe_sweep()
+        else:
+            self._touch(path)
+        return ref
+
+    def get(self, ref):
+        path = self._path(ref)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise MediaExpired(ref) from None
+        self._touch(path)
+        return data
+
+    def local_path(self, ref):
+        path = self._path(ref)
+        if not self._touch(path):
+            raise MediaExpired(ref)
+        return path
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._sweep_lock:
+            if now - self._last_sweep < MEDIA_SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        threading.Thread(target=self.sweep, name="media-sweep", daemon=True).start()
+
+    def sweep(self) -> int:
+        """
+        删除过期文件，并按最后访问时间淘汰到容量上限以内，返回删除的文件数。
+        MEDIA_PIN_WINDOW 内访问过的文件不按容量淘汰；写入中的临时文件不参与淘汰，超过保留时长（写入中断）才删除。
+        """
+        entries = []
+        now = time.time()
+        cutoff = now - self.ttl
+        removed = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith(".tmp"):
+                    if stat.st_mtime < cutoff and self._remove(path):
+                        removed += 1
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            # 按时间从旧到新，之后的文件既未过期、总量也已在上限以内，或都是进行中的请求可能还要读取的
+            if (mtime >= cutoff and total <= self.limit) or now - mtime < MEDIA_PIN_WINDOW:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        if removed:
+            print(f"🧹 上传媒体清理：删除 {removed} 个文件，剩余 {total / 1024 / 1024:.1f} MB")
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+def _build_stores() -> tuple[ProgressStore, MediaStore]:
+    if STATE_BACKEND == "sqlite":
+        return SqliteProgressStore(_sqlite_path("progress.sqlite")), FileMediaStore(
+            os.path.join(STATE_DIR, "media"), MEDIA_STORE_LIMIT, MEDIA_STORE_TTL
+        )
+    return MemoryProgressStore(), MemoryMediaStore(MEMORY_MEDIA_LIMIT)
+
+
+progress_store, media_store = _build_stores()
@@ -0,0 +1,164 @@
+# app/storyboard.py
+"""
+分镜工作流：脚本 -> N 个镜头的画面 -> （可选）逐镜头视频。
+由大脑逐个调用 generate_image 时，每个镜头都要多一次大模型往返，且画图请求串行执行；
+这里用一次大模型调用规划全部镜头，再在有界并发下同时生成所有镜头的画面，
+某个镜头的画面完成后立即以其为首帧提交视频任务。每完成一项就回调一次，调用方据此流式推送。
+6 个镜头的总耗时约等于一次规划加一次画图，而不是六次画图加六次往返。
+"""
+import contextvars
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable
+
+from app import cancellation
+from app.cancellation import Cancelled
+from app.profiling import span
+from app.protocol import MEDIA, STORYBOARD
+
+STORYBOARD_MAX_SHOTS = 12
+# 进程内所有分镜任务共享的并发上限，避免多个分镜同时触发供应商限流
+STORYBOARD_IMAGE_CONCURRENCY = int(os.getenv("STORYBOARD_IMAGE_CONCURRENCY", "6"))
+STORYBOARD_VIDEO_CONCURRENCY = int(os.getenv("STORYBOARD_VIDEO_CONCURRENCY", "3"))
+PLAN_TIMEOUT = 60
+
+PLAN_PROMPT = """你是一名分镜导演。请把下面的脚本拆成 {shots} 个连续的镜头，只输出一个 JSON 数组，不要输出任何其他文字。
+数组的每个元素是一个对象，包含：
+- "title"：镜头标题，10 字以内
+- "image_prompt"：该镜头画面的中文绘画提示词，写清主体、环境、光影、构图与美术风格
+- "video_prompt"：让该画面动起来的中文描述，写清主体动作与镜头运动（如镜头缓慢推进、环绕）
+各镜头中人物的外观、服装与整体美术风格必须保持一致，提示词禁止翻译为英文。
+
+脚本：
+{script}"""
+
+_image_pool = ThreadPoolExecutor(max_workers=STORYBOARD_IMAGE_CONCURRENCY, thread_name_prefix="storyboard-image")
+_video_pool = ThreadPoolExecutor(max_workers=STORYBOARD_VIDEO_CONCURRENCY, thread_name_prefix="storyboard-video")
+
+
+class StoryboardError(Exception):
+    """分镜规划失败"""
+
+
+def parse_plan(text: str, shots: int) -> list[dict]:
+    """从模型输出中取出 JSON 数组；容忍前后的说明文字与 Markdown 代码块"""
+    start, end = text.find("["), text.rfind("]")
+    try:
+        items = json.loads(text[start:end + 1]) if start != -1 and end > start else None
+    except json.JSONDecodeError:
+        items = None
+    if not isinstance(items, list):
+        raise StoryboardError("分镜规划结果不是有效的 JSON 数组")
+    plan = []
+    for item in items:
+        if isinstance(item, dict) and str(item.get("image_prompt", "")).strip():
+            plan.append({
+                "index": len(plan),
+                "title": str(item.get("title") or f"镜头 {len(plan) + 1}"),
+                "image_prompt": str(item["image_prompt"]),
+                "video_prompt": str(item.get("video_prompt") or item["image_prompt"]),
+            })
+    if not plan:
+        raise StoryboardError("分镜规划结果中没有可用的镜头")
+    return plan[:shots]
+
+
+def plan_shots(script: str, shots: int, chat_label: str) -> list[dict]:
+    """一次大模型调用规划全部镜头"""
+    from langchain_core.messages import HumanMessage
+
+    from app.agent import get_llm
+
+    token = cancellation.current()
+    with span("storyboard:plan"):
+        message = get_llm(chat_label).invoke(
+            [HumanMessage(content=PLAN_PROMPT.format(shots=shots, script=script))], timeout=token.timeout(PLAN_TIMEOUT)
+        )
+    return parse_plan(message.content, shots)
+
+
+def _render_image(shot: dict) -> dict:
+    from app.tools import generate_image, invoke_media_tool
+
+    cancellation.current().check()
+    result, media, _ = invoke_media_tool(generate_image, shot["image_prompt"], detached=True)
+    if not media:
+        raise StoryboardError(result)
+    return media[0]
+
+
+def _render_video(shot: dict, first_frame_url: str) -> dict:
+    from app.tools import run_video_task
+
+    cancellation.current().check()
+    try:
+        with cancellation.tool_scope("generate_video"), span("storyboard:video"):
+            result, artifact = run_video_task(shot["video_prompt"], first_frame_url)
+    except Cancelled as e:
+        # 单个镜头超时只影响该镜头；整个请求被取消时继续向上抛出
+        if e.reason != "timeout":
+            raise
+        raise StoryboardError(f"视频生成超时 (超过 {cancellation.TOOL_TIMEOUTS['generate_video']} 秒)") from None
+    if not artifact or not artifact["media"]:
+        raise StoryboardError(result)
+    return artifact["media"][0]
+
+
+def _submit(pool: ThreadPoolExecutor, fn, *args) -> Future:
+    # 每个任务复制一份上下文：取消令牌与剖析 span 归属到发起请求
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def run(
+    script: str, shots: int, chat_label: str, with_video: bool, on_event: Callable[[str, dict], None]
+) -> list[dict]:
+    """
+    规划并生成分镜，返回每个镜头的结果 {"index", "title", "image", "video", "error"}。
+    进度通过 on_event(事件类型, 负载) 回调，事件类型与流式协议一致：
+    规划完成与单个镜头失败发 storyboard，每张画面 / 每段视频完成发 media（附带 shot 与 title）。
+    on_event 只在调用线程中执行。
+    """
+    shots = max(1, min(shots, STORYBOARD_MAX_SHOTS))
+    plan = plan_shots(script, shots, chat_label)
+    on_event(STORYBOARD, {"status": "planned", "shots": plan})
+
+    results = [{"index": shot["index"], "title": shot["title"], "image": None, "video": None, "error": None} for shot in plan]
+    pending: dict[Future, tuple[str, dict]] = {_submit(_image_pool, _render_image, shot): ("image", shot) for shot in plan}
+    token = cancellation.current()
+    try:
+        while pending:
+            # 分段等待，客户端断开后 1 秒内退出
+            remaining = token.remaining()
+            done, _ = wait(pending, timeout=1.0 if remaining is None else min(1.0, remaining), return_when=FIRST_COMPLETED)
+            token.check()
+            for future in done:
+                kind, shot = pending.pop(future)
+                result = results[shot["index"]]
+                try:
+                    media = future.result()
+                except Exception as e:
+                    result["error"] = str(e)
+                    on_event(STORYBOARD, {"status": "shot_failed", "index": shot["index"], "kind": kind, "message": str(e)})
+                    continue
+                result[kind] = media
+                on_event(MEDIA, {**media, "shot": shot["index"], "title": shot["title"]})
+                if kind == "image" and with_video:
+                    pending[_submit(_video_pool, _render_video, shot, media["url"])] = ("video", shot)
+    finally:
+        # 请求取消或出错时撤销尚未开始的镜头；已在执行的调用各自按取消令牌退出
+        for future in pending:
+            future.cancel()
+    return results
+
+
+def summarize(results: list[dict]) -> str:
+    """给大脑看的结果摘要，不含任何链接"""
+    lines = []
+    for result in results:
+        parts = [part for part in ("image", "video") if result[part]]
+        status = "、".join({"image": "画面", "video": "视频"}[p] for p in parts) + "已生成" if parts else "生成失败"
+        if result["error"]:
+            status += f"（{result['error'][:80]}）"
+        lines.append(f"镜头 {result['index'] + 1}「{result['title']}」：{status}")
+    return "\n".join(lines)
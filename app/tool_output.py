@@ -0,0 +1,308 @@
+# app/tool_output.py
+"""
+检索类工具结果的体积预算。工具结果会作为 ToolMessage 写进对话，此后每一跳都随提示词重发，
+并永久保存在对话检查点里。这里把结果整理成紧凑的条目，控制在各工具的字节 / token 预算之内：
+
+- 去重：同一来源的相邻知识块切分时带有重叠，首尾相接的块合并为一段；
+  内容高度重合（字符 n-gram 包含度）的结果只保留排名靠前的一条
+- 按查询抽取：每条结果按句切分，按与查询的字词重合度挑选句子，保持原文顺序，省略处以 … 标记
+- 原文外存：每条结果的完整内容按内容哈希存入 progress_store（键为 toolref:<id>），正文只带引用 id，
+  大脑需要全文时调用 read_reference 工具取回。原文保留 TOOL_REF_TTL 秒（再次检索到同一内容时续期），
+  过期的记录在写入新引用时定期清理，过期后 read_reference 提示重新检索
+
+预算由 TOOL_OUTPUT_BUDGETS 配置，如 "web_search=4000:1200"（字节:token），未列出的工具使用默认值。
+token 数按中日韩字符各计 1 个、其余字符每 4 个计 1 个估算。
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+
+from app.metrics import TOOL_OUTPUT_BYTES
+
+# 字节, token
+DEFAULT_BUDGETS = {
+    "search_knowledge_base": (4800, 1600),
+    "web_search": (4000, 1300),
+    "read_reference": (12000, 4000),
+}
+TOOL_OUTPUT_BUDGETS = os.getenv("TOOL_OUTPUT_BUDGETS", "")
+MIN_SNIPPET_CHARS = 60  # 分到的预算不足以放下这么多字时，剩余结果只计数不展示
+OVERLAP_MIN = 12  # 判定两块首尾相接的最短重叠字数
+OVERLAP_MAX = 120  # 切分重叠为 50 字，留出余量
+DUPLICATE_CONTAINMENT = 0.85
+REF_PREFIX = "toolref:"
+TOOL_REF_TTL = float(os.getenv("TOOL_REF_TTL", str(24 * 3600)))
+REF_SWEEP_INTERVAL = 600.0
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+_CJK = re.compile(r"[　-〿㐀-鿿豈-﫿＀-￯]")
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;\n])|(?<=\.)\s+")
+_TERMS = re.compile(r"[㐀-鿿]+|[A-Za-z0-9]+")
+
+
+def _parse_budgets(spec: str) -> dict[str, tuple[int, int]]:
+    budgets = dict(DEFAULT_BUDGETS)
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, limits = entry.partition("=")
+        max_bytes, _, max_tokens = limits.partition(":")
+        default_bytes, default_tokens = budgets.get(name.strip(), DEFAULT_BUDGETS["web_search"])
+        budgets[name.strip()] = (int(max_bytes or default_bytes), int(max_tokens or default_tokens))
+    return budgets
+
+
+BUDGETS = _parse_budgets(TOOL_OUTPUT_BUDGETS)
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class Budget:
+    """剩余的字节与 token 额度"""
+
+    def __init__(self, max_bytes: int, max_tokens: int):
+        self.bytes = max_bytes
+        self.tokens = max_tokens
+
+    def fits(self, text: str) -> bool:
+        return len(text.encode("utf-8")) <= self.bytes and estimate_tokens(text) <= self.tokens
+
+    def spend(self, text: str):
+        self.bytes -= len(text.encode("utf-8"))
+        self.tokens -= estimate_tokens(text)
+
+    def share(self, parts: int) -> "Budget":
+        return Budget(self.bytes // parts, self.tokens // parts)
+
+
+class Result:
+    """一条检索结果：title 为来源名或网页标题，url 可为空"""
+
+    def __init__(self, title: str, content: str, url: str = ""):
+        self.title = title
+        self.content = content
+        self.url = url
+        self.ref = ""
+
+
+# --- 去重 ---
+def _overlap(head: str, tail: str) -> int:
+    """head 的结尾与 tail 的开头重合的字数，不足 OVERLAP_MIN 时为 0"""
+    for size in range(min(OVERLAP_MAX, len(head), len(tail)), OVERLAP_MIN - 1, -1):
+        if head.endswith(tail[:size]):
+            return size
+    return 0
+
+
+def _shingles(text: str, size: int = 4) -> set[str]:
+    text = re.sub(r"\s+", "", text)
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+def dedupe(results: list[Result]) -> list[Result]:
+    """合并同一来源首尾相接的块，丢弃与排名更靠前的结果高度重合的结果；保持原有排名顺序"""
+    kept: list[Result] = []
+    for result in results:
+        merged = False
+        for other in kept:
+            if other.title != result.title or other.url != result.url:
+                continue
+            if size := _overlap(other.content, result.content):
+                other.content += result.content[size:]
+            elif size := _overlap(result.content, other.content):
+                other.content = result.content + other.content[size:]
+            else:
+                continue
+            merged = True
+            break
+        if merged:
+            continue
+        shingles = _shingles(result.content)
+        if any(
+            len(shingles & seen) >= DUPLICATE_CONTAINMENT * min(len(shingles), len(seen))
+            for seen in (_shingles(other.content) for other in kept)
+        ):
+            continue
+        kept.append(result)
+    return kept
+
+
+# --- 按查询抽取 ---
+def query_terms(query: str) -> set[str]:
+    """中文按字的二元组切分，英文与数字按词，均转为小写"""
+    terms = set()
+    for run in _TERMS.findall(query.lower()):
+        if _CJK.match(run):
+            terms.update(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+        elif len(run) > 1:
+            terms.add(run)
+    return terms
+
+
+def _sentences(text: str) -> list[str]:
+    return [s for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def extract(text: str, terms: set[str], budget: Budget) -> str:
+    """在预算内挑选与查询最相关的句子，按原文顺序拼接；原文放得下时原样返回"""
+    text = text.strip()
+    if budget.fits(text):
+        return text
+    sentences = _sentences(text)
+    scores = [sum(1 for term in terms if term in sentence.lower()) for sentence in sentences]
+    # 得分相同时靠前的句子优先；需要裁剪时只保留命中查询的句子，一句都没命中时取开头（导语通常概括全段）
+    scored = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+    if any(scores):
+        scored = [i for i in scored if scores[i]]
+    chosen: set[int] = set()
+    for i in scored:
+        candidate = _join(sentences, chosen | {i})
+        if budget.fits(candidate):
+            chosen.add(i)
+    if chosen:
+        return _join(sentences, chosen)
+    # 单句就超出预算：从最相关的句子开头按字截断
+    best = sentences[scored[0]].strip() if sentences else text
+    return _truncate(best, budget)
+
+
+def _join(sentences: list[str], chosen: set[int]) -> str:
+    parts, last = [], -1
+    for i in sorted(chosen):
+        if i != last + 1:
+            parts.append("…")
+        parts.append(sentences[i].strip())
+        last = i
+    if last != len(sentences) - 1:
+        parts.append("…")
+    return "".join(parts)
+
+
+def _truncate(text: str, budget: Budget) -> str:
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if budget.fits(text[:mid] + "…"):
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…" if low else ""
+
+
+# --- 原文外存 ---
+def _expired(entry: dict, now: float) -> bool:
+    return now - entry.get("created", 0) > TOOL_REF_TTL
+
+
+def store_reference(result: Result) -> str:
+    """按内容哈希保存完整结果，返回引用 id；相同内容只存一份，过了一半保留期时续期"""
+    from app.state import progress_store
+
+    ref = hashlib.sha256(f"{result.url}\n{result.content}".encode("utf-8")).hexdigest()[:12]
+    now = time.time()
+    entry = progress_store.get(REF_PREFIX + ref)
+    if entry is None or now - entry.get("created", 0) > TOOL_REF_TTL / 2:
+        progress_store.set(
+            REF_PREFIX + ref,
+            {"title": result.title, "url": result.url, "content": result.content, "created": now},
+        )
+    _maybe_prune()
+    return ref
+
+
+def load_reference(ref: str) -> dict | None:
+    """取回引用；不存在或已过期时返回 None（过期记录顺带删除）"""
+    from app.state import progress_store
+
+    key = REF_PREFIX + ref.strip().removeprefix("ref=")
+    entry = progress_store.get(key)
+    if entry is not None and _expired(entry, time.time()):
+        progress_store.delete(key)
+        return None
+    return entry
+
+
+def _maybe_prune():
+    global _last_sweep
+    now = time.monotonic()
+    with _sweep_lock:
+        if now - _last_sweep < REF_SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    threading.Thread(target=prune_references, name="toolref-prune", daemon=True).start()
+
+
+def prune_references() -> int:
+    """删除过期的原文记录，返回删除条数"""
+    from app.state import progress_store
+
+    now = time.time()
+    expired = [key for key, entry in progress_store.scan(REF_PREFIX) if _expired(entry, now)]
+    for key in expired:
+        progress_store.delete(key)
+    if expired:
+        print(f"🧹 清理过期的检索原文 {len(expired)} 条")
+    return len(expired)
+
+
+# --- 组装 ---
+def _header(index: int, result: Result, trimmed: bool) -> str:
+    source = f"{result.title} | {result.url}" if result.url else result.title
+    note = f"（原文 {len(result.content)} 字，已摘录）" if trimmed else ""
+    return f"[{index}] ref={result.ref} 来源: {source}{note}\n"
+
+
+def render(tool: str, query: str, results: list[Result]) -> tuple[str, dict]:
+    """
+    去重、外存原文并在预算内摘录，返回 (给大脑的文本, artifact)。
+    artifact 只含各条结果的引用 id、来源与原文长度，不含正文。
+    """
+    raw = sum(len(r.content.encode("utf-8")) for r in results)
+    results = dedupe(results)
+    terms = query_terms(query)
+    budget = Budget(*BUDGETS.get(tool, DEFAULT_BUDGETS["web_search"]))
+    footer = "如需某条的完整原文，调用 read_reference 并传入其 ref。"
+    budget.spend(footer)
+    blocks, shown = [], []
+    for position, result in enumerate(results):
+        result.ref = store_reference(result)
+        # 每条结果平分剩余预算，前面用不完的额度顺延给后面
+        share = budget.share(len(results) - position)
+        header = _header(len(shown) + 1, result, trimmed=True)
+        share.spend(header)
+        snippet = extract(result.content, terms, share) if share.bytes > 0 and share.tokens > 0 else ""
+        if len(snippet) < min(MIN_SNIPPET_CHARS, len(result.content.strip())):
+            continue
+        block = _header(len(shown) + 1, result, trimmed=snippet != result.content.strip()) + snippet
+        budget.spend(block + "\n\n")
+        blocks.append(block)
+        shown.append(result)
+    if len(shown) < len(results):
+        blocks.append(f"（另有 {len(results) - len(shown)} 条结果因篇幅省略）")
+    text = "\n\n".join(blocks + [footer])
+    TOOL_OUTPUT_BYTES.inc(tool, "raw", amount=raw)
+    TOOL_OUTPUT_BYTES.inc(tool, "returned", amount=len(text.encode("utf-8")))
+    artifact = {
+        "references": [
+            {"ref": r.ref, "title": r.title, "url": r.url, "chars": len(r.content)} for r in shown
+        ]
+    }
+    return text, artifact
+
+
+def read(ref: str, query: str = "") -> str | None:
+    """按引用 id 取回原文，超出 read_reference 的预算时按 query 摘录；引用不存在或已过期时返回 None"""
+    entry = load_reference(ref)
+    if entry is None:
+        return None
+    source = f"{entry['title']} | {entry['url']}" if entry.get("url") else entry["title"]
+    header = f"【来源: {source}】\n"
+    budget = Budget(*BUDGETS["read_reference"])
+    budget.spend(header)
+    return header + extract(entry["content"], query_terms(query), budget)
@@ -1,50 +1,154 @@
 # app/tools.py
 import os
 import time
-import base64
-import tempfile
-import cv2
+import functools
+import inspect
+import typing
 import requests
+from langchain_core.callbacks.manager import dispatch_custom_event
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
-from tavily import TavilyClient
-from app.rag import query_knowledge_base
-from app.context import current_image_data, current_video_data, current_vision_model
+from app import cancellation, storyboard, tool_output, trending, vision
+from app.cancellation import Cancelled
+from app.rag import search_documents
+from app.context import current_image_ref, current_model_config, current_video_ref, current_vision_model
+from app.endpoints import TAVILY_BASE_URL, VOLC_BASE_URL
+from app.metrics import CANCELLED_WORK, TOOL_ERRORS, TOOL_SECONDS
+from app.profiling import span
+from app.protocol import STORYBOARD_EVENT, VIDEO_SEGMENT_EVENT
+from app.state import MediaExpired
 
-# 初始化搜索客户端 (防止 Key 缺失导致启动崩溃，改为调用时检查)
-tavily_api_key = os.getenv("TAVILY_API_KEY")
-tavily_client = TavilyClient(api_key=tavily_api_key) if tavily_api_key else None
 
+@functools.lru_cache(maxsize=1)
+def get_tavily_client():
+    """首次使用时创建搜索客户端，未配置 Key 时返回 None (防止启动崩溃，改为调用时检查)"""
+    tavily_api_key = os.getenv("TAVILY_API_KEY")
+    if not tavily_api_key:
+        return None
+    from tavily import TavilyClient
 
-@tool
-def web_search(query: str) -> str:
-    """联网搜索工具，用于查找实时信息。"""
+    return TavilyClient(api_key=tavily_api_key, api_base_url=TAVILY_BASE_URL)
+
+
+# 视频任务轮询间隔 (秒)
+VIDEO_POLL_INTERVAL = float(os.getenv("VIDEO_POLL_INTERVAL", "5"))
+
+# 工具内部捕获异常后以文本返回错误，按这些前缀识别失败
+ERROR_MARKERS = ("❌", "搜索报错", "查询报错", "API 报错", "画图请求异常", "造梦机请求异常", "视觉解析接口报错", "分镜工作流异常", "热点查询报错")
+
+
+def _media_failure(message: str, status_code: int | None = None) -> tuple[str, dict]:
+    """
+    生成类工具的失败结果：artifact 不含媒体，retryable 标记是否值得重试，
+    即限流（429）、服务端错误（5xx）或请求本身异常（status_code 为 None）。
+    """
+    return message, {"media": [], "retryable": status_code is None or status_code == 429 or status_code >= 500}
+
+
+def instrumented(func):
+    """记录工具耗时与失败次数，并在独立超时的取消作用域中执行工具，放在 @tool 之下使用"""
+    # content_and_artifact 工具返回 (文本, artifact)，取消时也要保持同样的形状
+    returns_artifact = typing.get_origin(inspect.signature(func).return_annotation) is tuple
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with cancellation.tool_scope(func.__name__), span(f"tool:{func.__name__}"):
+                result = func(*args, **kwargs)
+        except Cancelled as e:
+            CANCELLED_WORK.inc(f"tool:{func.__name__}", e.reason)
+            TOOL_ERRORS.inc(func.__name__)
+            if e.reason == "timeout":
+                message = f"❌ 工具执行超时 (超过 {cancellation.TOOL_TIMEOUTS.get(func.__name__, cancellation.DEFAULT_TOOL_TIMEOUT)} 秒)，已放弃本次调用。"
+            else:
+                message = f"❌ 工具调用已取消 ({e.reason})。"
+            return (message, None) if returns_artifact else message
+        except Exception:
+            TOOL_ERRORS.inc(func.__name__)
+            raise
+        finally:
+            TOOL_SECONDS.observe(func.__name__, value=time.perf_counter() - start)
+        content = result[0] if isinstance(result, tuple) else result
+        if isinstance(content, str) and content.startswith(ERROR_MARKERS):
+            TOOL_ERRORS.inc(func.__name__)
+        return result
+
+    return wrapper
+
+
+@tool(response_format="content_and_artifact")
+@instrumented
+def web_search(query: str) -> tuple[str, dict | None]:
+    """联网搜索工具，用于查找实时信息。结果为按查询摘录的片段，每条带 ref，需要全文时用 read_reference 读取。"""
+    tavily_client = get_tavily_client()
     if not tavily_client:
-        return "❌ 错误: 未配置 TAVILY_API_KEY"
+        return "❌ 错误: 未配置 TAVILY_API_KEY", None
     try:
-        response = tavily_client.search(query=query, search_depth="advanced", max_results=5)
+        with span("upstream:tavily"):
+            response = tavily_client.search(
+                query=query, search_depth="advanced", max_results=5, timeout=cancellation.current().timeout(60)
+            )
         results = response.get("results", [])
         if not results:
-            return "未搜索到相关结果。"
-        context = [f"【来源: {r['title']}】\n{r['content']}" for r in results]
-        return "\n\n".join(context)
+            return "未搜索到相关结果。", None
+        return tool_output.render(
+            "web_search", query, [tool_output.Result(r["title"], r.get("content") or "", r.get("url", "")) for r in results]
+        )
+    except Exception as e:
+        return f"搜索报错: {e}", None
+
+
+@tool(response_format="content_and_artifact")
+@instrumented
+def search_knowledge_base(query: str) -> tuple[str, dict | None]:
+    """查阅本地知识库。结果为按查询摘录的片段，每条带 ref，需要全文时用 read_reference 读取。"""
+    try:
+        docs = search_documents(query, k=15)  # 给大模型更多知识块，去重与摘录后按预算截取
+        if not docs:
+            return "知识库里没有找到相关内容。", None
+        return tool_output.render(
+            "search_knowledge_base", query, [tool_output.Result(d.metadata.get("source", "未知"), d.page_content) for d in docs]
+        )
     except Exception as e:
-        return f"搜索报错: {e}"
+        return f"查询报错: {e}", None
 
 
 @tool
-def search_knowledge_base(query: str) -> str:
-    """查阅本地知识库"""
+@instrumented
+def read_reference(ref: str, query: str = "") -> str:
+    """
+    读取 web_search 或 search_knowledge_base 某条结果的完整原文，ref 为结果中标注的引用 id。
+    只有摘录不足以回答时才调用；原文过长时按 query 摘录与之相关的部分。
+    """
     try:
-        result = query_knowledge_base(query, k=15)  # 给大模型更多知识块
-        return result if result else "知识库里没有找到相关内容。"
+        text = tool_output.read(ref, query)
+        if text is None:
+            # 原文只保留 TOOL_REF_TTL，较早轮次的引用可能已被清理
+            return f"❌ 引用 {ref} 不存在或已过期，请使用检索结果中标注的 ref；较早的结果请重新检索。"
+        return text
     except Exception as e:
         return f"查询报错: {e}"
 
 
 @tool
-def generate_image(prompt: str) -> str:
+@instrumented
+def search_trending(query: str = "", platform: str = "") -> str:
+    """
+    查询本地热点榜单索引（微博、知乎、抖音等平台热榜，后台定时更新）。
+    用户询问"最近有什么热点"、"今天的热搜"、"某话题现在火不火"或需要结合热点选题时，优先调用此工具，而不是联网搜索；
+    只有此工具没有结果时才使用 web_search。
+    query 为空时按排名列出各平台当前热榜；否则按语义检索相关热点。platform 可限定来源名称（如 weibo）。
+    """
+    try:
+        result = trending.search(query, platform)
+        return result if result else "本地热点索引中没有相关内容，可以改用 web_search 联网搜索。"
+    except Exception as e:
+        return f"热点查询报错: {e}"
+
+
+@tool(response_format="content_and_artifact")
+@instrumented
+def generate_image(prompt: str) -> tuple[str, dict | None]:
     """
     AI 绘画工具。
     【极其重要的要求】：我们现在使用的是纯国产视觉大模型，它对中国神话、东方美学和中文修辞的理解是原生的！
@@ -56,10 +160,10 @@ def generate_image(prompt: str) -> str:
     endpoint_id = os.getenv("DOUBAO_IMAGE_ENDPOINT")
 
     if not api_key or not endpoint_id:
-        return "❌ 错误: 未配置 VOLC_API_KEY 或 DOUBAO_IMAGE_ENDPOINT。请检查 .env 文件。"
+        return "❌ 错误: 未配置 VOLC_API_KEY 或 DOUBAO_IMAGE_ENDPOINT。请检查 .env 文件。", None
 
     # 火山引擎统一大模型推理接口
-    url = "https://ark.cn-beijing.volces.com/api/v3/images/generations"
+    url = f"{VOLC_BASE_URL}/images/generations"
     payload = {
         "model": endpoint_id,
         "prompt": prompt
@@ -71,39 +175,49 @@ def generate_image(prompt: str) -> str:
     }
 
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
+        with span("upstream:volc_image"):
+            response = requests.post(url, json=payload, headers=headers, timeout=cancellation.current().timeout(60))
 
         if response.status_code == 200:
             data = response.json()
             image_url = data["data"][0]["url"]
             print(f"✅ 图片生成成功 (已获取长链接)")
 
-            # 🛑 核心隐匿信令机制：把 URL 藏在系统提示里供后端正则提取，严令大模型闭嘴
-            return f"[System Hidden URL: {image_url}] Action Success! 图片已成功在后台推送。请用自然语言告诉用户“图片已为您生成”，【绝对禁止】在回复中输出任何 URL 链接或 Markdown 代码！"
+            # 🛑 核心隐匿机制：URL 只放在工具 artifact 里推送给前端，大模型看不到链接
+            return (
+                "Action Success! 图片已成功在后台推送。请用自然语言告诉用户“图片已为您生成”，【绝对禁止】在回复中输出任何 URL 链接或 Markdown 代码！",
+                {"media": [{"kind": "image", "url": image_url}]},
+            )
         else:
-            return f"API 报错 (状态码 {response.status_code}): {response.text}"
+            return _media_failure(f"API 报错 (状态码 {response.status_code}): {response.text}", response.status_code)
 
     except Exception as e:
-        return f"画图请求异常: {e}"
+        return _media_failure(f"画图请求异常: {e}")
 
 
-@tool
-def generate_video(prompt: str) -> str:
+@tool(response_format="content_and_artifact")
+@instrumented
+def generate_video(prompt: str) -> tuple[str, dict | None]:
     """
     视频生成工具（造梦机）。
     当用户明确要求"生成视频"、"让画面动起来"、"制作短片"时，必须调用此工具。
     【重要提示】：提示词(prompt)必须是极其详细的中文描述，需包含：主体描述、环境背景、光影氛围，以及【镜头运动】（如：镜头缓慢推进、全景环绕等）。绝对禁止翻译为英文。
     """
+    return run_video_task(prompt)
+
+
+def run_video_task(prompt: str, first_frame_url: str | None = None) -> tuple[str, dict | None]:
+    """提交造梦机任务并轮询到结束；给出 first_frame_url 时以该图片为首帧（图生视频），返回值同 generate_video"""
     print(f"🎬 [调用造梦机] 正在准备发送中文 Prompt: {prompt}", flush=True)
 
     api_key = os.getenv("VOLC_API_KEY")
     endpoint_id = os.getenv("DOUBAO_VIDEO_ENDPOINT")
 
     if not api_key or not endpoint_id:
-        return "❌ 错误: 未配置 VOLC_API_KEY 或 DOUBAO_VIDEO_ENDPOINT。请检查 .env 文件。"
+        return "❌ 错误: 未配置 VOLC_API_KEY 或 DOUBAO_VIDEO_ENDPOINT。请检查 .env 文件。", None
 
     # 1. 🚀 创建视频生成任务
-    create_url = "https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks"
+    create_url = f"{VOLC_BASE_URL}/contents/generations/tasks"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
@@ -112,27 +226,31 @@ def generate_video(prompt: str) -> str:
         "model": endpoint_id,
         "content": [{"type": "text", "text": prompt}]
     }
+    if first_frame_url:
+        payload["content"].append({"type": "image_url", "image_url": {"url": first_frame_url}})
 
+    token = cancellation.current()
+    task_id = None
     try:
         print("⏳ 正在向火山引擎提交视频任务...", flush=True)
-        resp = requests.post(create_url, json=payload, headers=headers, timeout=30)
+        resp = requests.post(create_url, json=payload, headers=headers, timeout=token.timeout(30))
         if resp.status_code != 200:
-            return f"❌ 创建任务失败 (状态码 {resp.status_code}): {resp.text}"
+            return _media_failure(f"❌ 创建任务失败 (状态码 {resp.status_code}): {resp.text}", resp.status_code)
 
         task_data = resp.json()
         task_id = task_data.get("id")
         if not task_id:
-            return f"❌ 未能获取到 Task ID: {task_data}"
+            return f"❌ 未能获取到 Task ID: {task_data}", None
 
         print(f"✅ 任务提交成功，Task ID: {task_id}。开始进行轮询监听...", flush=True)
 
-        # 2. 🔄 轮询任务状态 (每 5 秒查一次，最大等待 6 分钟)
-        poll_url = f"https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks/{task_id}"
-        max_attempts = 72  # 72 * 5秒 = 360秒
+        # 2. 🔄 轮询任务状态 (默认每 5 秒查一次，最大等待 6 分钟)
+        poll_url = f"{VOLC_BASE_URL}/contents/generations/tasks/{task_id}"
+        max_attempts = int(360 / VIDEO_POLL_INTERVAL)
 
         for attempt in range(max_attempts):
-            time.sleep(5)
-            poll_resp = requests.get(poll_url, headers=headers, timeout=10)
+            token.sleep(VIDEO_POLL_INTERVAL)
+            poll_resp = requests.get(poll_url, headers=headers, timeout=token.timeout(10))
 
             if poll_resp.status_code == 200:
                 poll_data = poll_resp.json()
@@ -147,134 +265,135 @@ def generate_video(prompt: str) -> str:
 
                     if video_url:
                         print(f"✅ 造梦机视频生成成功！长链接已获取: {video_url[:70]}...", flush=True)
-                        return f"[System Hidden Video URL: {video_url}] Action Success! 视频已在后台推送。请用自然语言告诉用户视频已生成，【绝对禁止】输出 URL 或 Markdown 代码！"
+                        return (
+                            "Action Success! 视频已在后台推送。请用自然语言告诉用户视频已生成，【绝对禁止】输出 URL 或 Markdown 代码！",
+                            {"media": [{"kind": "video", "url": video_url}]},
+                        )
                     else:
-                        return f"❌ 任务成功，但未找到 video_url。返回体: {poll_data}"
+                        return f"❌ 任务成功，但未找到 video_url。返回体: {poll_data}", None
 
                 elif status in ["failed", "canceled", "error"]:
-                    return f"❌ 视频生成失败或被系统拦截，最终状态: {status}。返回体: {poll_data}"
+                    return f"❌ 视频生成失败或被系统拦截，最终状态: {status}。返回体: {poll_data}", None
 
                 # status 为 'queued' 或 'running' 时，跳过当前循环，继续等待
             else:
                 print(f"⚠️ 轮询请求异常 (状态码 {poll_resp.status_code})，继续重试...", flush=True)
 
-        return "❌ 视频生成超时 (超过6分钟)。任务可能仍在火山后台运行，请稍后前往控制台查看。"
+        return "❌ 视频生成超时 (超过6分钟)。任务可能仍在火山后台运行，请稍后前往控制台查看。", None
+
+    except Cancelled as e:
+        # 用户已离开或撤销了批量任务：撤销排队中的任务，避免继续消耗额度；工具超时则保留任务，与轮询超时的处理一致
+        if task_id and e.reason in ("disconnected", "cancelled"):
+            _cancel_video_task(task_id, headers)
+        raise
+    except Exception as e:
+        # 任务已创建后的轮询异常不重试，重新提交会再生成一个视频
+        if task_id:
+            return f"造梦机请求异常: {e}", None
+        return _media_failure(f"造梦机请求异常: {e}")
+
 
+def _cancel_video_task(task_id: str, headers: dict):
+    try:
+        requests.delete(f"{VOLC_BASE_URL}/contents/generations/tasks/{task_id}", headers=headers, timeout=5)
+        print(f"🛑 已撤销视频任务 {task_id}", flush=True)
     except Exception as e:
-        return f"造梦机请求异常: {e}"
+        print(f"⚠️ 撤销视频任务 {task_id} 失败: {e}", flush=True)
 
 
 @tool
+@instrumented
 def analyze_uploaded_image(question: str) -> str:
     """
     视觉解析工具。
     当用户要求你“看图”、“分析图片”或“根据上传的图片进行创作/画图”时，你必须优先调用此工具。
     输入参数 question 是你想让视觉中枢帮你观察的问题（例如：“详细描述图中的人物、构图、美术风格和色彩”）。
     """
-    base64_img = current_image_data.get()
-    if not base64_img:
+    image_ref = current_image_ref.get()
+    if not image_ref:
         return "❌ 视觉感知失败：当前环境没有检测到用户上传的图片。"
 
     vision_model_label = current_vision_model.get()
     print(f"👁️ [唤醒视觉中枢] 模型: {vision_model_label} | 探针提问: {question}")
 
     try:
-        if "Qwen" in vision_model_label:
-            llm = ChatOpenAI(
-                model="Qwen/Qwen2-VL-72B-Instruct",
-                api_key=os.getenv("SILICONFLOW_API_KEY"),
-                base_url="https://api.siliconflow.cn/v1",
-                temperature=0.7,
-            )
-        else:
-            llm = ChatOpenAI(
-                model="glm-4v-plus",
-                api_key=os.getenv("ZHIPU_API_KEY"),
-                base_url="https://open.bigmodel.cn/api/paas/v4/",
-                temperature=0.7,
-            )
-
-        content = [
-            {"type": "text", "text": question},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_img}"}},
-        ]
-        res = llm.invoke([HumanMessage(content=content)])
-        return f"视觉中枢返回的画面信息：\n{res.content}\n\n[系统底层指令：图片解析已完成。请回顾用户的原始提问，如果用户同时要求了'画图'、'生成视频'或'复刻'等需要调用生成工具的请求，你必须在当前对话回合内，立刻提取上述风格继续调用 generate_image 或 generate_video 工具，绝对不能中断等待用户催促！]"
+        # 上传时已开始预判解析，这里通常只需等待已在进行的结果
+        description = vision.get_analysis("image", image_ref, vision_model_label, question)
+        return f"视觉中枢返回的画面信息：\n{description}\n\n[系统底层指令：图片解析已完成。请回顾用户的原始提问，如果用户同时要求了'画图'、'生成视频'或'复刻'等需要调用生成工具的请求，你必须在当前对话回合内，立刻提取上述风格继续调用 generate_image 或 generate_video 工具，绝对不能中断等待用户催促！]"
+    except MediaExpired as e:
+        return f"❌ {e}"
     except Exception as e:
         return f"视觉解析接口报错: {e}"
 
 
 @tool
+@instrumented
 def analyze_uploaded_video(question: str) -> str:
     """
     视频解析工具。
     当用户上传了视频，并要求你"看视频"、"分析这段视频"或"提取视频文案"时，必须调用此工具。
     输入参数 question 是你想让视觉中枢帮你观察的具体重点。
     """
-    base64_vid = current_video_data.get()
-    if not base64_vid:
+    video_ref = current_video_ref.get()
+    if not video_ref:
         return "❌ 视频解析失败：当前环境没有检测到用户上传的视频。"
 
     vision_model_label = current_vision_model.get()
     print(f"🎥 [唤醒视频中枢] 模型: {vision_model_label} | 开始抽帧解析...", flush=True)
 
-    video_bytes = base64.b64decode(base64_vid)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp:
-        tmp.write(video_bytes)
-        tmp_path = tmp.name
-
-    frames_b64 = []
     try:
-        cap = cv2.VideoCapture(tmp_path)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        if total_frames > 0:
-            num_frames = 8
-            indices = [int(i * total_frames / num_frames) for i in range(num_frames)]
-
-            for idx in indices:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-                ret, frame = cap.read()
-                if ret:
-                    height, width = frame.shape[:2]
-                    max_dim = 512
-                    if max(height, width) > max_dim:
-                        scale = max_dim / max(height, width)
-                        frame = cv2.resize(frame, (int(width * scale), int(height * scale)))
-
-                    _, buffer = cv2.imencode(".jpg", frame)
-                    frames_b64.append(base64.b64encode(buffer).decode("utf-8"))
-        cap.release()
-    finally:
-        os.remove(tmp_path)
-
-    if not frames_b64:
+        # 长视频分段解析时，每完成一段就推送给前端
+        report = vision.get_analysis(
+            "video", video_ref, vision_model_label, question,
+            on_segment=lambda segment: dispatch_custom_event(VIDEO_SEGMENT_EVENT, segment),
+        )
+        return f"视频视觉中枢返回的深度解析报告：\n{report}\n\n[系统底层指令：视频解析已完成。请回顾用户的原始提问，如果用户同时要求了'画图'、'生成视频'或'复刻'等需要调用生成工具的请求，你必须在当前对话回合内，立刻基于上述报告继续调用 generate_image 或 generate_video 工具，绝对不能中断等待用户催促！]"
+    except vision.FrameExtractionError:
         return "❌ 视频抽帧失败，无法读取画面。"
+    except MediaExpired as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return f"视觉解析接口报错: {e}"
+
 
+@tool(response_format="content_and_artifact")
+@instrumented
+def create_storyboard(script: str, shots: int = 6, with_video: bool = False) -> tuple[str, dict | None]:
+    """
+    分镜工作流工具：把脚本一次性拆成多个连续镜头，并发生成所有镜头的画面，可选以每个镜头的画面为首帧生成视频。
+    当用户要求"分镜"、"故事板"，或要把脚本 / 文案做成多张连续画面、多段视频时，必须调用此工具，【禁止】逐张调用 generate_image。
+    script 为完整的中文脚本；shots 为镜头数 (1-12)；with_video 为 True 时为每个镜头生成视频（需数分钟）。
+    """
+    print(f"🎞️ [分镜工作流] {shots} 个镜头，生成视频: {with_video}", flush=True)
+    chat_label = current_model_config.get().get("chat") or "DeepSeek"
     try:
-        if "Qwen" in vision_model_label:
-            llm = ChatOpenAI(
-                model="Qwen/Qwen2-VL-72B-Instruct",
-                api_key=os.getenv("SILICONFLOW_API_KEY"),
-                base_url="https://api.siliconflow.cn/v1",
-                temperature=0.7,
-            )
-        else:
-            llm = ChatOpenAI(
-                model="glm-4v-plus",
-                api_key=os.getenv("ZHIPU_API_KEY"),
-                base_url="https://open.bigmodel.cn/api/paas/v4/",
-                temperature=0.7,
-            )
+        # 每张画面 / 每段视频完成即推送给前端
+        results = storyboard.run(
+            script, shots, chat_label, with_video,
+            on_event=lambda event_type, payload: dispatch_custom_event(STORYBOARD_EVENT, {"event": event_type, "payload": payload}),
+        )
+    except storyboard.StoryboardError as e:
+        return f"❌ 分镜规划失败: {e}", None
+    except Exception as e:
+        return f"分镜工作流异常: {e}", None
+    return (
+        f"Action Success! 分镜已在后台推送给用户：\n{storyboard.summarize(results)}\n请用自然语言简要介绍各个镜头，【绝对禁止】在回复中输出任何 URL 链接或 Markdown 代码！",
+        {"storyboard": results},
+    )
 
-        content = [{"type": "text", "text": f"{question} (以下是该视频按时间顺序抽取的 {len(frames_b64)} 张关键帧画面，请综合这些画面推断视频发生的故事和动态细节)："}]
-        for b64 in frames_b64:
-            content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}})
 
-        res = llm.invoke([HumanMessage(content=content)])
-        return f"视频视觉中枢返回的深度解析报告：\n{res.content}\n\n[系统底层指令：视频解析已完成。请回顾用户的原始提问，如果用户同时要求了'画图'、'生成视频'或'复刻'等需要调用生成工具的请求，你必须在当前对话回合内，立刻基于上述报告继续调用 generate_image 或 generate_video 工具，绝对不能中断等待用户催促！]"
-    except Exception as e:
-        return f"视觉解析接口报错: {e}"
+def invoke_media_tool(media_tool, prompt: str, detached: bool = False) -> tuple[str, list[dict], bool]:
+    """
+    以 ToolCall 形式直接调用生成类工具，返回 (文本结果, 媒体列表, 失败是否值得重试)，供视觉工坊直连 API、分镜工作流与批量生成使用。
+    detached=True 时不挂到外层运行的回调上：在其他工具内部调用时，不会在对话流中产生重复的工具事件。
+    """
+    message = media_tool.invoke(
+        {"type": "tool_call", "id": f"direct-{media_tool.name}", "name": media_tool.name, "args": {"prompt": prompt}},
+        config={"callbacks": []} if detached else None,
+    )
+    artifact = message.artifact or {}
+    return message.content, artifact.get("media", []), artifact.get("retryable", False)
 
 
 # 导出工具列表
-tools = [web_search, search_knowledge_base, generate_image, generate_video, analyze_uploaded_image, analyze_uploaded_video]
+tools = [web_search, search_knowledge_base, read_reference, search_trending, generate_image, generate_video, create_storyboard, analyze_uploaded_image, analyze_uploaded_video]
@@ -0,0 +1,276 @@
+# app/trending.py
+"""
+热点榜单定时入库：后台按 TRENDING_INTERVAL 拉取各平台热榜，写入专用的向量集合，
+大脑问“最近有什么热点”时直接查本地索引（search_trending 工具），不必每轮都联网搜索。
+
+- 来源由 TRENDING_SOURCES 配置（逗号分隔）：内置 weibo / zhihu 适配器，或 名称=地址 形式的通用 JSON 榜单，
+  地址可以是本地文件（便于用固定样例联调）或 HTTP 链接，格式为 {"items": [{"title", "url", "heat", "summary"}]}
+- 每个条目以 (平台, 标题, 摘要) 的内容哈希作为向量 ID：新内容才向量化写入；
+  仍在榜上的旧内容只更新排名、热度与所属分区，不重新向量化
+- 条目按最后一次上榜的时间落入 TRENDING_PARTITION_HOURS 小时一个的分区，
+  超过 TRENDING_RETENTION_HOURS 未再上榜的分区在每次刷新时整体删除
+- 上次刷新时间记录在 progress_store 中；多个 worker 各自运行调度器，到期后先在 progress_store 中
+  原子地领取租约（trending:lease），只有领到的 worker 刷新，其他 worker 稍后重新读取刷新时间
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import urllib.parse
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from app.profiling import span
+from app.state import progress_store
+
+TRENDING_SOURCES = os.getenv("TRENDING_SOURCES", "")
+TRENDING_INTERVAL = float(os.getenv("TRENDING_INTERVAL", "1800"))
+TRENDING_PARTITION_HOURS = float(os.getenv("TRENDING_PARTITION_HOURS", "6"))
+TRENDING_RETENTION_HOURS = float(os.getenv("TRENDING_RETENTION_HOURS", "48"))
+TRENDING_MAX_ITEMS = 50  # 每个来源每次最多入库的条目数
+FETCH_TIMEOUT = 15
+STATUS_KEY = "trending:status"
+LEASE_KEY = "trending:lease"
+LEASE_TTL = 900.0  # 租约时长，须长于一次刷新；持有者崩溃时到期后由其他 worker 接手
+LEASE_RETRY = 30.0  # 没领到租约时，隔多久再看一次刷新时间
+# 本进程的租约持有者标识
+_owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# 刷新只在这个单线程池中执行：定时与手动触发的刷新不会并发写同一集合
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trending")
+
+
+# --- 来源适配器 ---
+class TrendingSource(ABC):
+    """热榜来源：fetch 按榜单顺序返回 [{"title", "url", "heat", "summary"}]"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @abstractmethod
+    def fetch(self) -> list[dict]: ...
+
+    def _get_json(self, url: str) -> dict:
+        import requests
+
+        response = requests.get(url, timeout=FETCH_TIMEOUT, headers={"User-Agent": "Mozilla/5.0 MediaCraft"})
+        response.raise_for_status()
+        return response.json()
+
+
+class FeedSource(TrendingSource):
+    """通用 JSON 榜单：本地文件或 HTTP 地址"""
+
+    def __init__(self, name: str, location: str):
+        super().__init__(name)
+        self.location = location
+
+    def fetch(self) -> list[dict]:
+        if self.location.startswith(("http://", "https://")):
+            data = self._get_json(self.location)
+        else:
+            with open(self.location, encoding="utf-8") as f:
+                data = json.load(f)
+        return [item for item in data.get("items", []) if item.get("title")]
+
+
+class WeiboHotSource(TrendingSource):
+    URL = os.getenv("TRENDING_WEIBO_URL", "https://weibo.com/ajax/side/hotSearch")
+
+    def fetch(self) -> list[dict]:
+        realtime = (self._get_json(self.URL).get("data") or {}).get("realtime") or []
+        return [
+            {
+                "title": entry["word"],
+                "url": f"https://s.weibo.com/weibo?q={urllib.parse.quote('#' + entry['word'] + '#')}",
+                "heat": entry.get("num"),
+                "summary": entry.get("note") or "",
+            }
+            for entry in realtime
+            if entry.get("word") and not entry.get("is_ad")
+        ]
+
+
+class ZhihuHotSource(TrendingSource):
+    URL = os.getenv("TRENDING_ZHIHU_URL", "https://www.zhihu.com/api/v3/feed/topstory/hot-lists/total?limit=50")
+
+    def fetch(self) -> list[dict]:
+        items = []
+        for entry in self._get_json(self.URL).get("data") or []:
+            target = entry.get("target") or {}
+            if not target.get("title"):
+                continue
+            items.append({
+                "title": target["title"],
+                "url": f"https://www.zhihu.com/question/{target['id']}" if target.get("id") else "",
+                "heat": entry.get("detail_text"),
+                "summary": target.get("excerpt") or "",
+            })
+        return items
+
+
+BUILTIN_SOURCES = {"weibo": WeiboHotSource, "zhihu": ZhihuHotSource}
+
+
+def build_sources(spec: str = TRENDING_SOURCES) -> list[TrendingSource]:
+    sources = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, location = entry.partition("=")
+        if sep:
+            sources.append(FeedSource(name.strip(), location.strip()))
+        elif name in BUILTIN_SOURCES:
+            sources.append(BUILTIN_SOURCES[name](name))
+        else:
+            print(f"⚠️ 未知的热榜来源: {name}")
+    return sources
+
+
+# --- 入库 ---
+def partition_of(timestamp: float) -> int:
+    """分区起始时间 (epoch 秒)"""
+    size = TRENDING_PARTITION_HOURS * 3600
+    return int(timestamp // size * size)
+
+
+def _content_hash(platform: str, item: dict) -> str:
+    title = re.sub(r"\s+", " ", item["title"]).strip()
+    summary = re.sub(r"\s+", " ", item.get("summary") or "").strip()
+    return hashlib.sha256(f"{platform}\0{title}\0{summary}".encode("utf-8")).hexdigest()[:32]
+
+
+def _ingest(store, source: TrendingSource, now: float) -> dict:
+    from app.rag import raw_collection
+
+    with span(f"trending:fetch_{source.name}"):
+        items = source.fetch()[:TRENDING_MAX_ITEMS]
+    # 同一批次内的重复条目只保留排名最高的一条
+    entries: dict[str, tuple[str, dict]] = {}
+    for rank, item in enumerate(items, start=1):
+        text = f"{item['title']}\n{item['summary']}" if item.get("summary") else item["title"]
+        metadata = {
+            "platform": source.name, "title": item["title"], "url": item.get("url") or "",
+            "heat": str(item.get("heat") or ""), "rank": rank,
+            "partition": partition_of(now), "last_seen": now,
+        }
+        entries.setdefault(_content_hash(source.name, item), (text, metadata))
+
+    ids = list(entries)
+    existing = set(raw_collection(store).get(ids=ids, include=[])["ids"]) if ids else set()
+    new_ids = [i for i in ids if i not in existing]
+    seen_ids = [i for i in ids if i in existing]
+    if new_ids:
+        with span("trending:embed"):
+            store.add_texts(
+                [entries[i][0] for i in new_ids], metadatas=[entries[i][1] for i in new_ids], ids=new_ids
+            )
+    if seen_ids:
+        # 仍在榜上的条目只刷新排名、热度与分区，不重新向量化
+        raw_collection(store).update(ids=seen_ids, metadatas=[entries[i][1] for i in seen_ids])
+    return {"fetched": len(items), "new": len(new_ids), "updated": len(seen_ids)}
+
+
+def _expire(store, now: float) -> int:
+    from app.rag import raw_collection
+
+    cutoff = partition_of(now - TRENDING_RETENTION_HOURS * 3600)
+    stale = raw_collection(store).get(where={"partition": {"$lt": cutoff}}, include=[])["ids"]
+    if stale:
+        raw_collection(store).delete(ids=stale)
+    return len(stale)
+
+
+def refresh(sources: list[TrendingSource] | None = None) -> dict:
+    """拉取全部来源并增量入库，返回并记录本次统计；单个来源失败不影响其他来源"""
+    from app.rag import get_trending_store
+
+    sources = build_sources() if sources is None else sources
+    store = get_trending_store()
+    now = time.time()
+    started = time.perf_counter()
+    report = {"last_run": now, "partition": partition_of(now), "sources": {}}
+    for source in sources:
+        try:
+            report["sources"][source.name] = _ingest(store, source, now)
+        except Exception as e:
+            print(f"⚠️ 热榜来源 {source.name} 入库失败: {e}")
+            report["sources"][source.name] = {"error": str(e)}
+    report["expired"] = _expire(store, now)
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    progress_store.set(STATUS_KEY, report)
+    print(f"📈 热榜入库完成: {report['sources']}，过期 {report['expired']} 条")
+    return report
+
+
+async def refresh_async() -> dict:
+    return await asyncio.get_running_loop().run_in_executor(_pool, refresh)
+
+
+async def run_scheduler():
+    while True:
+        status = progress_store.get(STATUS_KEY) or {}
+        wait = status.get("last_run", 0) + TRENDING_INTERVAL - time.time()
+        if wait <= 0:
+            if await asyncio.to_thread(progress_store.acquire_lease, LEASE_KEY, _owner, LEASE_TTL):
+                try:
+                    # 领到租约前，上一个持有者可能刚好刷新完毕
+                    status = progress_store.get(STATUS_KEY) or {}
+                    if status.get("last_run", 0) + TRENDING_INTERVAL <= time.time():
+                        await refresh_async()
+                except Exception as e:
+                    print(f"❌ 热榜入库异常: {e}")
+                finally:
+                    await asyncio.to_thread(progress_store.release_lease, LEASE_KEY, _owner)
+                wait = TRENDING_INTERVAL
+            else:
+                # 其他 worker 正在刷新
+                wait = LEASE_RETRY
+        # 其他 worker 可能刚刚刷新过，醒来后重新读取上次刷新时间
+        await asyncio.sleep(max(wait, 1.0))
+
+
+def start():
+    """在 lifespan 中调用：配置了来源时启动后台调度"""
+    if not TRENDING_SOURCES:
+        return None
+    return asyncio.create_task(run_scheduler())
+
+
+# --- 查询 ---
+def _format(documents: list[tuple[str, dict]]) -> str:
+    lines = []
+    for text, meta in documents:
+        heat = f" · 热度 {meta['heat']}" if meta.get("heat") else ""
+        seen = time.strftime("%m-%d %H:%M", time.localtime(meta["last_seen"]))
+        lines.append(f"【{meta['platform']} 热榜第 {meta['rank']} 位{heat} · {seen} 在榜】{text}")
+    return "\n\n".join(lines)
+
+
+def search(query: str = "", platform: str = "", k: int = 10) -> str:
+    """
+    查询本地热点索引。query 为空时按排名列出最近一次上榜的条目，否则按语义相似度检索保留期内的条目。
+    platform 非空时只看该来源。
+    """
+    from app.rag import get_trending_store, raw_collection
+
+    store = get_trending_store()
+    cutoff = partition_of(time.time() - TRENDING_RETENTION_HOURS * 3600)
+    clauses = [{"partition": {"$gte": cutoff}}]
+    if platform:
+        clauses.append({"platform": platform})
+    where = clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    if not query.strip():
+        status = progress_store.get(STATUS_KEY) or {}
+        latest = [{"last_seen": {"$gte": status["last_run"]}}] if status.get("last_run") else []
+        result = raw_collection(store).get(
+            where={"$and": clauses + latest} if latest else where, include=["documents", "metadatas"]
+        )
+        documents = sorted(zip(result["documents"], result["metadatas"]), key=lambda d: (d[1]["rank"], d[1]["platform"]))
+        return _format(documents[:k])
+
+    with span("trending:search"):
+        docs = store.similarity_search(query, k=k, filter=where)
+    return _format([(doc.page_content, doc.metadata) for doc in docs])
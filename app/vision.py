@@ -0,0 +1,461 @@
+# app/vision.py
+"""
+视觉中枢：图片 / 视频解析，以及附带媒体时的预判执行。
+chat_stream 收到图片或视频后立即调用 prefetch()，抽帧与视觉模型调用和大脑的第一跳并行进行；
+随后 analyze_uploaded_* 工具通过 get_analysis() 直接等待已经在跑的结果。
+预判用的是通用问题（SPECULATIVE_QUESTIONS），只用于附带媒体那一轮的第一次视觉工具调用；
+同一轮之后的调用带着大脑各自的问题重新解析。结果按 (媒体类型, 内容引用, 视觉模型, 问题) 缓存 VISION_CACHE_TTL 秒
+（预判的问题记为 None），未被调用时自然过期，前端每轮对话都会重新附带同一份媒体，后续轮次同样命中缓存。
+
+超过 VIDEO_SEGMENT_THRESHOLD 秒的视频走分段 map-reduce：按时间窗切成至多 VIDEO_MAX_SEGMENTS 段，
+每段单独抽帧并发送给视觉模型（同一模型的并发受 VIDEO_SEGMENT_CONCURRENCY 限制），
+各段完成后立即通过 SegmentLog 交给工具推送给前端，最后把分段报告合并为一份完整报告。
+"""
+import base64
+import contextvars
+import functools
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator
+
+from app import cancellation, imageprep
+from app.cancellation import Cancelled
+from app.context import current_speculation
+from app.endpoints import SILICONFLOW_BASE_URL, ZHIPU_BASE_URL
+from app.metrics import CACHE_REQUESTS, CANCELLED_WORK
+from app.profiling import span
+from app.state import media_store
+
+if TYPE_CHECKING:
+    import numpy as np
+
+SPECULATIVE_VISION = os.getenv("SPECULATIVE_VISION", "1") == "1"
+VISION_CACHE_TTL = float(os.getenv("VISION_CACHE_TTL", "600"))
+VISION_CACHE_SIZE = 256
+VISION_WORKERS = int(os.getenv("VISION_WORKERS", "4"))
+
+# 预判执行时大脑尚未给出问题，使用覆盖面足够广的通用问题
+SPECULATIVE_QUESTIONS = {
+    "image": "详细描述图中的主体、人物、场景、构图、美术风格、色彩与文字信息",
+    "video": "详细描述视频的主体、场景、镜头与动作变化、美术风格、色彩以及画面中的文字信息",
+}
+VIDEO_FRAME_COUNT = 8
+FRAME_MAX_DIM = 512
+# 关键帧发送方式：separate 每帧一张图；mosaic 拼成带时间戳的网格图，减少图片数与图像 token
+VIDEO_FRAME_PACKING = os.getenv("VIDEO_FRAME_PACKING", "separate")
+VIDEO_MOSAIC_TILE = int(os.getenv("VIDEO_MOSAIC_TILE", "384"))  # 拼图中每格的长边上限 (像素)
+# 各视觉模型单张图片的分辨率上限，超出部分供应商会自行缩放；拼图按此排布
+VISION_IMAGE_LIMITS = {
+    "Qwen/Qwen2-VL-72B-Instruct": {"max_side": 1792, "max_pixels": 1280 * 28 * 28},
+    "glm-4v-plus": {"max_side": 1120, "max_pixels": 1120 * 1120},
+}
+VISION_TIMEOUT = 90  # 单次视觉模型调用的超时 (秒)，同时受请求剩余时间限制
+
+# 分段解析：时长超过阈值的视频才分段；段数有上限，段长随视频变长而变长，总耗时取决于并发度而不是时长
+VIDEO_SEGMENT_THRESHOLD = float(os.getenv("VIDEO_SEGMENT_THRESHOLD", "90"))
+VIDEO_SEGMENT_SECONDS = float(os.getenv("VIDEO_SEGMENT_SECONDS", "60"))
+VIDEO_MAX_SEGMENTS = int(os.getenv("VIDEO_MAX_SEGMENTS", "12"))
+VIDEO_SEGMENT_FRAMES = 4
+VIDEO_SEGMENT_CONCURRENCY = int(os.getenv("VIDEO_SEGMENT_CONCURRENCY", "4"))
+
+
+class FrameExtractionError(Exception):
+    """视频无法读取或抽不出画面"""
+
+
+def vision_model_of(label: str) -> str:
+    """前端的视觉模型标签 -> 实际模型名；缓存与客户端都按模型名区分"""
+    return "Qwen/Qwen2-VL-72B-Instruct" if "Qwen" in label else "glm-4v-plus"
+
+
+@functools.lru_cache(maxsize=None)
+def _build_vision_llm(model: str):
+    from langchain_openai import ChatOpenAI
+
+    if model.startswith("Qwen/"):
+        return ChatOpenAI(
+            model=model,
+            api_key=os.getenv("SILICONFLOW_API_KEY"),
+            base_url=SILICONFLOW_BASE_URL,
+            temperature=0.7,
+        )
+    return ChatOpenAI(
+        model=model,
+        api_key=os.getenv("ZHIPU_API_KEY"),
+        base_url=ZHIPU_BASE_URL,
+        temperature=0.7,
+    )
+
+
+def get_vision_llm(label: str):
+    """按模型缓存客户端，复用底层 HTTP 连接池"""
+    return _build_vision_llm(vision_model_of(label))
+
+
+def _ask(label: str, content: list[dict]) -> str:
+    from langchain_core.messages import HumanMessage
+
+    with span("upstream:vision_llm"):
+        res = get_vision_llm(label).invoke(
+            [HumanMessage(content=content)], timeout=cancellation.current().timeout(VISION_TIMEOUT)
+        )
+    return res.content
+
+
+def _frame_parts(frames_b64: list[str], mime: str = "image/jpeg") -> list[dict]:
+    return [{"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}} for b64 in frames_b64]
+
+
+def prepare_image(image_ref: str, label: str) -> Future:
+    """按视觉模型的分辨率上限预处理上传图片（见 app.imageprep），结果为 (MIME 类型, Base64)"""
+    return imageprep.prepare(
+        image_ref, functools.partial(media_store.get, image_ref), **VISION_IMAGE_LIMITS[vision_model_of(label)]
+    )
+
+
+def analyze_image(image_ref: str, label: str, question: str, log: "SegmentLog | None" = None) -> str:
+    token = cancellation.current()
+    with span("vision:prepare_image"):
+        mime, base64_img = token.result(prepare_image(image_ref, label))
+    token.check()
+    return _ask(label, [{"type": "text", "text": question}, *_frame_parts([base64_img], mime)])
+
+
+@contextmanager
+def _video_file(video_ref: str) -> Iterator[str]:
+    """文件型媒体库直接给出原文件路径，其他后端先落到临时文件供 OpenCV 打开"""
+    video_path = media_store.local_path(video_ref)
+    if video_path is not None:
+        yield video_path
+        return
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp:
+        tmp.write(media_store.get(video_ref))
+    try:
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
+
+
+def _probe(video_path: str) -> tuple[int, float]:
+    """返回 (总帧数, 帧率)；读不到时为 0"""
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), cap.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        cap.release()
+
+
+def read_frames(video_path: str, indices: list[int]) -> list[tuple[int, "np.ndarray"]]:
+    """读取指定下标的帧并缩放到 FRAME_MAX_DIM 以内，返回 (帧下标, BGR 图像) 列表"""
+    import cv2
+
+    token = cancellation.current()
+    frames = []
+    cap = None
+    try:
+        with span("opencv:extract_frames"):
+            cap = cv2.VideoCapture(video_path)
+            for idx in indices:
+                # 逐帧检查取消，解码大视频时也能及时退出
+                token.check()
+                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                ret, frame = cap.read()
+                if ret:
+                    height, width = frame.shape[:2]
+                    if max(height, width) > FRAME_MAX_DIM:
+                        scale = FRAME_MAX_DIM / max(height, width)
+                        frame = cv2.resize(frame, (int(width * scale), int(height * scale)))
+                    frames.append((idx, frame))
+    finally:
+        if cap is not None:
+            cap.release()
+    return frames
+
+
+def _encode_jpeg(frame: "np.ndarray") -> str:
+    import cv2
+
+    _, buffer = cv2.imencode(".jpg", frame)
+    return base64.b64encode(buffer).decode("utf-8")
+
+
+def frames_content(
+    frames: list[tuple[int, "np.ndarray"]], fps: float, label: str, packing: str | None = None, tile_side: int | None = None
+) -> tuple[list[dict], str]:
+    """
+    把关键帧转换为消息中的图片部分，返回 (image_url 列表, 供提示词使用的画面说明)。
+    packing 为 mosaic 时按视觉模型的分辨率上限拼成带时间戳的网格图；两个参数默认取 VIDEO_FRAME_PACKING / VIDEO_MOSAIC_TILE。
+    """
+    packing = packing or VIDEO_FRAME_PACKING
+    if packing != "mosaic" or len(frames) < 2:
+        return _frame_parts([_encode_jpeg(frame) for _, frame in frames]), f"{len(frames)} 张关键帧画面"
+
+    from app.mosaic import build_mosaics
+
+    labels = [f"#{i + 1} {format_timestamp(idx / fps)}" if fps > 0 else f"#{i + 1}" for i, (idx, _) in enumerate(frames)]
+    with span("opencv:mosaic"):
+        mosaics, (rows, cols) = build_mosaics(
+            [frame for _, frame in frames], labels, **VISION_IMAGE_LIMITS[vision_model_of(label)],
+            max_tile_side=tile_side or VIDEO_MOSAIC_TILE,
+        )
+        parts = _frame_parts([_encode_jpeg(mosaic) for mosaic in mosaics])
+    description = (
+        f"{len(frames)} 张关键帧画面，已拼成 {len(mosaics)} 张 {rows} 行 {cols} 列的网格图"
+        "（按从左到右、从上到下的时间顺序排列，每格左上角标注了序号与时间戳）"
+    )
+    return parts, description
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+class SegmentLog:
+    """分段解析的进度：各段结果按完成顺序追加，等待方可以边等边取"""
+
+    def __init__(self):
+        self._items: list[dict] = []
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def append(self, item: dict):
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def follow(self) -> Iterator[dict]:
+        """依次产出已完成和之后完成的分段，直到分段阶段结束"""
+        token = cancellation.current()
+        position = 0
+        while True:
+            with self._cond:
+                while position >= len(self._items) and not self._closed:
+                    self._cond.wait(0.5)
+                    token.check()
+                if position >= len(self._items):
+                    return
+                item = self._items[position]
+            position += 1
+            yield item
+
+
+# 每个视觉模型一个信号量，限制分段解析对同一供应商的并发
+_model_slots: dict[str, threading.BoundedSemaphore] = {}
+_slots_lock = threading.Lock()
+
+
+@contextmanager
+def _model_slot(label: str):
+    model = vision_model_of(label)
+    with _slots_lock:
+        slot = _model_slots.setdefault(model, threading.BoundedSemaphore(VIDEO_SEGMENT_CONCURRENCY))
+    token = cancellation.current()
+    while not slot.acquire(timeout=0.5):
+        token.check()
+    try:
+        yield
+    finally:
+        slot.release()
+
+
+def _analyze_segment(video_path: str, label: str, question: str, window: dict, fps: float) -> dict:
+    start, end = window["start"], window["end"]
+    step = (end - start) / VIDEO_SEGMENT_FRAMES
+    indices = [int((start + (i + 0.5) * step) * fps) for i in range(VIDEO_SEGMENT_FRAMES)]
+    frames = read_frames(video_path, indices)
+    if not frames:
+        raise FrameExtractionError(f"片段 {format_timestamp(start)}-{format_timestamp(end)} 抽帧失败")
+    parts, description = frames_content(frames, fps, label)
+    text = (
+        f"{question} (以下是该视频 {format_timestamp(start)}-{format_timestamp(end)} 片段按时间顺序抽取的 "
+        f"{description}，请只描述这一片段内的画面、事件与文字信息)："
+    )
+    with _model_slot(label), span(f"vision:segment_{window['index']}"):
+        return {**window, "text": _ask(label, [{"type": "text", "text": text}, *parts])}
+
+
+def _analyze_segments(video_path: str, label: str, question: str, duration: float, fps: float, log: SegmentLog | None) -> str:
+    total = min(VIDEO_MAX_SEGMENTS, math.ceil(duration / VIDEO_SEGMENT_SECONDS))
+    length = duration / total
+    windows = [{"index": i, "total": total, "start": i * length, "end": (i + 1) * length} for i in range(total)]
+
+    # map：各段并发抽帧与解析，复制上下文以传递取消令牌与剖析 span
+    futures = [
+        _segment_pool.submit(contextvars.copy_context().run, _analyze_segment, video_path, label, question, window, fps)
+        for window in windows
+    ]
+    reports: dict[int, str] = {}
+    try:
+        for future in as_completed(futures):
+            try:
+                segment = future.result()
+            except Exception as e:
+                print(f"⚠️ [分段解析] 片段失败: {e}")
+                continue
+            reports[segment["index"]] = segment["text"]
+            if log:
+                log.append({**segment, "start": format_timestamp(segment["start"]), "end": format_timestamp(segment["end"])})
+    finally:
+        for future in futures:
+            future.cancel()
+        if log:
+            log.close()
+
+    if not reports:
+        raise FrameExtractionError("所有片段均解析失败")
+
+    # reduce：按时间顺序合并分段报告，缺失的片段显式标注
+    parts = []
+    for window in windows:
+        header = f"[{format_timestamp(window['start'])}-{format_timestamp(window['end'])}]"
+        parts.append(f"{header}\n{reports.get(window['index'], '（该片段解析失败）')}")
+    prompt = (
+        f"{question}\n以下是同一段时长 {format_timestamp(duration)} 的视频按时间顺序的分段解析报告。"
+        "请合并为一份完整连贯的视频解析报告，梳理情节与变化脉络，并保留关键时间点：\n\n" + "\n\n".join(parts)
+    )
+    with span("vision:reduce"):
+        return _ask(label, [{"type": "text", "text": prompt}])
+
+
+def analyze_video(video_ref: str, label: str, question: str, log: SegmentLog | None = None) -> str:
+    try:
+        with _video_file(video_ref) as video_path:
+            total_frames, fps = _probe(video_path)
+            duration = total_frames / fps if fps > 0 else 0.0
+            if duration > VIDEO_SEGMENT_THRESHOLD:
+                return _analyze_segments(video_path, label, question, duration, fps, log)
+
+            indices = [int(i * total_frames / VIDEO_FRAME_COUNT) for i in range(VIDEO_FRAME_COUNT)] if total_frames > 0 else []
+            frames = read_frames(video_path, indices)
+    finally:
+        if log:
+            log.close()
+    if not frames:
+        raise FrameExtractionError("视频抽帧失败，无法读取画面")
+
+    parts, description = frames_content(frames, fps, label)
+    content = [{"type": "text", "text": f"{question} (以下是该视频按时间顺序抽取的 {description}，请综合这些画面推断视频发生的故事和动态细节)："}]
+    return _ask(label, content + parts)
+
+
+ANALYZERS = {"image": analyze_image, "video": analyze_video}
+
+# --- 预判执行与结果缓存 ---
+_pool = ThreadPoolExecutor(max_workers=VISION_WORKERS, thread_name_prefix="vision")
+# 分段任务单独一个池，避免占满 _pool 的整段解析任务等待自己的分段而死锁
+_segment_pool = ThreadPoolExecutor(max_workers=VISION_WORKERS * VIDEO_SEGMENT_CONCURRENCY, thread_name_prefix="vision-segment")
+_analyses: OrderedDict[tuple, tuple[float, Future, SegmentLog | None]] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _evict(now: float):
+    while _analyses:
+        key, (created, _, _) = next(iter(_analyses.items()))
+        if now - created <= VISION_CACHE_TTL and len(_analyses) <= VISION_CACHE_SIZE:
+            break
+        del _analyses[key]
+
+
+def _failed(future: Future) -> bool:
+    return future.done() and future.exception() is not None
+
+
+def _speculate(kind: str, ref: str, label: str, log: SegmentLog | None) -> str:
+    try:
+        # 排队期间发起请求已断开时直接放弃
+        cancellation.current().check()
+        with span(f"vision:speculative_{kind}"):
+            return ANALYZERS[kind](ref, label, SPECULATIVE_QUESTIONS[kind], log)
+    except Cancelled as e:
+        CANCELLED_WORK.inc(f"vision:speculative_{kind}", e.reason)
+        raise
+    finally:
+        if log:
+            log.close()
+
+
+def _submit(kind: str, ref: str, label: str, question: str | None) -> tuple[Future, SegmentLog | None]:
+    log = SegmentLog() if kind == "video" else None
+    # 复制上下文：剖析 / 流量录制的 span 与取消令牌都归属到发起请求
+    context = contextvars.copy_context()
+    if question is None:
+        return _pool.submit(context.run, _speculate, kind, ref, label, log), log
+    return _pool.submit(context.run, ANALYZERS[kind], ref, label, question, log), log
+
+
+def prefetch(kind: str, ref: str, label: str) -> Future:
+    """后台开始解析媒体；同一份媒体已在解析或已有结果时直接复用，并登记给本轮的第一次视觉工具调用"""
+    key = (kind, ref, vision_model_of(label), None)
+    claims = current_speculation.get()
+    now = time.monotonic()
+    with _lock:
+        if claims is not None:
+            claims.add(key)
+        _evict(now)
+        entry = _analyses.get(key)
+        if entry is not None and not _failed(entry[1]):
+            _analyses.move_to_end(key)
+            return entry[1]
+        future, log = _submit(kind, ref, label, None)
+        _analyses[key] = (now, future, log)
+        return future
+
+
+def _await(future: Future, log: SegmentLog | None, on_segment: Callable[[dict], None] | None) -> str:
+    if log and on_segment:
+        for segment in log.follow():
+            on_segment(segment)
+    return cancellation.current().result(future)
+
+
+def get_analysis(
+    kind: str, ref: str, label: str, question: str, on_segment: Callable[[dict], None] | None = None
+) -> str:
+    """
+    工具入口：本轮第一次调用优先等待预判结果；之后的调用（或预判失败时）按大脑给出的问题解析，
+    同一问题的结果同样缓存复用。分段解析时每完成一段调用一次 on_segment（已完成的分段会先补发）。
+    """
+    model = vision_model_of(label)
+    claims = current_speculation.get()
+    with _lock:
+        _evict(time.monotonic())
+        speculative = (kind, ref, model, None)
+        if claims is not None and speculative in claims:
+            claims.discard(speculative)
+            key = speculative
+        else:
+            key = (kind, ref, model, question)
+        entry = _analyses.get(key)
+        if entry is not None and _failed(entry[1]):
+            del _analyses[key]
+            entry = None
+    if entry is not None:
+        CACHE_REQUESTS.inc("vision", "hit")
+        _, future, log = entry
+        try:
+            with span(f"vision:await_{kind}"):
+                return _await(future, log, on_segment)
+        except Cancelled:
+            # 预判可能属于另一个已断开的请求；本请求仍有效时现场重新解析
+            cancellation.current().check()
+    else:
+        CACHE_REQUESTS.inc("vision", "miss")
+    future, log = _submit(kind, ref, label, question)
+    with _lock:
+        _analyses[(kind, ref, model, question)] = (time.monotonic(), future, log)
+    return _await(future, log, on_segment)
@@ -0,0 +1,101 @@
+# app/warmup.py
+"""
+启动预热与就绪状态：
+- app.main 只导入轻量模块，LangGraph / langchain_openai / chromadb / OpenCV 在预热线程中加载，端口可以立即开始监听
+- 预热依次构建对话图、打开向量库、创建默认模型客户端、加载 OpenCV，并向默认供应商建立连接
+- /ready 在预热完成前返回 503，负载均衡据此决定何时导流
+设置 STARTUP_WARMUP=0 可跳过预热（开发时 --reload 更快），依赖会在首次使用时加载。
+"""
+import asyncio
+import os
+import sys
+import time
+
+WARMUP_ENABLED = os.getenv("STARTUP_WARMUP", "1") == "1"
+DEFAULT_CHAT_MODEL = "DeepSeek-V3 (SiliconFlow)"
+DEFAULT_VISION_MODEL = "Qwen-VL"
+
+status = {"state": "pending", "steps": {}, "errors": {}}
+
+
+def _load_graph():
+    # 并发导入由 Python 的模块导入锁串行化，多个请求同时触发也只加载一次
+    from app.agent import app_graph
+
+    return app_graph
+
+
+async def get_graph():
+    """获取编译好的对话图；预热尚未完成时在线程中等待导入，不阻塞事件循环"""
+    agent = sys.modules.get("app.agent")
+    if agent is not None and hasattr(agent, "app_graph"):
+        return agent.app_graph
+    return await asyncio.to_thread(_load_graph)
+
+
+def _open_vector_store():
+    from app.rag import get_vector_store
+
+    get_vector_store()
+
+
+def _build_clients():
+    from app.agent import get_llm
+    from app.tools import get_tavily_client
+    from app.vision import get_vision_llm
+
+    get_llm(DEFAULT_CHAT_MODEL)
+    get_vision_llm(DEFAULT_VISION_MODEL)
+    get_tavily_client()
+
+
+def _load_opencv():
+    import cv2  # noqa: F401
+
+
+async def _prime_connections():
+    """向默认对话模型供应商发一个轻量请求，提前完成 DNS / TLS 握手；响应内容不重要"""
+    from app.agent import get_llm
+
+    llm = get_llm(DEFAULT_CHAT_MODEL)
+    try:
+        await asyncio.wait_for(llm.root_async_client.models.list(), timeout=5)
+    except Exception:
+        pass
+
+
+STEPS = [
+    ("graph", _load_graph),
+    ("vector_store", _open_vector_store),
+    ("clients", _build_clients),
+    ("opencv", _load_opencv),
+]
+
+
+async def warm_up():
+    status["state"] = "warming"
+    started = time.perf_counter()
+    for name, step in STEPS:
+        step_started = time.perf_counter()
+        try:
+            await asyncio.to_thread(step)
+        except Exception as e:
+            status["errors"][name] = str(e)
+            print(f"⚠️ [预热] {name} 失败: {e}")
+        status["steps"][name] = round(time.perf_counter() - step_started, 3)
+    if "graph" in status["errors"]:
+        status["state"] = "failed"
+        return
+    step_started = time.perf_counter()
+    await _prime_connections()
+    status["steps"]["connections"] = round(time.perf_counter() - step_started, 3)
+    status["state"] = "ready"
+    print(f"🔥 [预热] 完成，耗时 {time.perf_counter() - started:.2f}s: {status['steps']}")
+
+
+def start():
+    """在 lifespan 中调用：后台执行预热，不阻塞服务启动；关闭预热时直接视为就绪"""
+    if not WARMUP_ENABLED:
+        status["state"] = "ready"
+        return None
+    return asyncio.create_task(warm_up())
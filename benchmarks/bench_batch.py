@@ -0,0 +1,109 @@
+# benchmarks/bench_batch.py
+"""
+批量生成基准：同样一组封面提示词，分别像视觉工坊那样逐个调用 /api/generate_image，
+与一次提交 /api/batch 并订阅进度，对比吞吐，并检查批量任务是否用满、且不超出供应商的并发额度。
+
+    python -m benchmarks.bench_batch
+    python -m benchmarks.bench_batch --topics 20 --styles 5 --image-latency 4 --error-rate 0.1
+
+桩服务的画图接口同时最多处理 --provider-concurrency 个请求（超出返回 429），并按 --error-rate 随机注入 429；
+后端的火山引擎并发 / 速率额度由同名参数设置，批量任务的并发默认等于该额度。
+测量项：
+- sequential：逐个调用 --sequential 张的耗时与吞吐（张/秒）
+- batch：模板展开后（另混入若干重复提示词）的总数、去重数、首张与全部完成的耗时、吞吐、成功 / 失败数与重试次数
+- provider：桩服务观察到的画图请求数、并发峰值与 429 次数
+"""
+import argparse
+import time
+
+import requests
+
+from benchmarks.run import Stack, add_stack_arguments, iter_events, report_header, write_report
+
+TOPICS = ["秋季穿搭", "城市骑行", "围炉煮茶", "露营装备", "新茶饮", "国潮彩妆", "宠物经济", "县城旅游", "陶艺体验", "银发博主",
+          "短剧出海", "早餐打卡", "咖啡探店", "健身日常", "读书笔记", "手账排版", "家居收纳", "亲子游", "夜市美食", "数码开箱"]
+STYLES = ["极简", "复古胶片", "高饱和撞色", "手绘插画", "杂志排版"]
+TEMPLATE = "{topic}主题的小红书封面，{style}风格，大字标题"
+
+
+def sequential(session: requests.Session, backend_url: str, prompts: list[str]) -> dict:
+    started, ok = time.perf_counter(), 0
+    for prompt in prompts:
+        ok += session.post(f"{backend_url}/api/generate_image", json={"prompt": prompt}, timeout=120).json().get("status") == "success"
+    seconds = time.perf_counter() - started
+    return {"images": len(prompts), "succeeded": ok, "seconds": round(seconds, 2), "images_per_second": round(len(prompts) / seconds, 2)}
+
+
+def run_batch(session: requests.Session, backend_url: str, payload: dict) -> dict:
+    started = time.perf_counter()
+    job = session.post(f"{backend_url}/api/batch", json=payload, timeout=30).json()
+    if job.get("status") != "success":
+        raise RuntimeError(f"批量任务提交失败: {job}")
+    first = None
+    with session.get(f"{backend_url}/api/batch/{job['id']}/events", stream=True, timeout=1800) as response:
+        for event, data in iter_events(response):
+            if event == "media" and first is None:
+                first = time.perf_counter() - started
+            elif event in ("done", "error"):
+                break
+    seconds = time.perf_counter() - started
+    manifest = session.get(f"{backend_url}/api/batch/{job['id']}", timeout=10).json()
+    return {
+        "total": manifest["total"],
+        "duplicates": manifest["duplicates"],
+        "succeeded": manifest["succeeded"],
+        "failed": manifest["failed"],
+        "retries": sum(max(0, item["attempts"] - 1) for item in manifest["items"]),
+        "first_image_seconds": round(first, 2) if first is not None else None,
+        "seconds": round(seconds, 2),
+        "images_per_second": round(manifest["total"] / seconds, 2),
+        "mirrored": sum(1 for item in manifest["items"] if (item["media"] or {}).get("local_url")),
+    }
+
+
+def run(args) -> dict:
+    stack = Stack(args)
+    try:
+        backend_url = stack.start()
+        requests.post(
+            f"{stack.fake_url}/_config", json={"image_concurrency": args.provider_concurrency}, timeout=5
+        ).raise_for_status()
+        session = requests.Session()
+        topics, styles = TOPICS[:args.topics], STYLES[:args.styles]
+        prompts = [TEMPLATE.format(topic=t, style=s) for t in topics for s in styles]
+        report = {"sequential": sequential(session, backend_url, prompts[:args.sequential])}
+
+        before = stack.fake_stats()
+        # 混入几条与模板展开结果相同的提示词（多余空白不影响去重）
+        payload = {"prompts": [f"  {p} " for p in prompts[:args.duplicates]], "template": TEMPLATE,
+                   "variables": {"topic": topics, "style": styles}}
+        report["batch"] = run_batch(session, backend_url, payload)
+        after = stack.fake_stats()
+        report["provider"] = {
+            "image_requests": after.get("image", 0) - before.get("image", 0),
+            "peak_inflight": after.get("image_peak", 0),
+            "concurrency_limit": args.provider_concurrency,
+            "rejected_429": after.get("image_429", 0) - before.get("image_429", 0),
+        }
+        report["speedup"] = round(report["batch"]["images_per_second"] / report["sequential"]["images_per_second"], 1)
+        return report
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stack_arguments(parser)
+    parser.add_argument("--topics", type=int, default=10, help=f"模板中的话题数 (至多 {len(TOPICS)})")
+    parser.add_argument("--styles", type=int, default=4, help=f"模板中的风格数 (至多 {len(STYLES)})")
+    parser.add_argument("--duplicates", type=int, default=5, help="混入的重复提示词数")
+    parser.add_argument("--sequential", type=int, default=8, help="逐个调用的张数")
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    parser.set_defaults(provider_concurrency=10, provider_rate=10, error_rate=0.05)
+    args = parser.parse_args()
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# benchmarks/bench_frame_packing.py
+"""
+关键帧拼图基准：对比 separate（每帧一张图）与 mosaic（带时间戳的网格图）两种发送方式的
+请求体大小、图像 token 数、上游延迟与回答质量，分别按 Qwen2-VL 与 GLM-4V 的分辨率上限排布。
+
+    python -m benchmarks.bench_frame_packing --runs 3
+    python -m benchmarks.bench_frame_packing --live --runs 1     # 使用 .env 中的真实 Key
+
+夹具是几段合成视频，每秒画面中央显示一个已知数字（横屏 / 竖屏 / 小字号三种）。
+离线模式请求本地桩服务，延迟按图像 token 数模拟视觉模型的预填充耗时 (--image-prefill-rate)，
+回答质量以拼图中每格相对单独发送的帧的 PSNR 作为代理指标；
+--live 直接请求真实视觉模型，让其按顺序读出每帧的数字并与真值比对，得到识别准确率。
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.run import ROOT, _free_port, _wait_until_up, report_header, write_report
+
+QUESTION = "请按时间顺序依次写出每一帧画面中央的大号数字，只输出数字，用空格分隔。"
+FIXTURES = [
+    # (名称, 宽, 高, 数字字号)
+    ("landscape", 854, 480, 6.0),
+    ("portrait", 480, 854, 6.0),
+    ("small_digits", 854, 480, 2.0),
+]
+FIXTURE_SECONDS = 16
+FIXTURE_FPS = 4
+
+
+def make_fixture(path: str, width: int, height: int, font_scale: float, seed: int) -> list[int]:
+    """生成每秒一个数字的视频，返回逐秒的数字真值；背景为渐变加轻微噪声，接近真实画面的压缩难度"""
+    rng = random.Random(seed)
+    digits = [rng.randint(0, 9) for _ in range(FIXTURE_SECONDS)]
+    gradient = np.linspace(0, 160, width, dtype=np.float32)[None, :, None] + np.linspace(0, 60, height, dtype=np.float32)[:, None, None]
+    grain = np.random.default_rng(seed).normal(0, 6, (height, width, 3))
+    noise = np.clip(gradient + grain, 0, 255).astype(np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FIXTURE_FPS, (width, height))
+    for second, digit in enumerate(digits):
+        for _ in range(FIXTURE_FPS):
+            frame = noise.copy()
+            color = tuple(rng.randint(80, 255) for _ in range(3))
+            cv2.rectangle(frame, (width // 8, height // 8), (width * 7 // 8, height * 7 // 8), color, -1)
+            text = str(digit)
+            thickness = max(2, int(font_scale * 2))
+            (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+            cv2.putText(frame, text, ((width - text_w) // 2, (height + text_h) // 2),
+                        cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness, cv2.LINE_AA)
+            cv2.putText(frame, f"t={second}s", (10, height - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+            writer.write(frame)
+    writer.release()
+    return digits
+
+
+def decode_part(part: dict) -> np.ndarray:
+    data = base64.b64decode(part["image_url"]["url"].split(",", 1)[1])
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def image_tokens(images: list[np.ndarray]) -> int:
+    """按 28x28 像素一个图像 token 估算（Qwen2-VL 的切块方式）"""
+    return sum(-(-img.shape[1] // 28) * -(-img.shape[0] // 28) for img in images)
+
+
+def tile_psnr(mosaic_images: list[np.ndarray], rows: int, cols: int, reference: list[np.ndarray]) -> float:
+    """
+    把拼图中的每格放大回单帧尺寸，与单独发送的帧比较画面中央区域（数字所在处）的 PSNR，衡量拼图带来的画面损失；
+    避开四周的分隔线与左上角的时间戳标注
+    """
+    values = []
+    tiles = []
+    per_sheet = -(-len(reference) // len(mosaic_images))
+    for mosaic in mosaic_images:
+        tile_h, tile_w = mosaic.shape[0] // rows, mosaic.shape[1] // cols
+        cells = [(r, c) for r in range(rows) for c in range(cols)][:per_sheet]
+        tiles.extend(mosaic[r * tile_h:(r + 1) * tile_h, c * tile_w:(c + 1) * tile_w] for r, c in cells)
+    for tile, ref in zip(tiles, reference):
+        restored = cv2.resize(tile, (ref.shape[1], ref.shape[0]), interpolation=cv2.INTER_CUBIC)
+        height, width = ref.shape[:2]
+        center = (slice(height // 4, height * 3 // 4), slice(width // 4, width * 3 // 4))
+        values.append(cv2.PSNR(restored[center], ref[center]))
+    return statistics.mean(values)
+
+
+def score_answer(answer: str, truth: list[int]) -> float:
+    digits = [int(d) for d in re.findall(r"\d", answer)]
+    return sum(1 for got, want in zip(digits, truth) if got == want) / len(truth)
+
+
+def variants(args) -> list[tuple[str, int | None]]:
+    return [("separate", None)] + [("mosaic", side) for side in args.tile_sides]
+
+
+def start_fake_providers(args) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    cmd = [
+        sys.executable, "-m", "benchmarks.fake_providers", "--port", str(port),
+        "--ttft", str(args.ttft), "--token-rate", str(args.token_rate), "--reply-tokens", str(args.reply_tokens),
+        "--image-prefill-rate", str(args.image_prefill_rate),
+    ]
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _wait_until_up(f"{url}/_stats", proc)
+    return proc, url
+
+
+def run(args) -> dict:
+    # 视觉模型的 base URL 在 app.endpoints 导入时读取，必须先设置环境变量再导入
+    from langchain_core.messages import HumanMessage
+
+    from app import vision
+    from app.mosaic import plan_grid
+
+    workdir = tempfile.mkdtemp(prefix="mediacraft-packing-")
+    cases = []
+    for seed, (name, width, height, font_scale) in enumerate(FIXTURES):
+        path = os.path.join(workdir, f"{name}.mp4")
+        digits = make_fixture(path, width, height, font_scale, seed)
+        total_frames, fps = vision._probe(path)
+        indices = [int(i * total_frames / args.frames) for i in range(args.frames)]
+        frames = vision.read_frames(path, indices)
+        truth = [digits[int(idx / fps)] for idx, _ in frames]
+
+        for label in args.models:
+            separate_images = None
+            for packing, tile_side in variants(args):
+                parts, description = vision.frames_content(frames, fps, label, packing, tile_side)
+                content = [{"type": "text", "text": f"{QUESTION} (以下是按时间顺序抽取的 {description})"}, *parts]
+                images = [decode_part(part) for part in parts]
+                latencies, answer = [], ""
+                llm = vision.get_vision_llm(label)
+                for _ in range(args.runs):
+                    started = time.perf_counter()
+                    answer = llm.invoke([HumanMessage(content=content)]).content
+                    latencies.append(time.perf_counter() - started)
+                case = {
+                    "fixture": name,
+                    "model": vision.vision_model_of(label),
+                    "packing": packing if packing == "separate" else f"mosaic@{tile_side}",
+                    "images": len(parts),
+                    "request_bytes": len(json.dumps(content, ensure_ascii=False).encode("utf-8")),
+                    "image_tokens": image_tokens(images),
+                    "latency": round(statistics.median(latencies), 4),
+                }
+                if packing == "separate":
+                    separate_images = images
+                else:
+                    height, width = frames[0][1].shape[:2]
+                    _, cols, rows, _, _ = plan_grid(
+                        len(frames), width / height, **vision.VISION_IMAGE_LIMITS[case["model"]],
+                        max_tile_side=min(tile_side, max(height, width)),
+                    )
+                    case["grid"] = f"{rows}x{cols}"
+                    case["tile_psnr"] = round(tile_psnr(images, rows, cols, separate_images), 2)
+                if args.live:
+                    case["accuracy"] = round(score_answer(answer, truth), 3)
+                cases.append(case)
+
+    # 各方式在全部夹具上取均值，mosaic 另给出相对 separate 的比值
+    summary = {}
+    for label in args.models:
+        model = vision.vision_model_of(label)
+        entry = {}
+        for packing in dict.fromkeys(c["packing"] for c in cases):
+            items = [c for c in cases if c["model"] == model and c["packing"] == packing]
+            entry[packing] = {
+                key: round(statistics.mean(c[key] for c in items), 4)
+                for key in ("images", "request_bytes", "image_tokens", "latency", "tile_psnr", "accuracy")
+                if key in items[0]
+            }
+            if packing != "separate":
+                entry[packing]["vs_separate"] = {
+                    key: round(entry[packing][key] / entry["separate"][key], 3)
+                    for key in ("request_bytes", "image_tokens", "latency")
+                }
+        summary[model] = entry
+    return {"cases": cases, "summary": summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="每种组合的请求次数，延迟取中位数")
+    parser.add_argument("--frames", type=int, default=8, help="每段视频抽取的关键帧数")
+    parser.add_argument("--models", nargs="+", default=["Qwen2-VL", "GLM-4V"], help="视觉模型标签")
+    parser.add_argument("--tile-sides", type=int, nargs="+", default=[512, 384, 256], help="拼图格子长边上限 (像素)")
+    parser.add_argument("--live", action="store_true", help="请求真实视觉模型并评估识别准确率")
+    parser.add_argument("--ttft", type=float, default=0.3, help="桩服务首字延迟 (秒)")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="桩服务出字速率")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="桩服务回复 token 数")
+    parser.add_argument("--image-prefill-rate", type=float, default=4000.0, help="桩服务每秒预填充的图像 token 数")
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    args = parser.parse_args()
+
+    fake = None
+    if not args.live:
+        fake, fake_url = start_fake_providers(args)
+        os.environ.update({
+            "SILICONFLOW_BASE_URL": f"{fake_url}/siliconflow",
+            "ZHIPU_BASE_URL": f"{fake_url}/zhipu",
+            "SILICONFLOW_API_KEY": "sk-bench",
+            "ZHIPU_API_KEY": "sk-bench",
+        })
+    else:
+        from dotenv import load_dotenv
+
+        load_dotenv(os.path.join(ROOT, ".env"))
+    try:
+        report = {**report_header(args), **run(args)}
+    finally:
+        if fake:
+            fake.terminate()
+            fake.wait()
+    write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_history.py
+"""
+分页会话历史基准：随会话变长，对比前端每次重绘需要处理的数据量。
+
+    python -m benchmarks.bench_history --lengths 10 50 200
+
+对每个长度，在同一会话中发送若干轮对话（每 5 轮一次画图，使记录带媒体引用），之后测量：
+- latest_page：前端每轮结束后拉取的最近一页 (HISTORY_WINDOW 条) 的耗时与字节数，重复拉取命中按检查点缓存的折叠结果
+- full_transcript：翻页取回全部记录的总字节数，即改动前每次重绘都要处理的整段记录
+- rendered_records：每次重绘渲染的记录数，窗口固定 vs 全量
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+import requests
+
+from benchmarks.run import Stack, add_stack_arguments, report_header, run_chat, write_report
+
+HISTORY_WINDOW = 10  # 与 app/frontend.py 的窗口一致（前端模块导入即执行 Streamlit 页面，这里不直接引用）
+
+
+def fetch(session: requests.Session, base_url: str, thread_id: str, **params) -> tuple[float, int, dict]:
+    started = time.perf_counter()
+    response = session.get(f"{base_url}/history/{thread_id}", params=params, timeout=30)
+    response.raise_for_status()
+    return time.perf_counter() - started, len(response.content), response.json()
+
+
+def measure(session: requests.Session, base_url: str, thread_id: str, repeats: int) -> dict:
+    latest = [fetch(session, base_url, thread_id, limit=HISTORY_WINDOW) for _ in range(repeats)]
+    full_bytes, pages, before = 0, 0, None
+    while True:
+        params = {"limit": 100} if before is None else {"limit": 100, "before": before}
+        _, size, page = fetch(session, base_url, thread_id, **params)
+        full_bytes, pages = full_bytes + size, pages + 1
+        if (before := page["before"]) is None:
+            break
+    total = latest[0][2]["total"]
+    return {
+        "records": total,
+        "latest_page": {
+            "seconds": round(statistics.median(t for t, _, _ in latest), 4),
+            "bytes": latest[0][1],
+            "rendered_records": len(latest[0][2]["messages"]),
+        },
+        "full_transcript": {"bytes": full_bytes, "pages": pages, "rendered_records": total},
+    }
+
+
+def run(args) -> dict:
+    stack = Stack(args)
+    try:
+        backend_url = stack.start()
+        session = requests.Session()
+        thread_id, turns, report = str(uuid.uuid4()), 0, {}
+        for length in sorted(args.lengths):
+            while turns < length:
+                content = f"第 {turns + 1} 轮：画一张封面" if turns % 5 == 4 else f"第 {turns + 1} 轮：给我一个选题"
+                result = run_chat(session, backend_url, {"content": content, "thread_id": thread_id})
+                if not result["ok"]:
+                    raise RuntimeError(f"对话失败: {result.get('error')}")
+                turns += 1
+            report[f"turns_{length}"] = measure(session, backend_url, thread_id, args.repeats)
+        return report
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stack_arguments(parser)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200], help="会话轮数")
+    parser.add_argument("--repeats", type=int, default=5, help="最近一页的拉取次数，耗时取中位数")
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    parser.set_defaults(ttft=0.02, token_rate=2000, reply_tokens=60, image_latency=0.05)
+    args = parser.parse_args()
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# benchmarks/bench_image_prep.py
+"""
+上传图片预处理基准：对比原图直接转发（before）与 app.imageprep 预处理后发送（after）的
+请求体大小、图像 token 数与 analyze 端到端耗时，分别按 Qwen2-VL 与 GLM-4V 的分辨率上限处理。
+
+    python -m benchmarks.bench_image_prep --runs 3
+    python -m benchmarks.bench_image_prep --upload-bandwidth 0      # 不模拟上传耗时
+
+夹具是几类典型上传：带 EXIF 旋转标记的 1200 万像素手机照片、Retina 截图 PNG、带透明通道的 PNG 与小尺寸 JPEG。
+请求发往本地桩服务：上传耗时按请求体大小与 --upload-bandwidth 模拟，预填充耗时按图像 token 数与
+--image-prefill-rate 模拟，并像真实供应商一样把单张图片的 token 数截断到模型上限。
+after 分为 cold（首次预处理）与 warm（命中按内容缓存的结果，如预判执行或多轮追问同一张图）。
+"""
+import argparse
+import base64
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+import requests
+
+from benchmarks.run import ROOT, _free_port, _wait_until_up, report_header, write_report
+
+QUESTION = "详细描述图中的主体、场景、构图与文字信息"
+# 供应商侧单张图片的 token 上限 (Qwen2-VL max_pixels=1280*28*28；GLM-4V 约 1120x1120)
+PROVIDER_TOKEN_CAPS = {"Qwen/Qwen2-VL-72B-Instruct": 1280, "glm-4v-plus": 1600}
+
+
+def _exif_orientation(orientation: int) -> bytes:
+    """只含 Orientation 标签的最小 EXIF APP1 段"""
+    ifd = struct.pack(">H", 1) + struct.pack(">HHIHH", 0x0112, 3, 1, orientation, 0) + struct.pack(">I", 0)
+    tiff = b"MM\x00*" + struct.pack(">I", 8) + ifd
+    payload = b"Exif\x00\x00" + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def _scene(width: int, height: int, seed: int) -> np.ndarray:
+    """渐变背景 + 噪点 + 色块与文字，压缩难度接近真实照片"""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(30, 200, width, dtype=np.float32)[None, :, None] + np.linspace(0, 50, height, dtype=np.float32)[:, None, None]
+    image = np.clip(gradient + rng.normal(0, 8, (height, width, 3)), 0, 255).astype(np.uint8)
+    for i in range(12):
+        x, y = int(rng.integers(0, width * 3 // 4)), int(rng.integers(0, height * 3 // 4))
+        cv2.rectangle(image, (x, y), (x + width // 6, y + height // 6), tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+        cv2.putText(image, f"ITEM {i}", (x + 10, y + height // 12), cv2.FONT_HERSHEY_SIMPLEX, width / 1200, (0, 0, 0), max(2, width // 600))
+    return image
+
+
+def make_fixtures() -> list[tuple[str, bytes, tuple[int, int]]]:
+    """返回 [(名称, 文件内容, 摆正后的 (宽, 高))]"""
+    fixtures = []
+
+    # 手机竖拍：传感器按横向存储 4032x3024，EXIF 标记顺时针旋转 90 度
+    _, jpeg = cv2.imencode(".jpg", _scene(4032, 3024, 1), [cv2.IMWRITE_JPEG_QUALITY, 95])
+    jpeg = jpeg.tobytes()
+    fixtures.append(("phone_photo_12mp", jpeg[:2] + _exif_orientation(6) + jpeg[2:], (3024, 4032)))
+
+    # 截图：大面积纯色与细字，PNG 无损
+    screenshot = np.full((1800, 2880, 3), 245, np.uint8)
+    for row in range(40):
+        cv2.putText(screenshot, f"{row:02d} the quick brown fox jumps over the lazy dog 0123456789", (40, 40 + row * 44),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (30, 30, 30), 2, cv2.LINE_AA)
+    screenshot[:, 2200:] = _scene(680, 1800, 2)
+    fixtures.append(("screenshot_png", cv2.imencode(".png", screenshot)[1].tobytes(), (2880, 1800)))
+
+    # 透明背景的产品图
+    rgba = np.zeros((1600, 1600, 4), np.uint8)
+    cv2.circle(rgba, (800, 800), 600, (40, 90, 220, 255), -1)
+    cv2.putText(rgba, "LOGO", (420, 900), cv2.FONT_HERSHEY_SIMPLEX, 8, (255, 255, 255, 255), 20)
+    fixtures.append(("alpha_png", cv2.imencode(".png", rgba)[1].tobytes(), (1600, 1600)))
+
+    _, small = cv2.imencode(".jpg", _scene(640, 480, 3), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    fixtures.append(("small_jpeg", small.tobytes(), (640, 480)))
+    return fixtures
+
+
+def start_fake_providers(args) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    cmd = [
+        sys.executable, "-m", "benchmarks.fake_providers", "--port", str(port),
+        "--ttft", str(args.ttft), "--token-rate", str(args.token_rate), "--reply-tokens", str(args.reply_tokens),
+        "--image-prefill-rate", str(args.image_prefill_rate), "--upload-bandwidth", str(args.upload_bandwidth),
+    ]
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _wait_until_up(f"{url}/_stats", proc)
+    return proc, url
+
+
+def _stats(url: str) -> dict:
+    return requests.get(f"{url}/_stats", timeout=5).json()
+
+
+def run(args, fake_url: str) -> dict:
+    # 视觉模型的 base URL 在 app.endpoints 导入时读取，必须先设置环境变量再导入
+    from app import imageprep, vision
+    from app.state import media_store
+
+    def legacy(ref: str, label: str) -> str:
+        # 改动前的 analyze_image：原图字节直接按 image/jpeg 转发
+        base64_img = base64.b64encode(media_store.get(ref)).decode("utf-8")
+        return vision._ask(label, [{"type": "text", "text": QUESTION}, *vision._frame_parts([base64_img])])
+
+    def measure(ref: str, label: str, analyze, cold: bool) -> dict:
+        latencies, request_bytes, tokens = [], 0, 0
+        for _ in range(args.runs):
+            if cold:
+                imageprep._prepared.clear()
+            before = _stats(fake_url)
+            started = time.perf_counter()
+            analyze(ref, label)
+            latencies.append(time.perf_counter() - started)
+            after = _stats(fake_url)
+            request_bytes = after.get("request_bytes", 0) - before.get("request_bytes", 0)
+            tokens = after.get("image_tokens", 0) - before.get("image_tokens", 0)
+        return {"request_bytes": request_bytes, "image_tokens": tokens, "latency": round(statistics.median(latencies), 4)}
+
+    cases = []
+    for name, data, (width, height) in make_fixtures():
+        ref = media_store.put(data)
+        for label in args.models:
+            model = vision.vision_model_of(label)
+            requests.post(f"{fake_url}/_config", json={"max_image_tokens": PROVIDER_TOKEN_CAPS[model]}, timeout=5).raise_for_status()
+            analyze_after = lambda r, l: vision.analyze_image(r, l, QUESTION)
+            case = {
+                "fixture": name,
+                "model": model,
+                "original_bytes": len(data),
+                "before": measure(ref, label, legacy, cold=False),
+                "after_cold": measure(ref, label, analyze_after, cold=True),
+                "after_warm": measure(ref, label, analyze_after, cold=False),
+            }
+            started = time.perf_counter()
+            mime, encoded = imageprep.preprocess(data, **vision.VISION_IMAGE_LIMITS[model])
+            case["preprocess_seconds"] = round(time.perf_counter() - started, 4)
+            prepared = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_COLOR)
+            case["prepared"] = {"mime": mime, "bytes": len(encoded), "size": f"{prepared.shape[1]}x{prepared.shape[0]}"}
+            # 摆正方向后宽高比应与预期一致
+            case["orientation_ok"] = (prepared.shape[1] >= prepared.shape[0]) == (width >= height)
+            for key in ("after_cold", "after_warm"):
+                case[key]["vs_before"] = {
+                    metric: round(case[key][metric] / case["before"][metric], 3)
+                    for metric in ("request_bytes", "latency")
+                }
+            cases.append(case)
+
+    summary = {}
+    for key in ("before", "after_cold", "after_warm"):
+        summary[key] = {
+            metric: round(statistics.mean(c[key][metric] for c in cases), 4)
+            for metric in ("request_bytes", "image_tokens", "latency")
+        }
+    return {"cases": cases, "summary": summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="每种组合的请求次数，延迟取中位数")
+    parser.add_argument("--models", nargs="+", default=["Qwen2-VL", "GLM-4V"], help="视觉模型标签")
+    parser.add_argument("--ttft", type=float, default=0.3, help="桩服务首字延迟 (秒)")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="桩服务出字速率")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="桩服务回复 token 数")
+    parser.add_argument("--image-prefill-rate", type=float, default=4000.0, help="桩服务每秒预填充的图像 token 数")
+    parser.add_argument("--upload-bandwidth", type=float, default=2.5e6, help="模拟上行带宽 (字节/秒)，0 表示不计")
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    args = parser.parse_args()
+
+    fake, fake_url = start_fake_providers(args)
+    os.environ.update({
+        "SILICONFLOW_BASE_URL": f"{fake_url}/siliconflow",
+        "ZHIPU_BASE_URL": f"{fake_url}/zhipu",
+        "SILICONFLOW_API_KEY": "sk-bench",
+        "ZHIPU_API_KEY": "sk-bench",
+    })
+    try:
+        report = {**report_header(args), **run(args, fake_url)}
+    finally:
+        fake.terminate()
+        fake.wait()
+    write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/bench_ingest.py
+"""
+入库公平调度基准：几个大文件正在批量入库时陆续上传小笔记，测量小笔记从上传到可检索的耗时、
+大文件的完成时间，以及发往供应商 Embedding 接口的请求数与 429 次数。
+
+    python -m benchmarks.bench_ingest
+    python -m benchmarks.bench_ingest --bulk-files 3 --bulk-chunks 1000 --notes 8
+
+桩服务按 --embed-quota 模拟供应商侧的 Embedding 速率额度（每秒请求数，超出返回 429），
+后端的全局入库速率由 --ingest-rate 设置（INGEST_EMBED_RATE）。
+脚本只经由 /upload_knowledge 与 /knowledge_status 驱动，把本脚本与桩服务放到改动前的版本中即可运行同一场景做对比。
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+from benchmarks.run import Stack, add_stack_arguments, report_header, run_upload, write_report
+
+PARAGRAPH = "内容运营复盘：本周选题围绕秋季出游，封面采用高饱和配色，开头三秒抛出悬念，评论区集中讨论路线与预算。" * 8
+
+
+def document(chunks: int, tag: str) -> str:
+    # 每段约 450 字，切块后一段即一个知识块
+    return "\n\n".join(f"{tag} 第 {i} 段。{PARAGRAPH}" for i in range(chunks))
+
+
+def run(args) -> dict:
+    stack = Stack(args, backend_env={
+        "INGEST_EMBED_RATE": str(args.ingest_rate),
+        "INGEST_EMBED_BURST": "1",
+    })
+    try:
+        backend_url = stack.start()
+        requests.post(
+            f"{stack.fake_url}/_config",
+            json={"embed_latency": args.embed_latency, "embed_quota": args.embed_quota},
+            timeout=5,
+        ).raise_for_status()
+        before = stack.fake_stats()
+        bulk, notes = [], []
+        started = time.perf_counter()
+
+        def upload_bulk(i: int):
+            result = run_upload(requests.Session(), backend_url, document(args.bulk_chunks, f"大文件{i}"), timeout=args.timeout)
+            bulk.append({"ok": result["ok"], "latency": round(result["latency"], 2), "error": result.get("error")})
+
+        threads = [threading.Thread(target=upload_bulk, args=(i,)) for i in range(args.bulk_files)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.notes_delay)
+        session = requests.Session()
+        for i in range(args.notes):
+            result = run_upload(session, backend_url, document(args.note_chunks, f"笔记{i}"), timeout=args.timeout)
+            notes.append(result["latency"] if result["ok"] else None)
+            time.sleep(args.note_interval)
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        done = sorted(latency for latency in notes if latency is not None)
+        report = {
+            "notes": {
+                "completed": len(done),
+                "failed": len(notes) - len(done),
+                "p50_seconds": round(statistics.median(done), 2) if done else None,
+                "max_seconds": round(done[-1], 2) if done else None,
+            },
+            "bulk": bulk,
+            "wall_seconds": round(wall, 2),
+        }
+        after = stack.fake_stats()
+        requests_made = after.get("embeddings", 0) - before.get("embeddings", 0)
+        report["embeddings"] = {
+            "requests": requests_made,
+            "rejected_429": after.get("embeddings_429", 0) - before.get("embeddings_429", 0),
+            "requests_per_second": round(requests_made / wall, 2),
+        }
+        return report
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stack_arguments(parser)
+    parser.add_argument("--bulk-files", type=int, default=6, help="同时批量入库的大文件数")
+    parser.add_argument("--bulk-chunks", type=int, default=1000, help="每个大文件的知识块数")
+    parser.add_argument("--notes", type=int, default=6, help="大文件入库期间依次上传的小笔记数")
+    parser.add_argument("--note-chunks", type=int, default=2, help="每篇小笔记的知识块数")
+    parser.add_argument("--notes-delay", type=float, default=3, help="大文件开始入库后多久开始上传笔记 (秒)")
+    parser.add_argument("--note-interval", type=float, default=1, help="相邻两篇笔记的间隔 (秒)")
+    parser.add_argument("--embed-latency", type=float, default=0.3, help="桩服务每次 Embedding 请求的耗时 (秒)")
+    parser.add_argument("--embed-quota", type=float, default=4, help="桩服务 Embedding 每秒请求额度，超出返回 429；0 表示不限")
+    parser.add_argument("--ingest-rate", type=float, default=3.5, help="后端全局入库速率 INGEST_EMBED_RATE (批次/秒)，应略低于供应商额度")
+    parser.add_argument("--timeout", type=float, default=900, help="单个上传等待入库完成的上限 (秒)")
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    args = parser.parse_args()
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
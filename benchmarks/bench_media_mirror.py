@@ -0,0 +1,110 @@
+# benchmarks/bench_media_mirror.py
+"""
+生成媒体本地镜像基准：对比前端重放历史时直接拉取供应商链接（remote）与读取后端镜像（mirror）的耗时与传输量。
+
+    python -m benchmarks.bench_media_mirror --replays 5
+    python -m benchmarks.bench_media_mirror --media-bandwidth 2e6   # 模拟更慢的 CDN
+
+桩服务生成 2048x2048 PNG 图片与 6 秒 720p 视频，下载链接按 --media-bandwidth 限速。测量项：
+- 每次重放的取图 / 取视频耗时：remote 每次完整下载；mirror 首次从本地磁盘读取，之后浏览器携带 If-None-Match 得到 304
+- 历史缩略图与视频封面的大小
+- 视频拖动进度条：Range 请求中段 1MB 的耗时，对比完整下载
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from benchmarks.run import Stack, add_stack_arguments, report_header, write_report
+
+SEEK_BYTES = 1024 * 1024
+
+
+def timed_get(url: str, headers: dict | None = None) -> tuple[float, int, requests.Response]:
+    started = time.perf_counter()
+    response = requests.get(url, headers=headers or {}, timeout=120)
+    return time.perf_counter() - started, len(response.content), response
+
+
+def wait_mirrored(backend_url: str, local_url: str, timeout: float = 60) -> float:
+    """等待镜像就绪（本地地址直接返回 200 而不是重定向），返回等待秒数"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        response = requests.get(f"{backend_url}{local_url}", allow_redirects=False, timeout=30)
+        if response.status_code == 200:
+            return time.perf_counter() - started
+        time.sleep(0.1)
+    raise TimeoutError(f"镜像未在 {timeout} 秒内就绪: {local_url}")
+
+
+def measure(backend_url: str, media: dict, replays: int) -> dict:
+    remote_url, local_url = media["url"], f"{backend_url}{media['local_url']}"
+    result = {"mirror_ready_seconds": round(wait_mirrored(backend_url, media["local_url"]), 3)}
+
+    remote = [timed_get(remote_url) for _ in range(replays)]
+    result["remote"] = {
+        "seconds_per_replay": round(statistics.median(t for t, _, _ in remote), 4),
+        "bytes_per_replay": remote[0][1],
+    }
+
+    seconds, size, first = timed_get(local_url)
+    etag = first.headers["ETag"]
+    revalidated = [timed_get(local_url, {"If-None-Match": etag}) for _ in range(replays)]
+    result["mirror"] = {
+        "first_load_seconds": round(seconds, 4),
+        "first_load_bytes": size,
+        "revalidate_seconds": round(statistics.median(t for t, _, _ in revalidated), 4),
+        "revalidate_status": revalidated[0][2].status_code,
+        "cache_control": first.headers.get("Cache-Control"),
+    }
+    for key in ("thumbnail_url", "poster_url"):
+        if media.get(key):
+            seconds, size, response = timed_get(f"{backend_url}{media[key]}")
+            result["mirror"][key.removesuffix("_url")] = {"bytes": size, "seconds": round(seconds, 4), "status": response.status_code}
+
+    if media["kind"] == "video":
+        total = result["mirror"]["first_load_bytes"]
+        start = max(0, total // 2 - SEEK_BYTES // 2)
+        seeks = [timed_get(local_url, {"Range": f"bytes={start}-{start + SEEK_BYTES - 1}"}) for _ in range(replays)]
+        result["mirror"]["seek"] = {
+            "status": seeks[0][2].status_code,
+            "bytes": seeks[0][1],
+            "seconds": round(statistics.median(t for t, _, _ in seeks), 4),
+            "content_range": seeks[0][2].headers.get("Content-Range"),
+        }
+    result["speedup_per_replay"] = round(result["remote"]["seconds_per_replay"] / result["mirror"]["revalidate_seconds"], 1)
+    return result
+
+
+def run(args) -> dict:
+    stack = Stack(args)
+    try:
+        backend_url = stack.start()
+        requests.post(f"{stack.fake_url}/_config", json={"media_bandwidth": args.media_bandwidth}, timeout=5).raise_for_status()
+        report = {}
+        for kind in ("image", "video"):
+            response = requests.post(f"{backend_url}/api/generate_{kind}", json={"prompt": "基准测试"}, timeout=120).json()
+            if response.get("status") != "success" or "local_url" not in response:
+                raise RuntimeError(f"生成 {kind} 失败或未开启镜像: {response}")
+            report[kind] = measure(backend_url, response, args.replays)
+        report["provider_media_downloads"] = stack.fake_stats().get("media_downloads", 0)
+        return report
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stack_arguments(parser)
+    parser.add_argument("--replays", type=int, default=5, help="模拟重放历史的次数")
+    parser.add_argument("--media-bandwidth", type=float, default=8e6, help="供应商媒体下载带宽 (字节/秒)")
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    parser.set_defaults(image_latency=0.2, video_latency=0.5)
+    args = parser.parse_args()
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/bench_response_cache.py
+"""
+对话回答缓存基准：以 RESPONSE_CACHE=1 启动后端，按顺序发送一组纯文本请求，记录每一步的耗时、首字延迟、
+是否调用了对话模型（桩服务的 chat 计数）以及 /metrics 中 cache="response" 的结果。
+
+    python -m benchmarks.bench_response_cache
+    python -m benchmarks.bench_response_cache --similarity 0.9
+
+步骤依次为：首次请求 (miss)、新会话中重复 (exact)、空白与标点不同 (exact，归一化后相同)、
+换一种说法 (semantic)、不同主题 (miss)、更换系统提示词 (miss)、同一会话的第二轮 (miss，对话历史不同)、
+命中过的会话的第二轮 (exact，检查点中已写入命中的问答)、知识库入库后重复 (miss，版本失效)、附带图片 (不查缓存)。
+"""
+import argparse
+import base64
+import os
+import re
+import uuid
+
+import cv2
+import numpy as np
+import requests
+
+from benchmarks.run import Stack, add_stack_arguments, report_header, run_chat, run_upload, write_report
+
+SYSTEM_PROMPT = "你是一名短视频运营专家，回答精炼并给出可直接使用的文案。"
+PROMPT = "写一个抖音爆款文案，主题是周末露营装备推荐"
+
+
+def _image_data() -> str:
+    _, jpeg = cv2.imencode(".jpg", np.full((256, 256, 3), 200, np.uint8))
+    return base64.b64encode(jpeg.tobytes()).decode("ascii")
+
+
+def _cache_counts(backend_url: str) -> dict:
+    text = requests.get(f"{backend_url}/metrics", timeout=5).text
+    pattern = r'mediacraft_cache_requests_total\{cache="response",result="(\w+)"\} ([\d.]+)'
+    return {result: float(value) for result, value in re.findall(pattern, text)}
+
+
+def run(args) -> dict:
+    stack = Stack(args)
+    try:
+        backend_url = stack.start()
+        session = requests.Session()
+        shared_thread, hit_thread = str(uuid.uuid4()), str(uuid.uuid4())
+
+        def chat(content: str, thread_id: str | None = None, system_prompt: str = SYSTEM_PROMPT, **extra) -> dict:
+            payload = {
+                "content": content, "thread_id": thread_id or str(uuid.uuid4()), "system_prompt": system_prompt,
+                "llm_config": {"chat": args.model}, **extra,
+            }
+            chat_before, cache_before = stack.fake_stats().get("chat", 0), _cache_counts(backend_url)
+            result = run_chat(session, backend_url, payload)
+            cache_after = _cache_counts(backend_url)
+            return {
+                "ok": result["ok"],
+                "latency": round(result["latency"], 4),
+                "ttft": round(result["ttft"], 4) if result["ttft"] is not None else None,
+                "model_calls": stack.fake_stats().get("chat", 0) - chat_before,
+                "cache": next((k for k in cache_after if cache_after[k] != cache_before.get(k, 0)), "bypass"),
+            }
+
+        steps = {}
+        steps["first"] = chat(PROMPT, shared_thread)
+        # 轮次结束时即写入，原文重复立刻可命中；语义匹配所需的向量在后台补上
+        steps["exact_repeat"] = chat(PROMPT, hit_thread)
+        steps["normalized_repeat"] = chat(f"  {PROMPT}。 ")
+        steps["paraphrase"] = chat("写一个抖音爆款文案，主题是周末露营装备的推荐")
+        steps["different_topic"] = chat("写一个抖音爆款文案，主题是新手咖啡器具入门")
+        steps["different_system_prompt"] = chat(PROMPT, system_prompt="你是一个智能助手。")
+        steps["second_turn_same_thread"] = chat(PROMPT, shared_thread)
+        # 命中时问答已写入检查点，该会话的历史与 shared_thread 相同，第二轮命中上一步写入的条目
+        steps["second_turn_after_hit"] = chat(PROMPT, hit_thread)
+        upload = run_upload(session, backend_url)
+        steps["after_knowledge_upload"] = chat(PROMPT) if upload["ok"] else {"ok": False, "error": upload.get("error")}
+        steps["with_image"] = chat(PROMPT, image_data=_image_data())
+
+        full = [s["latency"] for s in steps.values() if s.get("model_calls")]
+        hits = [s["latency"] for s in steps.values() if s.get("cache") in ("hit", "semantic_hit")]
+        return {
+            "steps": steps,
+            "summary": {
+                "full_turn_latency": round(sum(full) / len(full), 4) if full else None,
+                "hit_latency": round(sum(hits) / len(hits), 4) if hits else None,
+                "hits": len(hits),
+            },
+        }
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stack_arguments(parser)
+    parser.add_argument("--model", default="DeepSeek-V3 (SiliconFlow)")
+    parser.add_argument("--similarity", type=float, default=0.95, help="RESPONSE_CACHE_SIMILARITY")
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    args = parser.parse_args()
+    # Stack 以当前环境变量启动后端
+    os.environ.update({"RESPONSE_CACHE": "1", "RESPONSE_CACHE_SIMILARITY": str(args.similarity)})
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/bench_scaling.py
+"""
+多 worker 扩展性：STATE_BACKEND=sqlite 下依次以 1..N 个 uvicorn worker 启动后端，用相同负载压测对话吞吐。
+
+    python -m benchmarks.bench_scaling --workers-list 1 2 4 --concurrency 64 --requests 400
+
+供应商并发额度按进程生效（--provider-concurrency 为每个 worker 的额度），
+因此在 CPU 未饱和前吞吐应随 worker 数近似线性增长。输出一行 JSON。
+"""
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.run import Stack, _git_commit, add_stack_arguments, drive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers-list", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--model", default="DeepSeek-V3 (SiliconFlow)")
+    add_stack_arguments(parser)
+    parser.set_defaults(state_backend="sqlite", provider_concurrency=8)
+    args = parser.parse_args()
+    args.scenario, args.duration = "chat", 0
+
+    runs = []
+    for workers in args.workers_list:
+        args.workers = workers
+        stack = Stack(args)
+        try:
+            base_url = stack.start()
+            print(f"🚀 {workers} worker(s)", file=sys.stderr)
+            summaries, wall = drive(args, base_url)
+        finally:
+            stack.stop()
+        chat = summaries["chat"]
+        runs.append({
+            "workers": workers,
+            "ok": chat["ok"],
+            "errors": chat["errors"],
+            "throughput_rps": chat["throughput_rps"],
+            "latency_p95": chat["latency"].get("p95"),
+            "ttft_p95": chat.get("ttft", {}).get("p95"),
+        })
+    base = runs[0]["throughput_rps"] or 1
+    for run in runs:
+        run["speedup"] = run["throughput_rps"] / base
+    print(json.dumps({
+        "git_commit": _git_commit(),
+        "cpus": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("backend_url", "workers")},
+        "runs": runs,
+    }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
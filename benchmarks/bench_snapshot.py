@@ -0,0 +1,132 @@
+# benchmarks/bench_snapshot.py
+"""
+知识库快照基准：生成合成快照（知识块原文、元数据与单位向量），测量导入、重复导入与导出的吞吐和文件体积，
+并与改动前在新节点上重新切分、重新向量化所需的 Embedding 请求数对比。
+
+    python -m benchmarks.bench_snapshot                              # 2 万块，bge-m3 的 1024 维，开发机上一两分钟
+    python -m benchmarks.bench_snapshot --chunks 1000000 --dim 1024  # 完整规模
+
+在进程内直接调用 app.snapshot，向量库写在临时目录。SILICONFLOW_BASE_URL 指向一个没有服务监听的端口，
+导入中只要发出 Embedding 请求就会失败，导入成功即说明全程没有调用 Embedding 接口。
+100 万块 x 1024 维的向量约 4 GB，向量索引常驻内存，完整规模需要相应的内存与磁盘。
+
+测量项：
+- file：快照体积与每块字节数
+- scan：只解析快照（逐行核对内容哈希、零拷贝取出向量列）、不写向量库的吞吐，即导入的文件侧上限
+- import：写入空集合的吞吐（主要耗时在向量索引构建）与进程峰值内存
+- reimport：再次导入同一快照，内容未变的块按内容哈希跳过
+- export：从向量库导出回快照的吞吐
+- reembed：改动前重建同样规模知识库的 Embedding 请求数（每批 50 块），以及入库循环每批间隔 0.5s 带来的耗时下限
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.run import report_header, write_report
+
+CORPUS = (
+    "内容运营要点：选题要贴近目标人群的日常，开头三秒给出冲突或悬念，封面突出主体与大字标题。"
+    "发布时间避开工作日上午，评论区前十分钟内回复能明显提升互动率。短视频节奏以每五到八秒一个信息点为宜，"
+    "口播稿控制在每分钟两百字左右，字幕与画面关键元素不要互相遮挡。"
+)
+EMBED_BATCH = 50  # 与 add_to_knowledge_base 的分批一致
+EMBED_PACING = 0.5  # add_to_knowledge_base 每批之间的固定间隔
+
+
+def chunk_text(index: int, chars: int) -> str:
+    start = index % len(CORPUS)
+    text = (CORPUS * (chars // len(CORPUS) + 2))[start:start + chars]
+    return f"【第 {index} 块】{text}"
+
+
+def generate(path: str, chunks: int, dim: int, chars: int, batch: int):
+    from app.snapshot import SnapshotWriter
+
+    rng = np.random.default_rng(0)
+    writer = SnapshotWriter(path, "knowledge", dim)
+    for start in range(0, chunks, batch):
+        end = min(chunks, start + batch)
+        vectors = rng.standard_normal((end - start, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        writer.write(
+            [f"chunk-{i}" for i in range(start, end)],
+            [chunk_text(i, chars) for i in range(start, end)],
+            [{"source": f"doc_{i // 200}.pdf"} for i in range(start, end)],
+            vectors,
+        )
+    writer.close()
+
+
+def scan(path: str, dim: int) -> dict:
+    import pyarrow.parquet as pq
+
+    from app.snapshot import SNAPSHOT_BATCH, _content_hash
+
+    started, rows = time.perf_counter(), 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=SNAPSHOT_BATCH):
+        documents = batch.column("document").to_pylist()
+        if any(_content_hash(d) != h for d, h in zip(documents, batch.column("content_hash").to_pylist())):
+            raise RuntimeError("内容哈希不符")
+        _ = [json.loads(m) for m in batch.column("metadata").to_pylist()]
+        _ = batch.column("embedding").flatten().to_numpy(zero_copy_only=True).reshape(-1, dim)
+        rows += batch.num_rows
+    seconds = time.perf_counter() - started
+    return {"seconds": round(seconds, 3), "chunks_per_second": round(rows / seconds, 1)}
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_snapshot_")
+    os.environ.update({
+        "STATE_DIR": os.path.join(workdir, "state"),
+        "CHROMA_PERSIST_DIR": os.path.join(workdir, "chroma_db"),
+        "SILICONFLOW_BASE_URL": "http://127.0.0.1:9",
+    })
+    os.environ.setdefault("SILICONFLOW_API_KEY", "bench")
+    from app import snapshot
+
+    try:
+        source = os.path.join(workdir, "source.parquet")
+        started = time.perf_counter()
+        generate(source, args.chunks, args.dim, args.chunk_chars, snapshot.SNAPSHOT_BATCH)
+        size = os.path.getsize(source)
+        report = {
+            "generate_seconds": round(time.perf_counter() - started, 3),
+            "file": {"bytes": size, "bytes_per_chunk": round(size / args.chunks, 1)},
+            "scan": scan(source, args.dim),
+        }
+        report["import"] = snapshot.import_snapshot(source)
+        report["import"]["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        report["reimport"] = snapshot.import_snapshot(source)
+        exported = snapshot.export_snapshot(os.path.join(workdir, "export.parquet"))
+        exported["chunks_per_second"] = round(exported["exported"] / exported["seconds"], 1)
+        report["export"] = exported
+        batches = math.ceil(args.chunks / EMBED_BATCH)
+        report["reembed"] = {
+            "embedding_requests": batches,
+            "pacing_floor_hours": round(batches * EMBED_PACING / 3600, 2),
+        }
+        report["speedup_vs_pacing_floor"] = round(batches * EMBED_PACING / report["import"]["seconds"], 1)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20_000, help="知识块数，完整规模为 1000000")
+    parser.add_argument("--dim", type=int, default=1024, help="向量维度（bge-m3 为 1024）")
+    parser.add_argument("--chunk-chars", type=int, default=300, help="每块字数")
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    args = parser.parse_args()
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_sse_protocol.py
+"""
+流式协议微基准：对比逐 token 发帧 (旧协议) 与时间/大小窗口合并 (v1 协议)。
+
+    python -m benchmarks.bench_sse_protocol --tokens 3000 --token-interval 0.002
+
+帧数即前端 text_placeholder.markdown 的重绘次数；输出为一行 JSON 便于留档对比。
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app import protocol
+
+
+def _frame_bytes(frame: dict) -> int:
+    """按 sse_starlette 的帧格式估算线上字节数"""
+    size = len(b"data: ") + len(frame["data"].encode("utf-8")) + 4
+    if frame.get("event"):
+        size += len(b"event: ") + len(frame["event"].encode("utf-8")) + 2
+    return size
+
+
+async def _token_source(tokens: int, interval: float):
+    for i in range(tokens):
+        if interval:
+            await asyncio.sleep(interval)
+        yield protocol.TOKEN, {"text": "字" if i % 2 else "词"}
+
+
+async def _run_legacy(tokens: int, interval: float) -> dict:
+    frames, wire_bytes = 0, 0
+    start = time.perf_counter()
+    async for _, payload in _token_source(tokens, interval):
+        frame = {"data": payload["text"]}
+        frames += 1
+        wire_bytes += _frame_bytes(frame)
+    elapsed = time.perf_counter() - start
+    return {"frames": frames, "renders": frames, "bytes": wire_bytes, "seconds": round(elapsed, 4),
+            "events_per_sec": round(frames / elapsed, 1)}
+
+
+async def _run_coalesced(tokens: int, interval: float, consumer_delay: float) -> dict:
+    frames, renders, wire_bytes = 0, 0, 0
+    start = time.perf_counter()
+    async for frame in protocol.coalesce_events(_token_source(tokens, interval)):
+        frames += 1
+        if frame["event"] == protocol.TOKEN:
+            renders += 1
+        wire_bytes += _frame_bytes(frame)
+        if consumer_delay:
+            # 模拟慢客户端，验证反压下的合并效果
+            await asyncio.sleep(consumer_delay)
+    elapsed = time.perf_counter() - start
+    return {"frames": frames, "renders": renders, "bytes": wire_bytes, "seconds": round(elapsed, 4),
+            "tokens_per_sec": round(tokens / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=3000)
+    parser.add_argument("--token-interval", type=float, default=0.002, help="上游 token 间隔 (秒)，0 表示突发")
+    parser.add_argument("--consumer-delay", type=float, default=0.0, help="每帧发送耗时 (秒)，模拟慢客户端")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "sse_protocol",
+        "tokens": args.tokens,
+        "token_interval": args.token_interval,
+        "legacy": asyncio.run(_run_legacy(args.tokens, args.token_interval)),
+        "v1": asyncio.run(_run_coalesced(args.tokens, args.token_interval, args.consumer_delay)),
+    }
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_startup.py
+"""
+冷启动基准：导入 app.main 的耗时、进程启动到端口可用 / 就绪 (/ready) 的耗时，以及首个和第二个对话请求的延迟。
+
+    python -m benchmarks.bench_startup --runs 3
+
+后端与桩服务均为新进程，每轮使用全新的 Chroma 目录；输出一行 JSON（各项取中位数）。
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+import requests
+
+from benchmarks.run import ROOT, Stack, _git_commit, add_stack_arguments, chat_payload, run_chat
+
+
+def measure_import() -> float:
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT, text=True, stderr=subprocess.DEVNULL)
+    return float(out.strip().splitlines()[-1])
+
+
+def measure_boot(args) -> dict:
+    stack = Stack(args)
+    try:
+        base_url = stack.start()
+        session = requests.Session()
+        first = run_chat(session, base_url, chat_payload(["你好"], args.model))
+        second = run_chat(session, base_url, chat_payload(["你好"], args.model))
+        return {
+            **stack.boot_times,
+            "first_chat_latency": first["latency"],
+            "first_chat_ttft": first["ttft"],
+            "second_chat_latency": second["latency"],
+            "second_chat_ttft": second["ttft"],
+        }
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default="DeepSeek-V3 (SiliconFlow)")
+    add_stack_arguments(parser)
+    args = parser.parse_args()
+    args.concurrency = 1
+
+    imports = [measure_import() for _ in range(args.runs)]
+    boots = [measure_boot(args) for _ in range(args.runs)]
+    result = {"git_commit": _git_commit(), "runs": args.runs, "import_app_main": statistics.median(imports)}
+    for key in boots[0]:
+        values = [b[key] for b in boots if b[key] is not None]
+        result[key] = statistics.median(values) if values else None
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_storyboard.py
+"""
+分镜工作流基准：对比大脑逐个镜头调用 generate_image（sequential）与分镜工作流（storyboard）生成 N 个镜头的耗时。
+
+    python -m benchmarks.bench_storyboard --shots 6
+    python -m benchmarks.bench_storyboard --shots 6 --with-video
+
+sequential 在同一会话中连续发送 N 轮“画第 i 个镜头”，每轮包含一次工具决策往返、一次画图与一次回答；
+storyboard 分别走 POST /api/storyboard 与对话中的 create_storyboard 工具。测量项：
+- 总耗时、第一张画面到达时间、规划耗时
+- 收到的媒体事件数（对话路径用于确认嵌套的画图调用没有重复推送）
+"""
+import argparse
+import time
+import uuid
+
+import requests
+
+from benchmarks.run import STORYBOARD_SCRIPT, Stack, add_stack_arguments, iter_events, report_header, run_storyboard, write_report
+
+
+def chat_turn(session: requests.Session, base_url: str, thread_id: str, model: str, content: str) -> tuple[float | None, int]:
+    """返回 (第一张画面到达的相对时间, 媒体事件数)"""
+    start = time.perf_counter()
+    first_media, media = None, 0
+    payload = {"content": content, "thread_id": thread_id, "llm_config": {"chat": model}}
+    with session.post(f"{base_url}/chat/stream", json=payload, stream=True, timeout=900) as response:
+        for event, data in iter_events(response):
+            if event == "media":
+                media += 1
+                if first_media is None:
+                    first_media = time.perf_counter() - start
+            elif event == "error":
+                raise RuntimeError(data.get("message"))
+            elif event == "done":
+                break
+    return first_media, media
+
+
+def run_sequential(session: requests.Session, base_url: str, args) -> dict:
+    thread_id, start = str(uuid.uuid4()), time.perf_counter()
+    first_media, media = None, 0
+    for i in range(args.shots):
+        turn_start = time.perf_counter() - start
+        shot_first, shot_media = chat_turn(session, base_url, thread_id, args.model, f"画第 {i + 1} 个镜头：{STORYBOARD_SCRIPT}")
+        if first_media is None and shot_first is not None:
+            first_media = turn_start + shot_first
+        media += shot_media
+    return {"latency": round(time.perf_counter() - start, 3), "ttft": round(first_media or 0, 3), "media": media}
+
+
+def run(args) -> dict:
+    stack = Stack(args)
+    try:
+        backend_url = stack.start()
+        session = requests.Session()
+        report = {"sequential": run_sequential(session, backend_url, args)}
+
+        result = run_storyboard(session, backend_url, {
+            "script": STORYBOARD_SCRIPT, "shots": args.shots, "with_video": args.with_video, "chat_model": args.model,
+        })
+        report["storyboard_api"] = {
+            key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()
+        }
+
+        start = time.perf_counter()
+        first_media, media = chat_turn(session, backend_url, str(uuid.uuid4()), args.model, f"帮我把这段脚本做成分镜：{STORYBOARD_SCRIPT}")
+        report["storyboard_chat"] = {"latency": round(time.perf_counter() - start, 3), "ttft": round(first_media or 0, 3), "media": media}
+
+        report["speedup"] = round(report["sequential"]["latency"] / report["storyboard_api"]["latency"], 2)
+        report["provider_image_calls"] = stack.fake_stats().get("image", 0)
+        return report
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stack_arguments(parser)
+    parser.add_argument("--shots", type=int, default=6, help="镜头数")
+    parser.add_argument("--with-video", action="store_true", help="storyboard 同时为每个镜头生成视频")
+    parser.add_argument("--model", default="DeepSeek-V3 (SiliconFlow)")
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    parser.set_defaults(video_latency=4.0)
+    args = parser.parse_args()
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/bench_stream_events.py
+"""
+对比 chat_stream 事件循环在 astream_events v1 全量订阅与 v2 源头过滤下的 CPU 开销。
+
+    python -m benchmarks.bench_stream_events --streams 20 --tokens 800
+
+每轮对话：大脑先调用 generate_image（HTTP 已打桩），再流式输出 --tokens 个 token。
+并发跑 --streams 轮，统计进程 CPU 时间 / 轮，输出一行 JSON。
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+os.environ.setdefault("VOLC_API_KEY", "bench")
+os.environ.setdefault("DOUBAO_IMAGE_ENDPOINT", "bench")
+# 解除供应商限流，只测事件循环本身
+os.environ.setdefault("DEEPSEEK_RATE_LIMIT", "100000")
+os.environ.setdefault("DEEPSEEK_BURST", "100000")
+os.environ.setdefault("DEEPSEEK_MAX_CONCURRENCY", "100000")
+
+from app import agent  # noqa: E402
+from app import main as backend  # noqa: E402
+
+
+class ScriptedChatModel(BaseChatModel):
+    """首跳返回 generate_image 工具调用，拿到工具结果后流式输出 tokens 个 token"""
+
+    tokens: int = 800
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _reply(self, messages) -> AIMessage:
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage(content="字" * self.tokens)
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": "generate_image", "args": {"prompt": "bench"}, "id": f"call_{uuid.uuid4().hex[:8]}"}],
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        if reply.tool_calls:
+            call = reply.tool_calls[0]
+            chunk = AIMessageChunk(
+                content="",
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}],
+            )
+            yield ChatGenerationChunk(message=chunk)
+            return
+        for token in reply.content:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+async def _legacy_consumer(inputs, config) -> int:
+    """迁移前的事件循环：v1 全量事件 + if/elif 分发 + 正则解析工具输出"""
+    emitted = 0
+    async for event in agent.app_graph.astream_events(inputs, config=config, version="v1"):
+        kind = event["event"]
+        if kind == "on_tool_start":
+            if event.get("name") in ("generate_image", "analyze_uploaded_image", "analyze_uploaded_video", "generate_video"):
+                emitted += 1
+        elif kind == "on_tool_end":
+            output = event["data"].get("output")
+            if output and event.get("name") == "generate_image":
+                if re.search(r"\[System Hidden URL:\s*(https?://[^\s\]]+)\]", str(output)):
+                    emitted += 1
+        elif kind == "on_chat_model_stream":
+            if event["data"]["chunk"].content:
+                emitted += 1
+    return emitted
+
+
+async def _current_consumer(inputs, config) -> int:
+    emitted = 0
+    async for _ in backend.stream_graph_events(inputs, config):
+        emitted += 1
+    return emitted
+
+
+async def _run(consumer, streams: int) -> dict:
+    def make_turn():
+        inputs = {"messages": [backend.HumanMessage(content="画一张图")]}
+        config = {"configurable": {"thread_id": uuid.uuid4().hex, "selected_chat_model": "bench", "system_prompt": "bench"}}
+        return consumer(inputs, config)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    emitted = await asyncio.gather(*(make_turn() for _ in range(streams)))
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    return {
+        "cpu_ms_per_turn": round(cpu * 1000 / streams, 2),
+        "wall_seconds": round(wall, 3),
+        "events_emitted_per_turn": emitted[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=20, help="并发对话数")
+    parser.add_argument("--tokens", type=int, default=800, help="每轮回复的 token 数")
+    args = parser.parse_args()
+
+    fake_response = SimpleNamespace(status_code=200, json=lambda: {"data": [{"url": "https://bench.local/x.png"}]})
+    model = ScriptedChatModel(tokens=args.tokens)
+    with mock.patch.object(agent, "get_llm", lambda label: model), \
+            mock.patch("app.tools.requests.post", lambda *a, **kw: fake_response):
+        # 预热一轮，排除首次导入与编译开销
+        asyncio.run(_run(_current_consumer, 1))
+        report = {
+            "benchmark": "stream_events",
+            "streams": args.streams,
+            "tokens": args.tokens,
+            "v1_unfiltered": asyncio.run(_run(_legacy_consumer, args.streams)),
+            "v2_filtered": asyncio.run(_run(_current_consumer, args.streams)),
+        }
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/bench_tool_budget.py
+"""
+工具结果体积基准：上传一份知识库文档后，在若干个会话中交替提问（联网搜索 / 查阅知识库），
+测量每一跳发给对话模型的请求体大小，以及每个会话在对话检查点中占用的字节数。
+
+    python -m benchmarks.bench_tool_budget
+    python -m benchmarks.bench_tool_budget --threads 4 --turns 8 --search-content-chars 3000
+
+桩服务的搜索结果为约 --search-content-chars 字的网页正文；后端使用 sqlite 状态后端，
+检查点大小直接从 STATE_DIR/checkpoints.sqlite 中统计。
+测量项：
+- prompt：每一跳请求体字节数的均值与最大值（会话越往后，历史中的工具结果越多）
+- checkpoint：每个会话最新检查点的字节数，以及该会话全部检查点与待写记录的总字节数
+- tool_output：/metrics 中检索类工具结果摘录前后的字节数（改动前的版本没有这项指标）
+"""
+import argparse
+import os
+import re
+import sqlite3
+import statistics
+import uuid
+
+import requests
+
+from benchmarks.run import Stack, add_stack_arguments, report_header, run_chat, run_upload, write_report
+
+# 避开桩模型的其他触发词（“视频”“画”等）
+PROMPTS = [
+    "帮我搜索一下抖音最佳发布时间",
+    "查一下资料：封面应该怎么设计",
+    "搜索最近平台推荐机制有什么变化",
+    "查一下资料里关于评论区运营的建议",
+]
+TOPICS = ["选题", "封面", "标题", "发布时间", "评论区", "口播稿", "字幕", "节奏"]
+
+
+def knowledge_document(paragraphs: int) -> str:
+    # 句子较短，切块时保留上一块末尾约 50 字的重叠
+    return "\n".join(
+        "".join(f"{TOPICS[(i + j) % len(TOPICS)]}要点第 {i}-{j} 条：结合目标人群的日常习惯做取舍，并在复盘时记录数据变化。" for j in range(6))
+        for i in range(paragraphs)
+    )
+
+
+def checkpoint_bytes(path: str, thread_id: str) -> dict:
+    conn = sqlite3.connect(path)
+    try:
+        latest = conn.execute(
+            "SELECT length(checkpoint) + length(metadata) FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT 1",
+            (thread_id,),
+        ).fetchone()
+        stored = conn.execute(
+            "SELECT COALESCE(SUM(length(checkpoint) + length(metadata)), 0) FROM checkpoints WHERE thread_id = ?", (thread_id,)
+        ).fetchone()[0]
+        writes = conn.execute("SELECT COALESCE(SUM(length(value)), 0) FROM writes WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+    finally:
+        conn.close()
+    return {"latest": latest[0] if latest else 0, "stored": stored + writes}
+
+
+def tool_output_bytes(backend_url: str) -> dict:
+    text = requests.get(f"{backend_url}/metrics", timeout=5).text
+    totals = {}
+    for tool, stage, value in re.findall(r'mediacraft_tool_output_bytes_total\{tool="(\w+)",stage="(\w+)"\} ([\d.e+]+)', text):
+        totals.setdefault(tool, {})[stage] = int(float(value))
+    return totals
+
+
+def run(args) -> dict:
+    stack = Stack(args)
+    try:
+        backend_url = stack.start()
+        requests.post(
+            f"{stack.fake_url}/_config", json={"search_content_chars": args.search_content_chars}, timeout=5
+        ).raise_for_status()
+        upload = run_upload(requests.Session(), backend_url, knowledge_document(args.paragraphs))
+        if not upload["ok"]:
+            raise RuntimeError(f"知识库上传失败: {upload.get('error')}")
+
+        session = requests.Session()
+        hops, threads = [], []
+        for _ in range(args.threads):
+            thread_id = str(uuid.uuid4())
+            for turn in range(args.turns):
+                before = stack.fake_stats()
+                result = run_chat(session, backend_url, {"content": PROMPTS[turn % len(PROMPTS)], "thread_id": thread_id})
+                if not result["ok"]:
+                    raise RuntimeError(f"对话失败: {result.get('error')}")
+                after = stack.fake_stats()
+                count = after.get("chat", 0) - before.get("chat", 0)
+                hops.extend([(after.get("request_bytes", 0) - before.get("request_bytes", 0)) / count] * count)
+            threads.append(thread_id)
+
+        path = os.path.join(stack.tmpdir, "state", "checkpoints.sqlite")
+        sizes = [checkpoint_bytes(path, thread_id) for thread_id in threads]
+        return {
+            "prompt_bytes_per_hop": {"mean": round(statistics.mean(hops)), "max": round(max(hops)), "hops": len(hops)},
+            "checkpoint_bytes_per_thread": {
+                "latest": round(statistics.mean(s["latest"] for s in sizes)),
+                "stored": round(statistics.mean(s["stored"] for s in sizes)),
+            },
+            "tool_output": tool_output_bytes(backend_url),
+        }
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stack_arguments(parser)
+    parser.add_argument("--threads", type=int, default=3, help="会话数")
+    parser.add_argument("--turns", type=int, default=6, help="每个会话的轮数，依次轮换联网搜索与查阅知识库")
+    parser.add_argument("--paragraphs", type=int, default=40, help="知识库文档的段落数")
+    parser.add_argument("--search-content-chars", type=float, default=1500, help="每条搜索结果正文的字数")
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    parser.set_defaults(state_backend="sqlite", reply_tokens=40, ttft=0.05, token_rate=1000)
+    args = parser.parse_args()
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
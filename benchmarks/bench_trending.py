@@ -0,0 +1,112 @@
+# benchmarks/bench_trending.py
+"""
+热点入库基准：后端配置三个热榜来源（桩服务的两个滚动榜单 + benchmarks/fixtures 下的固定样例文件），
+手动触发刷新并测量增量入库、过期与查询耗时。
+
+    python -m benchmarks.bench_trending
+    python -m benchmarks.bench_trending --search-latency 3   # 模拟真实联网搜索的耗时
+
+测量项：
+- 启动时调度器自动完成的首次刷新，以及之后的手动刷新：新增 / 更新条数、耗时与向量化请求数（之后只为新上榜的条目向量化）
+- 等待超过保留期后再刷新：已跌出榜单的条目随分区一起过期，仍在榜上的条目保留
+- 对话中问热点：search_trending（本地索引）与 web_search（联网）的工具耗时与整轮耗时
+"""
+import argparse
+import os
+import re
+import statistics
+import time
+import uuid
+
+import requests
+
+from benchmarks.run import ROOT, Stack, add_stack_arguments, report_header, run_chat, write_report
+
+ADMIN_TOKEN = "bench-admin"
+
+FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "trending_douyin.json")
+
+
+def tool_seconds(backend_url: str, tool: str) -> tuple[float, int]:
+    text = requests.get(f"{backend_url}/metrics", timeout=5).text
+    total = re.search(rf'mediacraft_tool_seconds_sum\{{tool="{tool}"\}} ([\d.e-]+)', text)
+    count = re.search(rf'mediacraft_tool_seconds_count\{{tool="{tool}"\}} (\d+)', text)
+    return (float(total.group(1)), int(count.group(1))) if total and count else (0.0, 0)
+
+
+def refresh(stack: Stack, backend_url: str) -> dict:
+    before = stack.fake_stats().get("embeddings", 0)
+    report = requests.post(
+        f"{backend_url}/admin/trending/refresh", headers={"X-Admin-Token": ADMIN_TOKEN}, timeout=300
+    ).json()
+    if report.get("status") != "success":
+        raise RuntimeError(f"刷新失败: {report}")
+    report["embedding_requests"] = stack.fake_stats().get("embeddings", 0) - before
+    for key in ("status", "last_run", "partition"):
+        report.pop(key, None)
+    return report
+
+
+def wait_boot_refresh(backend_url: str, timeout: float = 60) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        last = requests.get(f"{backend_url}/api/trending/status", timeout=5).json().get("last")
+        if last:
+            return {key: last[key] for key in ("sources", "expired", "seconds")}
+        time.sleep(0.2)
+    raise TimeoutError("启动时的首次刷新未完成")
+
+
+def ask(backend_url: str, prompt: str, tool: str, turns: int) -> dict:
+    session = requests.Session()
+    before_sum, before_count = tool_seconds(backend_url, tool)
+    latencies = [run_chat(session, backend_url, {"content": prompt, "thread_id": str(uuid.uuid4())})["latency"] for _ in range(turns)]
+    after_sum, after_count = tool_seconds(backend_url, tool)
+    calls = after_count - before_count
+    return {
+        "tool_calls": calls,
+        "tool_seconds": round((after_sum - before_sum) / calls, 4) if calls else None,
+        "turn_latency": round(statistics.median(latencies), 3),
+    }
+
+
+def run(args) -> dict:
+    stack = Stack(args, backend_env={
+        "TRENDING_SOURCES": f"weibo={{fake_url}}/trending/weibo,zhihu={{fake_url}}/trending/zhihu,douyin={FIXTURE}",
+        # 调度周期设得很长：启动时自动刷新一次，之后只有手动刷新
+        "TRENDING_INTERVAL": "86400",
+        "TRENDING_PARTITION_HOURS": str(args.partition_seconds / 3600),
+        "TRENDING_RETENTION_HOURS": str(args.retention_seconds / 3600),
+        "ADMIN_TOKEN": ADMIN_TOKEN,
+    })
+    try:
+        backend_url = stack.start()
+        requests.post(f"{stack.fake_url}/_config", json={"search_latency": args.search_latency}, timeout=5).raise_for_status()
+        report = {"boot_refresh": wait_boot_refresh(backend_url), "manual_refresh": refresh(stack, backend_url)}
+        report["ask_trending"] = ask(backend_url, "今天有什么热点可以做选题", "search_trending", args.turns)
+        report["ask_web_search"] = ask(backend_url, "搜索今天各平台的热门话题", "web_search", args.turns)
+        if report["ask_trending"]["tool_seconds"] and report["ask_web_search"]["tool_seconds"]:
+            report["tool_speedup"] = round(report["ask_web_search"]["tool_seconds"] / report["ask_trending"]["tool_seconds"], 1)
+        time.sleep(args.retention_seconds + args.partition_seconds)
+        report["after_retention"] = refresh(stack, backend_url)
+        return report
+    finally:
+        stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stack_arguments(parser)
+    parser.add_argument("--turns", type=int, default=3, help="每种问法的对话轮数")
+    parser.add_argument("--search-latency", type=float, default=1.5, help="桩服务联网搜索耗时 (秒)")
+    parser.add_argument("--partition-seconds", type=float, default=2, help="分区长度（基准中缩短为秒级）")
+    parser.add_argument("--retention-seconds", type=float, default=6, help="保留期（基准中缩短为秒级）")
+    parser.add_argument("--concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="报告输出路径 (JSON)")
+    parser.set_defaults(reply_tokens=40)
+    args = parser.parse_args()
+    write_report({**report_header(args), **run(args)}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# benchmarks/fake_providers.py
+"""
+本地供应商桩服务：一个进程同时模拟
+- OpenAI 兼容的 /chat/completions（流式与非流式，含工具调用）与 /embeddings
+- 硅基流动 /rerank
+- 火山引擎 /images/generations 与 /contents/generations/tasks
+- Tavily /search
+- 热榜 /trending/{platform}（app.trending 的通用 JSON 榜单格式）
+延迟、出字速率与 429 注入比例可通过命令行或 POST /_config 调整，GET /_stats 查看请求计数。
+
+    python -m benchmarks.fake_providers --port 9100 --ttft 0.3 --token-rate 60 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter, deque
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIM = 64
+
+# 用户消息包含这些关键字且请求携带了工具定义时，桩模型返回对应的工具调用（附带媒体时后端会注入含工具名的提示）
+TOOL_TRIGGERS = {
+    "分镜": ("create_storyboard", "script"),
+    "热点": ("search_trending", "query"),
+    "analyze_uploaded_image": ("analyze_uploaded_image", "question"),
+    "analyze_uploaded_video": ("analyze_uploaded_video", "question"),
+    "画": ("generate_image", "prompt"),
+    "视频": ("generate_video", "prompt"),
+    "搜索": ("web_search", "query"),
+    "资料": ("search_knowledge_base", "query"),
+}
+
+config = {
+    "ttft": 0.3,  # 对话首字延迟 (秒)
+    "token_rate": 60.0,  # 每秒输出 token 数
+    "reply_tokens": 120,  # 每次回复的 token 数
+    "embed_latency": 0.05,
+    "embed_quota": 0.0,  # Embedding 每秒请求额度，超出的请求返回 429，模拟供应商账户级限流；0 表示不限
+    "rerank_latency": 0.08,
+    "image_latency": 2.0,
+    "video_latency": 8.0,  # 视频任务从提交到成功的耗时
+    "image_concurrency": 0.0,  # 画图接口同时处理的请求上限，超出返回 429，模拟供应商账户级并发额度；0 表示不限
+    "search_latency": 0.6,
+    "search_content_chars": 1500,  # 每条搜索结果正文的字数 (Tavily advanced 通常为一两千字)
+    "error_rate": 0.0,  # 注入 429 的比例
+    "image_prefill_rate": 0.0,  # 视觉请求每秒预填充的图像 token 数 (按 28x28 像素一个 token 估算)，0 表示不计
+    "max_image_tokens": 0.0,  # 单张图片的 token 上限，模拟供应商把超大图片缩到分辨率上限；0 表示不限
+    "upload_bandwidth": 0.0,  # 上行带宽 (字节/秒)，按请求体大小模拟上传耗时；0 表示不计
+    "media_bandwidth": 0.0,  # 生成媒体下载链接的带宽 (字节/秒)，模拟 CDN 拉取耗时；0 表示不限
+    "trending_size": 30,  # 每次返回的热榜条目数
+    "trending_churn": 5,  # 每次拉取榜单滚动替换的条目数
+}
+stats: Counter = Counter()
+embed_window: deque = deque()  # 最近 1 秒内被受理的 Embedding 请求时间
+video_tasks: dict[str, float] = {}
+image_inflight = 0
+
+app = FastAPI(title="MediaCraft fake providers")
+
+
+def _maybe_429(kind: str):
+    stats[kind] += 1
+    if config["error_rate"] and random.random() < config["error_rate"]:
+        stats[f"{kind}_429"] += 1
+        return JSONResponse({"error": {"message": "Rate limit exceeded (injected)", "code": 429}}, status_code=429)
+    return None
+
+
+def _pick_tool(body: dict):
+    messages = body.get("messages") or []
+    if not body.get("tools") or not messages or messages[-1].get("role") != "user":
+        return None
+    content = messages[-1].get("content")
+    text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+    available = {t["function"]["name"] for t in body["tools"]}
+    for keyword, (name, arg) in TOOL_TRIGGERS.items():
+        if keyword in text and name in available:
+            return name, {arg: text[:200]}
+    return None
+
+
+def _storyboard_plan(body: dict) -> list[str] | None:
+    """分镜规划请求（不带工具、提示词含“分镜导演”）返回按要求镜头数的 JSON 数组，拆成多个分块流式输出"""
+    messages = body.get("messages") or []
+    content = messages[-1].get("content") if messages else None
+    if body.get("tools") or not isinstance(content, str) or "分镜导演" not in content:
+        return None
+    match = re.search(r"拆成 (\d+) 个", content)
+    shots = int(match.group(1)) if match else 4
+    plan = [
+        {"title": f"镜头{i + 1}", "image_prompt": f"第 {i + 1} 个镜头的画面，统一的水墨美术风格", "video_prompt": f"第 {i + 1} 个镜头，镜头缓慢推进"}
+        for i in range(shots)
+    ]
+    text = json.dumps(plan, ensure_ascii=False)
+    return [text[i:i + 16] for i in range(0, len(text), 16)]
+
+
+def _image_tokens(body: dict) -> int:
+    """统计请求中 data URL 图片的图像 token 数，模拟视觉模型随图片像素增长的预填充耗时"""
+    import base64
+
+    import cv2
+    import numpy as np
+
+    tokens = 0
+    for message in body.get("messages") or []:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            url = (part.get("image_url") or {}).get("url", "") if part.get("type") == "image_url" else ""
+            if url.startswith("data:"):
+                data = np.frombuffer(base64.b64decode(url.split(",", 1)[1]), np.uint8)
+                image = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+                if image is not None:
+                    height, width = image.shape[0] * 8, image.shape[1] * 8
+                    count = -(-width // 28) * -(-height // 28)
+                    tokens += min(count, int(config["max_image_tokens"])) if config["max_image_tokens"] else count
+                    stats["vision_images"] += 1
+    stats["image_tokens"] += tokens
+    return tokens
+
+
+def _chunk(model: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/{prefix:path}/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(request: Request, prefix: str = ""):
+    if error := _maybe_429("chat"):
+        return error
+    raw = await request.body()
+    body = json.loads(raw)
+    model = body.get("model", "fake")
+    tool = _pick_tool(body)
+    tokens = _storyboard_plan(body) or ["字"] * int(config["reply_tokens"])
+    prefill = _image_tokens(body) / config["image_prefill_rate"] if config["image_prefill_rate"] else 0.0
+    stats["request_bytes"] += len(raw)
+    if config["upload_bandwidth"]:
+        prefill += len(raw) / config["upload_bandwidth"]
+
+    if not body.get("stream"):
+        await asyncio.sleep(config["ttft"] + prefill + len(tokens) / config["token_rate"])
+        message = {"role": "assistant", "content": "".join(tokens)}
+        if tool:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                                "function": {"name": tool[0], "arguments": json.dumps(tool[1], ensure_ascii=False)}}],
+            }
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool else "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(tokens), "total_tokens": 10 + len(tokens)},
+        }
+
+    async def stream():
+        await asyncio.sleep(config["ttft"] + prefill)
+        yield _chunk(model, {"role": "assistant", "content": ""})
+        if tool:
+            call = {"index": 0, "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                    "function": {"name": tool[0], "arguments": json.dumps(tool[1], ensure_ascii=False)}}
+            yield _chunk(model, {"tool_calls": [call]})
+            yield _chunk(model, {}, "tool_calls")
+        else:
+            interval = 1 / config["token_rate"]
+            for token in tokens:
+                await asyncio.sleep(interval)
+                yield _chunk(model, {"content": token})
+            yield _chunk(model, {}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def _vector(item) -> list[float]:
+    """按字符二元组哈希累加的向量：措辞相近的文本余弦相似度高，语义缓存与检索的基准据此得到可信的命中行为"""
+    text = item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+    vector = [0.0] * EMBEDDING_DIM
+    for i in range(max(1, len(text) - 1)):
+        digest = hashlib.sha256(text[i:i + 2].encode()).digest()
+        vector[digest[0] % EMBEDDING_DIM] += 1.0 if digest[1] & 1 else -1.0
+    return vector
+
+
+@app.post("/{prefix:path}/embeddings")
+@app.post("/embeddings")
+async def embeddings(request: Request, prefix: str = ""):
+    if error := _maybe_429("embeddings"):
+        return error
+    if config["embed_quota"]:
+        now = time.monotonic()
+        while embed_window and now - embed_window[0] >= 1:
+            embed_window.popleft()
+        if len(embed_window) >= config["embed_quota"]:
+            stats["embeddings_429"] += 1
+            return JSONResponse({"error": {"message": "Embedding quota exceeded", "code": 429}}, status_code=429)
+        embed_window.append(now)
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await asyncio.sleep(config["embed_latency"])
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": _vector(item)} for i, item in enumerate(inputs)],
+        "model": body.get("model", "fake"),
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+    }
+
+
+@app.post("/{prefix:path}/rerank")
+@app.post("/rerank")
+async def rerank(request: Request, prefix: str = ""):
+    if error := _maybe_429("rerank"):
+        return error
+    body = await request.json()
+    await asyncio.sleep(config["rerank_latency"])
+    top_n = body.get("top_n") or len(body["documents"])
+    results = [{"index": i, "relevance_score": 1 - i / 100} for i in range(len(body["documents"]))]
+    return {"id": "rerank-fake", "results": results[:top_n]}
+
+
+@app.post("/{prefix:path}/images/generations")
+async def images(request: Request, prefix: str = ""):
+    global image_inflight
+    if error := _maybe_429("image"):
+        return error
+    if config["image_concurrency"] and image_inflight >= config["image_concurrency"]:
+        stats["image_429"] += 1
+        return JSONResponse({"error": {"message": "Too many concurrent requests", "code": 429}}, status_code=429)
+    image_inflight += 1
+    stats["image_peak"] = max(stats["image_peak"], image_inflight)
+    try:
+        await asyncio.sleep(config["image_latency"])
+    finally:
+        image_inflight -= 1
+    return {"data": [{"url": f"{request.base_url}_media/{uuid.uuid4().hex}.png"}]}
+
+
+@app.post("/{prefix:path}/contents/generations/tasks")
+async def create_video_task(request: Request, prefix: str = ""):
+    if error := _maybe_429("video_create"):
+        return error
+    task_id = f"cgt-{uuid.uuid4().hex[:12]}"
+    video_tasks[task_id] = time.monotonic()
+    return {"id": task_id}
+
+
+@app.get("/{prefix:path}/contents/generations/tasks/{task_id}")
+async def poll_video_task(request: Request, task_id: str, prefix: str = ""):
+    stats["video_poll"] += 1
+    started = video_tasks.get(task_id)
+    if started is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    if time.monotonic() - started < config["video_latency"]:
+        return {"id": task_id, "status": "running"}
+    return {"id": task_id, "status": "succeeded", "content": {"video_url": f"{request.base_url}_media/{task_id}.mp4"}}
+
+
+@app.delete("/{prefix:path}/contents/generations/tasks/{task_id}")
+async def cancel_video_task(task_id: str, prefix: str = ""):
+    stats["video_cancel"] += 1
+    if video_tasks.pop(task_id, None) is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return {}
+
+
+SEARCH_FILLER = ["平台近期调整了推荐机制，完播率与互动率的权重有所提高。", "多位创作者表示，封面与标题的一致性直接影响点击。",
+                 "数据显示晚间八点到十点仍是流量高峰。", "评论区的及时回复有助于提升账号权重。", "短视频前三秒的信息密度决定了用户是否继续观看。"]
+
+
+def _search_content(query: str, index: int) -> str:
+    """模拟网页正文：约 search_content_chars 字，每隔几句出现一次与查询相关的句子"""
+    sentences, size, n = [], 0, 0
+    while size < config["search_content_chars"]:
+        sentence = f"关于{query[:20]}，第 {index}-{n} 条观点认为值得持续关注。" if n % 4 == 0 else SEARCH_FILLER[(index + n) % len(SEARCH_FILLER)]
+        sentences.append(sentence)
+        size += len(sentence)
+        n += 1
+    return "".join(sentences)
+
+
+@app.post("/search")
+async def tavily_search(request: Request):
+    if error := _maybe_429("search"):
+        return error
+    body = await request.json()
+    await asyncio.sleep(config["search_latency"])
+    query = body.get("query", "")
+    results = [
+        {"title": f"结果 {i}", "url": f"https://example.com/{i}", "content": _search_content(query, i)}
+        for i in range(body.get("max_results", 5))
+    ]
+    return {"query": body.get("query"), "results": results}
+
+
+TRENDING_TOPICS = ["露营装备", "城市骑行", "秋季穿搭", "新茶饮", "国潮彩妆", "宠物经济", "AI 绘画", "短剧出海",
+                   "县城旅游", "围炉煮茶", "陶艺体验", "演唱会经济", "早 C 晚 A", "多巴胺穿搭", "银发博主", "二手奢侈品"]
+
+
+@app.get("/trending/{platform}")
+async def trending_feed(platform: str):
+    """滚动的热榜：每次拉取有 trending_churn 条新上榜，其余沿用上次的条目，热度随拉取次数变化"""
+    round_ = stats[f"trending_{platform}"]
+    stats[f"trending_{platform}"] += 1
+    offset, size = round_ * int(config["trending_churn"]), int(config["trending_size"])
+    items = []
+    for n in range(offset, offset + size):
+        topic = TRENDING_TOPICS[n % len(TRENDING_TOPICS)]
+        items.append({
+            "title": f"{platform} 热议 #{n}：{topic}",
+            "url": f"https://example.com/{platform}/{n}",
+            "heat": 100000 - (n - offset) * 1000 + round_ * 37,
+            "summary": f"关于{topic}的讨论持续升温，第 {n} 号话题",
+        })
+    return {"items": items}
+
+
+@functools.lru_cache(maxsize=None)
+def _sample_media(extension: str) -> bytes:
+    """生成接近真实尺寸的样例媒体：2048x2048 PNG 图片或 6 秒 720p 视频，进程内只生成一次"""
+    import os
+    import tempfile
+
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    if extension == "png":
+        gradient = np.linspace(0, 255, 2048, dtype=np.float32)
+        image = np.stack([gradient[None, :].repeat(2048, 0), gradient[:, None].repeat(2048, 1), np.full((2048, 2048), 128.0)], -1)
+        image = np.clip(image + rng.normal(0, 4, image.shape), 0, 255).astype(np.uint8)
+        return cv2.imencode(".png", image)[1].tobytes()
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    try:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24, (1280, 720))
+        base = rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+        for i in range(24 * 6):
+            writer.write(np.roll(base, i * 8, axis=1))
+        writer.release()
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+@app.get("/_media/{name}")
+async def media(name: str):
+    """生成结果的下载链接，供媒体镜像等功能拉取；按 media_bandwidth 限速"""
+    extension = "mp4" if name.endswith(".mp4") else "png"
+    data = await asyncio.to_thread(_sample_media, extension)
+    stats["media_downloads"] += 1
+    stats["media_bytes"] += len(data)
+
+    async def body():
+        chunk = 256 * 1024
+        for start in range(0, len(data), chunk):
+            if config["media_bandwidth"]:
+                await asyncio.sleep(min(chunk, len(data) - start) / config["media_bandwidth"])
+            yield data[start:start + chunk]
+
+    media_type = "video/mp4" if extension == "mp4" else "image/png"
+    return StreamingResponse(body(), media_type=media_type, headers={"Content-Length": str(len(data))})
+
+
+@app.post("/_config")
+async def update_config(request: Request):
+    config.update(await request.json())
+    return config
+
+
+@app.get("/_stats")
+async def get_stats():
+    return dict(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    for key, value in config.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=float, default=value)
+    args = parser.parse_args()
+    config.update({key: getattr(args, key) for key in config})
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
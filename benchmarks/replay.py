@@ -0,0 +1,233 @@
+# benchmarks/replay.py
+"""
+回放 app/recorder.py 录制的线上流量，用于可复现的前后对比。
+
+    # 录制：后端设置 TRAFFIC_RECORD_PATH 后正常对外服务
+    TRAFFIC_RECORD_PATH=traces/prod.jsonl uvicorn app.main:app
+    # 回放：启动本地桩服务与后端，按原始到达间隔 (--speed 1) 或加速重放
+    python -m benchmarks.replay traces/prod.jsonl --speed 4 --calibrate --out results/replay.json
+
+每条记录按录制时的相对到达时间调度；同一 thread_id 的多轮对话仍落在同一会话上（每次回放加唯一前缀）。
+脱敏后的图片 / 视频用同等字节数的合成样本代替，文档用同等字数的文本代替。
+--calibrate 根据录制到的上游 span 中位数设置桩服务的生图 / 检索 / 向量化 / 重排序延迟。
+报告包含回放结果、录制时的基线以及调度滞后（回放端自身成为瓶颈时会变大）。
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.run import (
+    RssSampler,
+    Stack,
+    _percentiles,
+    add_stack_arguments,
+    report_header,
+    run_chat,
+    run_generate,
+    run_storyboard,
+    run_upload,
+    summarize,
+    write_report,
+)
+
+# 录制的 span 名称 → 桩服务延迟参数
+CALIBRATION_SPANS = {
+    "upstream:volc_image": "image_latency",
+    "tool:generate_video": "video_latency",
+    "upstream:tavily": "search_latency",
+    "rag:embed": "embed_latency",
+    "rag:rerank": "rerank_latency",
+}
+
+
+def load_trace(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda r: r["arrival"])
+
+
+def calibrate(records: list[dict]) -> dict:
+    durations: dict[str, list[float]] = {}
+    for record in records:
+        for s in record.get("spans", []):
+            if s["name"] in CALIBRATION_SPANS:
+                durations.setdefault(CALIBRATION_SPANS[s["name"]], []).append(s["end"] - s["start"])
+    return {key: statistics.median(values) for key, values in durations.items()}
+
+
+def synthetic_image(size: int) -> str:
+    """生成编码后约 size 字节的噪声 JPEG，返回 Base64"""
+    import cv2
+    import numpy as np
+
+    side = int(min(4096, max(16, (size / 1.5) ** 0.5)))
+    image = np.random.randint(0, 256, (side, side, 3), dtype=np.uint8)
+    _, buffer = cv2.imencode(".jpg", image)
+    return base64.b64encode(buffer).decode("utf-8")
+
+
+def synthetic_video(size: int) -> str:
+    """生成约 size 字节（上限约 300 帧）的噪声 MP4，返回 Base64"""
+    import cv2
+    import numpy as np
+
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
+        path = tmp.name
+    try:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24, (320, 240))
+        for i in range(300):
+            writer.write(np.random.randint(0, 256, (240, 320, 3), dtype=np.uint8))
+            if i % 24 == 23 and os.path.getsize(path) >= size:
+                break
+        writer.release()
+        with open(path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+    finally:
+        os.remove(path)
+
+
+class MediaFactory:
+    """按录制的 sha256 缓存合成样本，同一份媒体在回放中只生成一次"""
+
+    def __init__(self):
+        self._cache: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, field: str, digest: dict) -> str:
+        with self._lock:
+            if digest["sha256"] not in self._cache:
+                make = synthetic_video if field == "video_data" else synthetic_image
+                self._cache[digest["sha256"]] = make(digest["bytes"])
+            return self._cache[digest["sha256"]]
+
+
+def build_call(record: dict, base_url: str, run_id: str, media: MediaFactory):
+    payload = record["payload"]
+    kind = record["kind"]
+    if kind == "chat":
+        body = {**payload, "thread_id": f"{run_id}-{payload['thread_id']}"}
+        for field in ("image_data", "video_data"):
+            if body.get(field):
+                body[field] = media.get(field, body[field])
+        return lambda s: run_chat(s, base_url, body)
+    if kind in ("generate_image", "generate_video"):
+        return lambda s: run_generate(s, base_url, kind.split("_", 1)[1], payload["prompt"])
+    if kind == "storyboard":
+        return lambda s: run_storyboard(s, base_url, payload)
+    if kind == "upload_knowledge":
+        line = "回放文档内容，用于按原始规模重放知识库入库。\n"
+        text = (line * (payload["chars"] // len(line) + 1))[: payload["chars"]]
+        return lambda s: run_upload(s, base_url, text)
+    raise ValueError(f"未知的录制类型: {kind}")
+
+
+def replay(records: list[dict], base_url: str, speed: float, concurrency: int) -> tuple[dict, float, dict]:
+    run_id = uuid.uuid4().hex[:8]
+    media = MediaFactory()
+    calls = [(r["kind"], build_call(r, base_url, run_id, media)) for r in records]
+    local = threading.local()
+    lock = threading.Lock()
+    results: dict[str, list[dict]] = {}
+    lags: list[float] = []
+
+    def execute(kind, call, due):
+        lag = time.perf_counter() - due
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        try:
+            result = call(local.session)
+        except Exception as e:
+            result = {"ok": False, "latency": 0.0, "error": f"{type(e).__name__}: {e}"}
+        with lock:
+            lags.append(lag)
+            results.setdefault(kind, []).append(result)
+
+    first_arrival = records[0]["arrival"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record, (kind, call) in zip(records, calls):
+            due = start + (record["arrival"] - first_arrival) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(execute, kind, call, due)
+    wall = time.perf_counter() - start
+    summaries = {kind: summarize(kind, items, wall) for kind, items in sorted(results.items())}
+    return summaries, wall, _percentiles(lags)
+
+
+def recorded_baseline(records: list[dict]) -> dict:
+    baseline = {}
+    for kind in sorted({r["kind"] for r in records}):
+        items = [r for r in records if r["kind"] == kind]
+        ok = [r for r in items if r["outcome"] == "completed"]
+        entry = {"requests": len(items), "ok": len(ok), "latency": _percentiles([r["duration"] for r in ok])}
+        ttfts = [r["ttft"] for r in ok if r.get("ttft") is not None]
+        if ttfts:
+            entry["ttft"] = _percentiles(ttfts)
+        baseline[kind] = entry
+    return baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="TRAFFIC_RECORD_PATH 录制的 JSONL 文件")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，1 为原始到达间隔")
+    parser.add_argument("--concurrency", type=int, default=256, help="同时在途的请求上限")
+    parser.add_argument("--limit", type=int, default=0, help="只回放前 N 条记录")
+    parser.add_argument("--calibrate", action="store_true", help="用录制的上游耗时设置桩服务延迟")
+    parser.add_argument("--out", help="报告输出路径，默认打印到标准输出")
+    add_stack_arguments(parser)
+    args = parser.parse_args()
+
+    records = load_trace(args.trace)
+    if args.limit:
+        records = records[: args.limit]
+    if not records:
+        sys.exit(f"录制文件为空: {args.trace}")
+
+    stack = None
+    base_url = args.backend_url
+    if not base_url:
+        stack = Stack(args)
+        base_url = stack.start()
+    sampler = RssSampler(stack.backend_pid) if stack else None
+    try:
+        calibration = calibrate(records) if args.calibrate else {}
+        if calibration and stack:
+            requests.post(f"{stack.fake_url}/_config", json=calibration, timeout=5)
+        if sampler:
+            sampler.start()
+        span = records[-1]["arrival"] - records[0]["arrival"]
+        print(f"⏯️ 回放 {len(records)} 条记录 ({span:.0f}s，{args.speed}x) → {base_url}", file=sys.stderr)
+        summaries, wall, lag = replay(records, base_url, args.speed, args.concurrency)
+        report = {
+            **report_header(args),
+            "trace": {"path": os.path.abspath(args.trace), "records": len(records), "span_seconds": span},
+            "calibration": calibration,
+            "wall_seconds": wall,
+            "schedule_lag": lag,
+            "results": summaries,
+            "recorded": recorded_baseline(records),
+        }
+        if sampler:
+            report["backend_rss"] = sampler.stop()
+            report["provider_calls"] = stack.fake_stats()
+    finally:
+        if stack:
+            stack.stop()
+    write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+# benchmarks/run.py
+"""
+端到端压测：启动本地供应商桩服务 (benchmarks.fake_providers) 与后端进程，
+按给定并发驱动 /chat/stream、/upload_knowledge、/api/generate_*，输出一份 JSON 报告。
+
+    python -m benchmarks.run --scenario chat --concurrency 16 --requests 200
+    python -m benchmarks.run --scenario mixed --duration 60 --error-rate 0.05 --out results/run.json
+
+报告包含吞吐、首字延迟 (TTFT)、p50/p95/p99 延迟、错误数、后端峰值 RSS 与当前 git 提交，
+便于不同版本之间逐项对比。--backend-url 可对已运行的后端压测（此时不启动任何进程）。
+
+本目录下的所有基准都要在项目根目录以模块方式运行（python -m benchmarks.<名称>），
+直接执行脚本文件（python benchmarks/bench_x.py）时找不到 app 与 benchmarks 包。
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.sse_client import iter_events  # noqa: E402
+
+# 各场景的对话内容，关键字决定桩模型是否返回工具调用（见 fake_providers.TOOL_TRIGGERS）
+CHAT_PROMPTS = {
+    "chat": ["介绍一下爆款文案的黄金三秒法则", "帮我写一段美食探店的开场白"],
+    "chat_tools": ["帮我画一只赛博朋克风格的猫", "搜索一下最近的热门话题", "根据资料总结一下运营要点"],
+}
+KNOWLEDGE_TEXT = "内容运营要点：选题、节奏、封面与发布时间。\n\n" * 400
+STORYBOARD_SCRIPT = "清晨的古镇，少女推开木窗，河面起雾；她撑伞走过石桥，在茶馆与老人对弈，日落时乘船离开。"
+PROVIDER_PREFIXES = {
+    "DEEPSEEK_BASE_URL": "/deepseek",
+    "NVIDIA_BASE_URL": "/nvidia",
+    "VOLC_BASE_URL": "/volc",
+    "ZHIPU_BASE_URL": "/zhipu",
+    "SILICONFLOW_BASE_URL": "/siliconflow",
+    "TAVILY_BASE_URL": "",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url: str, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"进程提前退出: {' '.join(proc.args)}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} 启动超时")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _tree_rss(pid: int) -> int:
+    """进程及其子进程（多 worker）的常驻内存之和，单位字节；仅支持 Linux /proc"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.last = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.last = _tree_rss(self.pid)
+            self.peak = max(self.peak, self.last)
+
+    def stop(self) -> dict:
+        self._stopped.set()
+        self.join()
+        return {"peak_bytes": self.peak, "last_bytes": self.last}
+
+
+class Stack:
+    """桩服务 + 后端进程"""
+
+    def __init__(self, args, backend_env: dict | None = None):
+        self.args = args
+        # 额外的后端环境变量，值中的 {fake_url} 替换为桩服务地址
+        self.backend_env = backend_env or {}
+        self.procs: list[subprocess.Popen] = []
+        self.tmpdir = tempfile.mkdtemp(prefix="mediacraft-bench-")
+        self.backend_pid = None
+        self.boot_times: dict[str, float] = {}
+
+    def _spawn(self, cmd: list[str], env: dict, name: str) -> subprocess.Popen:
+        log = open(os.path.join(self.tmpdir, f"{name}.log"), "w")
+        proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.procs.append(proc)
+        return proc
+
+    def start(self) -> str:
+        args = self.args
+        fake_port, backend_port = _free_port(), _free_port()
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        fake_cmd = [
+            sys.executable, "-m", "benchmarks.fake_providers", "--port", str(fake_port),
+            "--ttft", str(args.ttft), "--token-rate", str(args.token_rate),
+            "--reply-tokens", str(args.reply_tokens), "--error-rate", str(args.error_rate),
+            "--image-latency", str(args.image_latency), "--video-latency", str(args.video_latency),
+        ]
+        fake = self._spawn(fake_cmd, os.environ.copy(), "fake_providers")
+        _wait_until_up(f"{fake_url}/_stats", fake)
+
+        env = os.environ.copy()
+        for key, prefix in PROVIDER_PREFIXES.items():
+            env[key] = f"{fake_url}{prefix}"
+        for key in ("DEEPSEEK_API_KEY", "NVIDIA_API_KEY", "VOLC_API_KEY", "ZHIPU_API_KEY",
+                    "SILICONFLOW_API_KEY", "TAVILY_API_KEY"):
+            env[key] = "bench"
+        for key in ("DOUBAO_IMAGE_ENDPOINT", "DOUBAO_VIDEO_ENDPOINT"):
+            env[key] = "bench-endpoint"
+        env["CHROMA_PERSIST_DIR"] = os.path.join(self.tmpdir, "chroma_db")
+        env["STATE_BACKEND"] = args.state_backend
+        env["STATE_DIR"] = os.path.join(self.tmpdir, "state")
+        env["VIDEO_POLL_INTERVAL"] = "0.5"
+        env.update({key: value.format(fake_url=fake_url) for key, value in self.backend_env.items()})
+        env["MAX_QUEUE_LENGTH"] = str(max(100, args.concurrency * 4))
+        # 默认额度按真实供应商设定，压测时由 --provider-concurrency / --provider-rate 显式指定
+        for provider in ("DEEPSEEK", "NVIDIA", "VOLCENGINE", "ZHIPU", "SILICONFLOW"):
+            env[f"{provider}_MAX_CONCURRENCY"] = str(args.provider_concurrency)
+            env[f"{provider}_RATE_LIMIT"] = str(args.provider_rate)
+            env[f"{provider}_BURST"] = str(max(1, int(args.provider_rate)))
+
+        backend_cmd = [
+            sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+            "--port", str(backend_port), "--log-level", "warning", "--workers", str(args.workers),
+        ]
+        spawned = time.perf_counter()
+        backend = self._spawn(backend_cmd, env, "backend")
+        self.backend_pid = backend.pid
+        backend_url = f"http://127.0.0.1:{backend_port}"
+        _wait_until_up(f"{backend_url}/metrics", backend, timeout=120)
+        self.boot_times = {"port_open": time.perf_counter() - spawned}
+        # 预热完成前 /ready 返回 503；没有 /ready 的旧版本返回 404，视为端口可用即就绪
+        while requests.get(f"{backend_url}/ready", timeout=5).status_code == 503:
+            time.sleep(0.05)
+        self.boot_times["ready"] = time.perf_counter() - spawned
+        self.fake_url = fake_url
+        return backend_url
+
+    def fake_stats(self) -> dict:
+        try:
+            return requests.get(f"{self.fake_url}/_stats", timeout=5).json()
+        except requests.RequestException:
+            return {}
+
+    def stop(self):
+        for proc in reversed(self.procs):
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        print(f"📄 进程日志: {self.tmpdir}")
+
+
+# --- 单次请求，返回 {"ok", "latency", "ttft"?, "error"?} ---
+def chat_payload(prompts: list[str], model: str) -> dict:
+    return {"content": random.choice(prompts), "thread_id": str(uuid.uuid4()), "llm_config": {"chat": model}}
+
+
+def run_chat(session: requests.Session, base_url: str, payload: dict) -> dict:
+    start = time.perf_counter()
+    ttft, tokens, error, queued = None, 0, None, False
+    with session.post(f"{base_url}/chat/stream", json=payload, stream=True, timeout=600) as response:
+        for event, data in iter_events(response):
+            if event == "token":
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                tokens += len(data["text"])
+            elif event == "queued":
+                queued = True
+            elif event == "error":
+                error = data.get("message")
+            elif event == "done":
+                break
+    result = {"ok": error is None, "latency": time.perf_counter() - start, "ttft": ttft, "chars": tokens, "queued": queued}
+    if error:
+        result["error"] = error
+    return result
+
+
+def run_generate(session: requests.Session, base_url: str, kind: str, prompt: str = "压测") -> dict:
+    start = time.perf_counter()
+    response = session.post(f"{base_url}/api/generate_{kind}", json={"prompt": prompt}, timeout=600)
+    body = response.json()
+    result = {"ok": body.get("status") == "success", "latency": time.perf_counter() - start}
+    if not result["ok"]:
+        result["error"] = body.get("message") or response.status_code
+    return result
+
+
+def run_storyboard(session: requests.Session, base_url: str, payload: dict) -> dict:
+    """ttft 记为第一张画面到达的时间"""
+    start = time.perf_counter()
+    ttft, planned, media, error, failed = None, None, 0, None, 0
+    with session.post(f"{base_url}/api/storyboard", json=payload, stream=True, timeout=900) as response:
+        for event, data in iter_events(response):
+            if event == "storyboard":
+                if data["status"] == "planned":
+                    planned = time.perf_counter() - start
+                else:
+                    failed += 1
+            elif event == "media":
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                media += 1
+            elif event == "error":
+                error = data.get("message")
+            elif event == "done":
+                break
+    result = {"ok": error is None, "latency": time.perf_counter() - start, "ttft": ttft,
+              "plan_latency": planned, "media": media, "failed_shots": failed}
+    if error:
+        result["error"] = error
+    return result
+
+
+def run_upload(session: requests.Session, base_url: str, text: str = KNOWLEDGE_TEXT, timeout: float = 300) -> dict:
+    filename = f"bench-{uuid.uuid4().hex[:8]}.txt"
+    start = time.perf_counter()
+    response = session.post(
+        f"{base_url}/upload_knowledge",
+        files={"file": (filename, text.encode("utf-8"), "text/plain")},
+        timeout=60,
+    )
+    body = response.json()
+    accepted = time.perf_counter() - start
+    if body.get("status") != "success":
+        return {"ok": False, "latency": accepted, "error": body.get("message")}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = session.get(f"{base_url}/knowledge_status", params={"filename": filename}, timeout=10).json()
+        if status.get("status") == "completed":
+            return {"ok": True, "latency": time.perf_counter() - start, "accept_latency": accepted}
+        if status.get("status") == "failed":
+            return {"ok": False, "latency": time.perf_counter() - start, "error": status.get("error")}
+        time.sleep(0.2)
+    return {"ok": False, "latency": time.perf_counter() - start, "error": "ingestion timeout"}
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "min": ordered[0],
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+        "mean": sum(ordered) / len(ordered),
+    }
+
+
+def summarize(kind: str, results: list[dict], wall: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "throughput_rps": len(ok) / wall if wall else 0.0,
+        "latency": _percentiles([r["latency"] for r in ok]),
+    }
+    ttfts = [r["ttft"] for r in ok if r.get("ttft") is not None]
+    if ttfts:
+        summary["ttft"] = _percentiles(ttfts)
+    if kind.startswith("chat"):
+        summary["queued"] = sum(1 for r in results if r.get("queued"))
+    if kind == "upload":
+        summary["accept_latency"] = _percentiles([r["accept_latency"] for r in ok])
+    errors = [str(r.get("error")) for r in results if not r["ok"]]
+    summary["error_samples"] = sorted(set(errors))[:5]
+    return summary
+
+
+def build_workload(args, base_url: str):
+    """返回 [(类别, 无参调用)] 的工作项生成器"""
+    model = args.model
+    jobs = {
+        "chat": lambda s: run_chat(s, base_url, chat_payload(CHAT_PROMPTS["chat"], model)),
+        "chat_tools": lambda s: run_chat(s, base_url, chat_payload(CHAT_PROMPTS["chat_tools"], model)),
+        "image": lambda s: run_generate(s, base_url, "image"),
+        "video": lambda s: run_generate(s, base_url, "video"),
+        "upload": lambda s: run_upload(s, base_url),
+        "storyboard": lambda s: run_storyboard(s, base_url, {"script": STORYBOARD_SCRIPT, "shots": 6, "chat_model": model}),
+    }
+    if args.scenario == "mixed":
+        # 对话为主，混入少量工具调用、生图、视频与知识库上传
+        weights = {"chat": 60, "chat_tools": 25, "image": 8, "video": 2, "upload": 5}
+        kinds = random.choices(list(weights), weights=list(weights.values()), k=1_000_000)
+    else:
+        kinds = itertools.repeat(args.scenario)
+    return ((kind, jobs[kind]) for kind in kinds)
+
+
+def drive(args, base_url: str) -> tuple[dict, float]:
+    workload = build_workload(args, base_url)
+    lock = threading.Lock()
+    results: dict[str, list[dict]] = {}
+    issued = itertools.count()
+    deadline = time.monotonic() + args.duration if args.duration else None
+
+    def next_job():
+        with lock:
+            if deadline is None and next(issued) >= args.requests:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            return next(workload)
+
+    def worker():
+        session = requests.Session()
+        while (job := next_job()) is not None:
+            kind, call = job
+            try:
+                result = call(session)
+            except Exception as e:
+                result = {"ok": False, "latency": 0.0, "error": f"{type(e).__name__}: {e}"}
+            with lock:
+                results.setdefault(kind, []).append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+    return {kind: summarize(kind, items, wall) for kind, items in sorted(results.items())}, wall
+
+
+def report_header(args) -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "backend_url")},
+    }
+
+
+def write_report(report: dict, out: str | None):
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if out:
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+def add_stack_arguments(parser: argparse.ArgumentParser):
+    """桩服务与后端进程的公共参数，供 run.py 与 replay.py 共用"""
+    parser.add_argument("--workers", type=int, default=1, help="后端 uvicorn worker 数")
+    parser.add_argument("--state-backend", default="memory", choices=["memory", "sqlite"],
+                        help="共享状态后端，多 worker 时需要 sqlite")
+    parser.add_argument("--backend-url", help="压测已运行的后端，不启动桩服务与后端")
+    # 桩服务参数
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--token-rate", type=float, default=60)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--image-latency", type=float, default=2.0)
+    parser.add_argument("--video-latency", type=float, default=8.0)
+    # 后端准入额度
+    parser.add_argument("--provider-concurrency", type=int, default=64)
+    parser.add_argument("--provider-rate", type=float, default=1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="chat", choices=["chat", "chat_tools", "image", "video", "upload", "storyboard", "mixed"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="总请求数（未指定 --duration 时生效）")
+    parser.add_argument("--duration", type=float, default=0, help="按时长压测 (秒)")
+    parser.add_argument("--model", default="DeepSeek-V3 (SiliconFlow)")
+    parser.add_argument("--out", help="报告输出路径，默认打印到标准输出")
+    parser.add_argument("--seed", type=int, default=0)
+    add_stack_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    stack = None
+    base_url = args.backend_url
+    if not base_url:
+        stack = Stack(args)
+        base_url = stack.start()
+    sampler = RssSampler(stack.backend_pid) if stack else None
+    try:
+        if sampler:
+            sampler.start()
+        print(f"🚀 压测 {args.scenario}: 并发 {args.concurrency} → {base_url}", file=sys.stderr)
+        summaries, wall = drive(args, base_url)
+        report = {
+            **report_header(args),
+            "wall_seconds": wall,
+            "results": summaries,
+        }
+        if sampler:
+            report["backend_rss"] = sampler.stop()
+            report["provider_calls"] = stack.fake_stats()
+    finally:
+        if stack:
+            stack.stop()
+
+    write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()